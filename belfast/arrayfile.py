@@ -0,0 +1,155 @@
+'''Utilities for storing named :mod:`numpy` arrays in a single binary file
+that can be memory-mapped, so that the arrays can be loaded almost
+instantly and shared between processes (via the operating system page
+cache) rather than parsed and copied into each process.
+
+File layout: an 8-byte magic string, an 8-byte little-endian header
+length, a JSON header with metadata and the dtype, shape, and offset of
+each array, and then the raw array data, with each array aligned on an
+8-byte boundary.
+'''
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+import numpy
+
+
+MAGIC = 'BFARRAY1'
+_ALIGN = 8
+
+
+def _padding(size):
+    # number of bytes needed to pad to the next aligned offset
+    return (_ALIGN - size % _ALIGN) % _ALIGN
+
+
+def write_arrays(filename, arrays, meta=None):
+    '''Write a dictionary of named :mod:`numpy` arrays and optional
+    JSON-serializable metadata to a file.  The file is written to a
+    temporary file and then renamed, so readers never see a partially
+    written file.
+
+    :param filename: path to the file to be written
+    :param arrays: dictionary of name and :class:`numpy.ndarray`
+    :param meta: optional dictionary of metadata
+    '''
+    info = {}
+    offset = 0
+    names = sorted(arrays.keys())
+    arrays = dict((name, numpy.ascontiguousarray(arrays[name]))
+                  for name in names)
+    for name in names:
+        arr = arrays[name]
+        info[name] = {'dtype': arr.dtype.str, 'shape': list(arr.shape),
+                      'offset': offset}
+        offset += arr.nbytes + _padding(arr.nbytes)
+
+    header = json.dumps({'meta': meta or {}, 'arrays': info})
+    header += ' ' * _padding(len(MAGIC) + 8 + len(header))
+
+    fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)),
+                                   prefix='.%s' % os.path.basename(filename))
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(MAGIC)
+            out.write(struct.pack('<Q', len(header)))
+            out.write(header)
+            for name in names:
+                data = arrays[name].tostring()
+                out.write(data)
+                out.write('\0' * _padding(len(data)))
+        # make readable, since mkstemp creates files readable only by owner
+        os.chmod(tmpname, 0644)
+        os.rename(tmpname, filename)
+    except:
+        if os.path.exists(tmpname):
+            os.remove(tmpname)
+        raise
+
+
+class ArrayFile(object):
+    '''Read-only, memory-mapped access to a file written by
+    :meth:`write_arrays`.  Arrays are returned as read-only
+    :class:`numpy.ndarray` views on the mapped file, without copying.
+
+    :param filename: path to the file
+    '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as datafile:
+            #: modification time of the file when it was opened
+            self.mtime = os.fstat(datafile.fileno()).st_mtime
+            self.mmap = mmap.mmap(datafile.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if self.mmap[:len(MAGIC)] != MAGIC:
+            raise ValueError('%s is not an array file' % filename)
+        start = len(MAGIC) + 8
+        header_len = struct.unpack('<Q', self.mmap[len(MAGIC):start])[0]
+        header = json.loads(self.mmap[start:start + header_len])
+        self._data_start = start + header_len
+        self._info = header['arrays']
+        #: metadata stored with the arrays
+        self.meta = header['meta']
+
+    def keys(self):
+        'names of the arrays in the file'
+        return self._info.keys()
+
+    def __contains__(self, name):
+        return name in self._info
+
+    def __getitem__(self, name):
+        info = self._info[name]
+        dtype = numpy.dtype(str(info['dtype']))
+        count = 1
+        for dim in info['shape']:
+            count *= dim
+        if count == 0:
+            return numpy.zeros(info['shape'], dtype=dtype)
+        arr = numpy.frombuffer(self.mmap, dtype=dtype, count=count,
+                               offset=self._data_start + info['offset'])
+        return arr.reshape(info['shape'])
+
+    def close(self):
+        self.mmap.close()
+
+
+class StringTable(object):
+    '''Table of interned strings, stored as two arrays: utf-8 encoded
+    bytes for all strings, and the offset of each string.  Use
+    :meth:`build` to generate the arrays, and initialize with the arrays
+    (e.g., from an :class:`ArrayFile`) to look up strings by index.
+
+    :param data: :class:`numpy.ndarray` of ``uint8`` with string content
+    :param offsets: :class:`numpy.ndarray` of string start offsets, with
+        one extra entry for the end of the last string
+    '''
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @staticmethod
+    def build(strings):
+        '''Generate string table arrays for a list of unique strings.
+
+        :returns: tuple of data and offsets arrays
+        '''
+        encoded = [unicode(s).encode('utf-8') for s in strings]
+        offsets = numpy.zeros(len(encoded) + 1, dtype=numpy.int64)
+        if encoded:
+            offsets[1:] = numpy.cumsum([len(s) for s in encoded])
+        data = numpy.fromstring(''.join(encoded), dtype=numpy.uint8)
+        return data, offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.data[self.offsets[i]:self.offsets[i + 1]].tostring() \
+                   .decode('utf-8')
@@ -0,0 +1,386 @@
+'''Benchmark harness for the most frequently used views and the data prep
+stages, to measure whether a change makes things faster or slower.
+
+Benchmarks run against a synthetic dataset rather than the production
+data, so results are reproducible.  :func:`synthetic_rdf` generates RDF
+in the same form as the harvested finding aid data (archival collections
+that mention manuscripts with authors, places, and connections between
+people), scaled relative to the approximate size of the real dataset
+(see :data:`BASE_SIZE`).  :class:`BenchmarkDataset` adds the Queen's
+University Belfast collection from its local fixture, runs the data prep
+cleanup stages on the combined data (timing each one), generates the GEXF
+network data, precomputed indexes, and RDF snapshot, and then times each
+view in :data:`VIEW_BENCHMARKS` against it.
+
+Results are returned as a dictionary, which can be saved as JSON and
+compared with a stored baseline with :func:`compare_results` to find
+regressions.  See the ``benchmark`` manage command.
+
+Harvest and annotation stages depend on remote data, so they are not
+included.  Group sheets with digital editions look up TEI identifiers
+in eXist when listed, so the list views are most representative with
+the configured eXist database available.
+'''
+
+from contextlib import contextmanager
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.core.urlresolvers import reverse, resolve
+from django.db import connections
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from networkx.readwrite import gexf
+import rdflib
+
+from belfast import rdfns
+from belfast.rdf.instrument import RunReport
+
+
+#: approximate size of the real dataset, used as scale 1
+BASE_SIZE = {
+    'people': 100,
+    'collections': 17,
+    'groupsheets': 400,
+    'places': 50,
+}
+
+# name parts for synthetic people; combined to generate unique names
+GIVEN_NAMES = ['Seamus', 'Michael', 'Derek', 'Edna', 'Philip', 'Marie',
+               'James', 'Joan', 'Stewart', 'Arthur', 'Hugh', 'Paul',
+               'Ciaran', 'Frank', 'Bernard', 'Norman', 'Harry', 'Anne']
+FAMILY_NAMES = ['Heaney', 'Longley', 'Mahon', 'Hobsbaum', 'Simmons',
+                'Carson', 'Muldoon', 'Ormsby', 'Croskery', 'Parker',
+                'Bredin', 'Foster', 'Watson', 'Deane', 'Fallon', 'Hughes',
+                'Grennan', 'Monteith', 'McBreen', 'Kinsella']
+TITLE_WORDS = ['Digging', 'Harbour', 'Lough', 'Bog', 'Winter', 'Letter',
+               'Ferry', 'Elegy', 'Blackbird', 'Field', 'Mill', 'Bridge',
+               'Linen', 'Wake', 'Causeway', 'Orchard']
+
+#: years within each of the two Belfast Group periods, for synthetic
+#: group sheet dates
+PERIOD_YEARS = [(1964, 1965), (1967, 1971)]
+
+
+def _person_name(i):
+    # unique given and family name for person i
+    given = GIVEN_NAMES[i % len(GIVEN_NAMES)]
+    family = FAMILY_NAMES[(i // len(GIVEN_NAMES)) % len(FAMILY_NAMES)]
+    repeat = i // (len(GIVEN_NAMES) * len(FAMILY_NAMES))
+    if repeat:
+        family = '%s%s' % (family, 'x' * repeat)
+    return given, family
+
+
+def synthetic_rdf(graph, scale=1, seed=0, digital_editions=0.1):
+    '''Add synthetic RDF data to a context-aware graph, in the same form
+    as harvested (not yet cleaned) data.
+
+    :param graph: :class:`rdflib.ConjunctiveGraph`
+    :param scale: size multiplier relative to :data:`BASE_SIZE`
+    :param seed: random seed, so the same data is generated every time
+    :param digital_editions: fraction of group sheets with a digital edition
+    :returns: dictionary of the number of each kind of entity generated
+    '''
+    rand = random.Random(seed)
+    sizes = dict((k, int(v * scale)) for k, v in BASE_SIZE.iteritems())
+    current_site = Site.objects.get(id=settings.SITE_ID)
+
+    bg = rdflib.URIRef(rdfns.BELFAST_GROUP_URI)
+    ctx = graph.get_context(rdflib.URIRef('%s/' % rdfns.BELFAST_GROUP_URI))
+    ctx.add((bg, rdflib.RDF.type, rdfns.SCHEMA_ORG.Organization))
+    ctx.add((bg, rdfns.SCHEMA_ORG.name, rdflib.Literal('Belfast Group')))
+
+    places = []
+    ctx = graph.get_context(rdflib.URIRef('http://sws.geonames.org/'))
+    for i in range(sizes['places']):
+        place = rdflib.URIRef('http://sws.geonames.org/9%06d/' % i)
+        places.append(place)
+        ctx.add((place, rdflib.RDF.type, rdfns.SCHEMA_ORG.Place))
+        ctx.add((place, rdfns.SCHEMA_ORG.name, rdflib.Literal('Place %d' % i)))
+        ctx.add((place, rdfns.GEO.lat,
+                 rdflib.Literal(rand.uniform(51.0, 55.5), datatype=rdflib.XSD.double)))
+        ctx.add((place, rdfns.GEO.long,
+                 rdflib.Literal(rand.uniform(-10.5, -5.5), datatype=rdflib.XSD.double)))
+
+    # people, described in their own contexts (as harvested from VIAF)
+    people = []
+    for i in range(sizes['people']):
+        person = rdflib.URIRef('http://viaf.org/viaf/9%07d' % i)
+        people.append(person)
+        given, family = _person_name(i)
+        ctx = graph.get_context(person)
+        ctx.add((person, rdflib.RDF.type, rdfns.SCHEMA_ORG.Person))
+        ctx.add((person, rdfns.SCHEMA_ORG.name, rdflib.Literal('%s %s' % (given, family))))
+        ctx.add((person, rdfns.SCHEMA_ORG.givenName, rdflib.Literal(given)))
+        ctx.add((person, rdfns.SCHEMA_ORG.familyName, rdflib.Literal(family)))
+        if places:
+            ctx.add((person, rdfns.SCHEMA_ORG.homeLocation, rand.choice(places)))
+    for person in people:
+        ctx = graph.get_context(person)
+        for other in rand.sample(people, min(3, len(people))):
+            if other != person:
+                ctx.add((person, rdfns.SCHEMA_ORG.knows, other))
+
+    # archival collections, each described in a finding aid document about
+    # the Belfast Group that mentions the group sheets in the collection
+    collections = []
+    for i in range(sizes['collections']):
+        doc = rdflib.URIRef('http://findingaids.example.com/documents/coll%d/' % i)
+        coll = rdflib.URIRef('%s#collection' % doc)
+        collections.append((doc, coll))
+        ctx = graph.get_context(doc)
+        ctx.add((doc, rdfns.SCHEMA_ORG.about, bg))
+        ctx.add((doc, rdfns.SCHEMA_ORG.about, coll))
+        ctx.add((coll, rdflib.RDF.type, rdfns.ARCH.Collection))
+        ctx.add((coll, rdfns.SCHEMA_ORG.name, rdflib.Literal('Collection %d' % i)))
+        ctx.add((coll, rdfns.SCHEMA_ORG.creator, rand.choice(people)))
+
+    for i in range(sizes['groupsheets']):
+        doc, coll = collections[i % len(collections)]
+        ctx = graph.get_context(doc)
+        ms = rdflib.BNode()
+        ctx.add((coll, rdfns.SCHEMA_ORG.mentions, ms))
+        ctx.add((ms, rdflib.RDF.type, rdfns.BIBO.Manuscript))
+        ctx.add((ms, rdfns.DC.creator, rand.choice(people)))
+        ctx.add((ms, rdfns.DC.title, rdflib.Literal(' '.join(
+            rand.sample(TITLE_WORDS, 2) + [str(i)]))))
+        start_year, end_year = rand.choice(PERIOD_YEARS)
+        ctx.add((ms, rdfns.DC.date, rdflib.Literal('%04d-%02d-%02d' % (
+            rand.randint(start_year, end_year), rand.randint(1, 12),
+            rand.randint(1, 28)))))
+        if rand.random() < digital_editions:
+            ctx.add((ms, rdfns.SCHEMA_ORG.URL, rdflib.URIRef(
+                'http://%s/groupsheets/synthetic%d/' % (current_site.domain, i))))
+
+    return sizes
+
+
+#: views to benchmark: name, url name, url args, and query parameters;
+#: ``%(author)s``, ``%(source)s``, and ``%(node)s`` are filled in from
+#: the generated data
+VIEW_BENCHMARKS = [
+    ('list_groupsheets', 'groupsheets:list', [], {}),
+    ('list_groupsheets edition', 'groupsheets:list', [], {'edition': 'digital'}),
+    ('list_groupsheets author', 'groupsheets:list', [], {'author': '%(author)s'}),
+    ('list_groupsheets source', 'groupsheets:list', [], {'source': '%(source)s'}),
+    ('list_groupsheets dates', 'groupsheets:list', [], {'dates': '1963-1966'}),
+    ('profile', 'people:profile', ['%(author)s'], {}),
+    ('group_people_js degree 1', 'network:bg-js', [], {'degree': '1'}),
+    ('group_people_js degree 2', 'network:bg-js', [], {'degree': '2'}),
+    ('map_js', 'network:map-js', [], {}),
+    ('node_info', 'network:node-info', [], {'id': '%(node)s'}),
+]
+
+
+def time_call(func, repeat=5):
+    '''Time a function call; the first call is timed separately, since it
+    may include building shared indexes or loading data.
+
+    :returns: dictionary with time of the **first** call, and **min**,
+        **median**, and **max** of the following calls, in seconds
+    '''
+    start = time.time()
+    func()
+    first = time.time() - start
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        func()
+        times.append(time.time() - start)
+    times.sort()
+    return {'first': first, 'min': times[0], 'median': times[len(times) // 2],
+            'max': times[-1], 'runs': repeat}
+
+
+class BenchmarkDataset(object):
+    '''Synthetic RDF store and network data in a temporary directory, for
+    running benchmarks.
+
+    :param scale: size multiplier relative to :data:`BASE_SIZE`
+    :param seed: random seed for :func:`synthetic_rdf`
+    :param directory: directory for the data; a temporary directory is
+        created (and removed by :meth:`remove`) if not specified
+    '''
+
+    def __init__(self, scale=1, seed=0, directory=None):
+        self.scale = scale
+        self.seed = seed
+        self.temporary = directory is None
+        self.directory = directory or tempfile.mkdtemp(prefix='belfast-benchmark-')
+        self.rdf_path = os.path.join(self.directory, 'rdf')
+        self.rdf_snapshot = os.path.join(self.directory, 'rdf.snapshot')
+        self.gexf_dir = os.path.join(self.directory, 'gexf')
+        self.gexf_data = {
+            'full': os.path.join(self.gexf_dir, 'belfastgroup.gexf'),
+            'bg1': os.path.join(self.gexf_dir, 'belfastgroup-groupsheets.gexf'),
+        }
+        self.sizes = None
+
+    @contextmanager
+    def active(self):
+        '''Context manager to use this dataset in place of the configured
+        RDF database and network data.'''
+        for path in [self.rdf_path, self.gexf_dir]:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+        graph = rdflib.ConjunctiveGraph('Sleepycat')
+        graph.open(self.rdf_path, create=True)
+        connection = connections['rdf']
+        original = connection.db_connection
+        connection.db_connection = graph
+        try:
+            # network json is not cached, so views generate it every time
+            with override_settings(RDF_DATABASE=self.rdf_path,
+                                   GEXF_DATA_DIR=self.gexf_dir,
+                                   GEXF_DATA=self.gexf_data,
+                                   NETWORK_CENTRALITY_DIR=None,
+                                   NETWORK_JSON_CACHE=None):
+                yield graph
+        finally:
+            connection.db_connection = original
+            graph.close()
+
+    def build(self, verbosity=0):
+        '''Generate the synthetic data and run the data prep stages on it.
+
+        :returns: list of stage information from
+            :class:`~belfast.rdf.instrument.RunReport`
+        '''
+        # import here to avoid loading the whole data prep process
+        # for the benchmark views
+        from belfast.rdf.clean import IdentifyGroupSheets, \
+            SmushGroupSheets, ProfileUris, InferConnections
+        from belfast.rdf import nx
+        from belfast.rdf.qub import QUB
+        from belfast.rdf.snapshot import write_store_snapshot
+        from belfast.network.centrality import precompute_centrality
+        from belfast.network.connections import write_connections, \
+            connections_path
+        from belfast.network.snapshot import write_snapshot, snapshot_path
+        from belfast.network.views import network_variants
+        from belfast.util import set_site_lastmodified
+
+        with self.active() as graph:
+            report = RunReport(graph=graph)
+            with report.stage('generate'):
+                self.sizes = synthetic_rdf(graph, scale=self.scale, seed=self.seed)
+            with report.stage('queens'):
+                QUB(os.path.join(settings.BASE_DIR, 'rdf', 'fixtures', 'QUB_ms1204.html'),
+                    verbosity=verbosity, graph=graph, url=QUB.QUB_BELFAST_COLLECTION)
+            with report.stage('identify'):
+                IdentifyGroupSheets(graph, verbosity=verbosity)
+            with report.stage('smush'):
+                SmushGroupSheets(graph, verbosity=verbosity)
+                ProfileUris(graph, verbosity=verbosity)
+            with report.stage('connect'):
+                InferConnections(graph)
+            with report.stage('gexf'):
+                nx.Rdf2Gexf(graph, self.gexf_data['full'])
+                nx.BelfastGroupGexf(graph, self.gexf_data['bg1'])
+                for name, gexf_file in self.gexf_data.iteritems():
+                    network = gexf.read_gexf(gexf_file)
+                    write_snapshot(network, snapshot_path(gexf_file))
+                    if name == 'full':
+                        write_connections(network, graph, connections_path(gexf_file))
+            with report.stage('centrality'):
+                precompute_centrality(network_variants())
+            set_site_lastmodified(graph)
+            with report.stage('snapshot') as stage:
+                stage['triples'] = write_store_snapshot(graph, self.rdf_snapshot)
+            graph.commit()
+        return report.stages
+
+    def parameters(self, graph):
+        '''Values from the generated data to use in benchmark urls: an
+        author profile slug, a source collection, and a network node.'''
+        groupsheets = list(graph.subjects(rdflib.RDF.type, rdfns.BG.GroupSheet))
+        groupsheets.sort()
+        author = graph.value(groupsheets[0], rdfns.DC.creator)
+        source = graph.value(predicate=rdfns.SCHEMA_ORG.mentions,
+                             object=groupsheets[0])
+        return {
+            'author': unicode(author).rstrip('/').rsplit('/', 1)[-1],
+            'source': unicode(source),
+            'node': unicode(author),
+        }
+
+    def run_views(self, repeat=5):
+        '''Time each view in :data:`VIEW_BENCHMARKS` against this dataset.
+
+        :returns: dictionary of benchmark name and timing information
+            from :func:`time_call`
+        '''
+        factory = RequestFactory()
+        results = {}
+        with self.active() as graph:
+            params = self.parameters(graph)
+            for name, url_name, args, query in VIEW_BENCHMARKS:
+                url = reverse(url_name, args=[a % params for a in args])
+                query = dict((k, v % params) for k, v in query.iteritems())
+                match = resolve(url)
+
+                def call():
+                    request = factory.get(url, query)
+                    response = match.func(request, *match.args, **match.kwargs)
+                    if response.status_code != 200:
+                        raise Exception('%s returned %d' % (url, response.status_code))
+                results[name] = time_call(call, repeat)
+        return results
+
+    def remove(self):
+        'Remove the dataset directory, if it was created as a temporary directory'
+        if self.temporary:
+            shutil.rmtree(self.directory)
+
+
+def run_benchmarks(scale=1, repeat=5, seed=0, directory=None, verbosity=0):
+    '''Build a synthetic dataset at the specified scale, and time the data
+    prep stages and views.
+
+    :returns: dictionary of results, with the **scale**, number of each
+        kind of entity generated in **dataset**, **stages** (elapsed time
+        and triple counts for each data prep stage), and **views** (see
+        :meth:`BenchmarkDataset.run_views`)
+    '''
+    dataset = BenchmarkDataset(scale=scale, seed=seed, directory=directory)
+    try:
+        stages = dataset.build(verbosity=verbosity)
+        views = dataset.run_views(repeat=repeat)
+    finally:
+        dataset.remove()
+    return {
+        'scale': scale,
+        'dataset': dataset.sizes,
+        'stages': dict((s['name'], s) for s in stages),
+        'views': views,
+    }
+
+
+def compare_results(baseline, current, threshold=0.2):
+    '''Compare benchmark results with a baseline for the same scale.
+
+    :param threshold: fraction slower than the baseline to count as a
+        regression
+    :returns: list of tuples of benchmark name, baseline time, current
+        time, and a boolean indicating if it is a regression; stage times
+        are compared by elapsed time and views by median time
+    '''
+    comparison = []
+    timings = [
+        ('stage', 'elapsed', baseline.get('stages', {}), current.get('stages', {})),
+        ('view', 'median', baseline.get('views', {}), current.get('views', {})),
+    ]
+    for kind, field, base, cur in timings:
+        for name in sorted(cur):
+            if name not in base:
+                continue
+            before, after = base[name][field], cur[name][field]
+            comparison.append(('%s %s' % (kind, name), before, after,
+                               after > before * (1 + threshold)))
+    return comparison
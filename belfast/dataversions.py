@@ -0,0 +1,266 @@
+'''Versioned data directories, so the data prep process can build a new
+version of the RDF database and network files without modifying the
+data the site is currently using.
+
+When **DATA_VERSIONS_DIR** is configured, each run of ``prep_dataset``
+builds a new version in its own subdirectory of that directory, starting
+from a copy of the current version (or from nothing, with ``--clear``).
+The new version is validated, and then made current by atomically
+replacing a ``current`` symbolic link, so there is never a time when
+the site sees partially written data; if the data prep fails or the
+new version is not valid, it is removed.  Configure the data paths
+(**RDF_DATABASE**, **GEXF_DATA_DIR** and **GEXF_DATA**, and optionally
+**RDF_SNAPSHOT** and **NETWORK_CENTRALITY_DIR**) inside the ``current``
+directory, e.g.::
+
+    DATA_VERSIONS_DIR = '/path/to/belfast-data'
+    RDF_DATABASE = os.path.join(DATA_VERSIONS_DIR, 'current', 'belfastrdf.bdb')
+    GEXF_DATA_DIR = os.path.join(DATA_VERSIONS_DIR, 'current', 'gexf')
+
+Web server processes pick up a new version on their next request: the
+RDF database backends reopen when the ``current`` link points somewhere
+new, and network data, connection indexes, and centrality tables are
+reloaded when their files change.  Files copied unchanged from the
+previous version keep their modification times, so they are not
+reloaded.  The most recent versions are kept (**DATA_VERSIONS_KEEP**,
+default 2) so that processes still using the previous version can
+finish, and older versions are removed.
+'''
+
+import logging
+import os
+import shutil
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+import rdflib
+from rdflib.store import VALID_STORE
+
+from belfast.arrayfile import ArrayFile
+
+
+logger = logging.getLogger(__name__)
+
+
+#: name of the link to the current version
+CURRENT = 'current'
+
+#: Sleepycat environment files, which belong to the process that created
+#: them and are not copied to a new version
+ENV_FILES = '__db.*'
+
+#: marker file recording that a version has been activated
+ACTIVATED = '.activated'
+
+
+def data_versions():
+    ''':class:`DataVersions` for the configured **DATA_VERSIONS_DIR**, or
+    None if versioned data is not configured.'''
+    directory = getattr(settings, 'DATA_VERSIONS_DIR', None)
+    if directory:
+        return DataVersions(directory)
+
+
+class DataVersions(object):
+    '''Version directories and the ``current`` link within a data
+    directory.
+
+    :param directory: base data directory
+    :param keep: number of versions to keep when pruning, including the
+        current version; defaults to the **DATA_VERSIONS_KEEP** setting,
+        or 2
+    '''
+
+    #: settings for data paths that are versioned
+    path_settings = ['RDF_DATABASE', 'GEXF_DATA_DIR', 'RDF_SNAPSHOT',
+                     'NETWORK_CENTRALITY_DIR', 'RDF_PREP_STATE']
+
+    def __init__(self, directory, keep=None):
+        self.directory = os.path.abspath(directory)
+        self.keep = keep or getattr(settings, 'DATA_VERSIONS_KEEP', 2)
+        #: path to the current version link
+        self.current = os.path.join(self.directory, CURRENT)
+
+    def current_version(self):
+        'Name of the current version, or None if there is no current version'
+        if os.path.exists(self.current):
+            return os.path.basename(os.path.realpath(self.current))
+
+    def versions(self):
+        'Names of all version directories, oldest first'
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(name for name in os.listdir(self.directory)
+                      if name != CURRENT and not name.startswith('.') and
+                      os.path.isdir(os.path.join(self.directory, name)))
+
+    def path(self, version):
+        'Path to the directory for a named version'
+        return os.path.join(self.directory, version)
+
+    def create(self, clear=False):
+        '''Create a directory for a new version, as a copy of the current
+        version (without Sleepycat environment files), or empty if
+        there is no current version or ``clear`` is True.
+
+        :returns: name of the new version
+        '''
+        version = base = time.strftime('%Y%m%d-%H%M%S')
+        # in case more than one version is created in the same second
+        suffix = 1
+        while os.path.exists(self.path(version)):
+            version = '%s-%d' % (base, suffix)
+            suffix += 1
+
+        current = self.current_version()
+        if current is None or clear:
+            os.makedirs(self.path(version))
+        else:
+            shutil.copytree(self.path(current), self.path(version),
+                            ignore=shutil.ignore_patterns(ENV_FILES, ACTIVATED))
+        logger.debug('Created data version %s from %s', version,
+                     'nothing' if current is None or clear else current)
+        return version
+
+    def remove(self, version):
+        '''Remove a version that has never been activated, e.g. a failed
+        build.  Raises :class:`ValueError` for the current version or
+        any other activated version.'''
+        if version == self.current_version() or self.is_activated(version):
+            raise ValueError('Data version %s has been activated' % version)
+        shutil.rmtree(self.path(version))
+        logger.debug('Removed data version %s', version)
+
+    def is_activated(self, version):
+        'Check if a version has ever been made current'
+        return os.path.exists(os.path.join(self.path(version), ACTIVATED))
+
+    def versioned_path(self, path, version):
+        '''Path within a version directory corresponding to a path in the
+        current version; paths outside the current version are returned
+        unchanged.'''
+        relpath = os.path.relpath(os.path.abspath(path), self.current)
+        if relpath == os.pardir or relpath.startswith(os.pardir + os.sep):
+            return path
+        return os.path.normpath(os.path.join(self.path(version), relpath))
+
+    def is_versioned(self, path):
+        'Check if a path is within the current version directory'
+        return self.versioned_path(path, 'version') != path
+
+    def check_settings(self):
+        '''Raise :class:`~django.core.exceptions.ImproperlyConfigured` if
+        the RDF database or network data are not configured within the
+        ``current`` directory.'''
+        for path in [settings.RDF_DATABASE] + settings.GEXF_DATA.values():
+            if not self.is_versioned(path):
+                raise ImproperlyConfigured('%s is not in the current data version %s' \
+                                           % (path, self.current))
+
+    def version_settings(self, version):
+        '''Settings for the data paths within a version directory, for
+        use with :class:`~django.test.utils.override_settings` while the
+        version is being built.  Raises
+        :class:`~django.core.exceptions.ImproperlyConfigured` if the
+        data paths are not configured correctly (see
+        :meth:`check_settings`).'''
+        self.check_settings()
+        values = {
+            'GEXF_DATA': dict((name, self.versioned_path(path, version))
+                              for name, path in settings.GEXF_DATA.iteritems())
+        }
+        for name in self.path_settings:
+            value = getattr(settings, name, None)
+            if value:
+                values[name] = self.versioned_path(value, version)
+        return values
+
+    def activate(self, version):
+        '''Make a version current by replacing the ``current`` link.
+        The new link is created under a temporary name and renamed over
+        the old one, which is atomic.'''
+        if not os.path.isdir(self.path(version)):
+            raise ValueError('Data version %s does not exist' % version)
+        tmplink = os.path.join(self.directory, '.%s-%d' % (CURRENT, os.getpid()))
+        with open(os.path.join(self.path(version), ACTIVATED), 'w') as marker:
+            marker.write('%s\n' % time.strftime('%Y-%m-%d %H:%M:%S'))
+        if os.path.lexists(tmplink):
+            os.remove(tmplink)
+        # relative link, so the data directory can be moved
+        os.symlink(version, tmplink)
+        os.rename(tmplink, self.current)
+        logger.info('Activated data version %s', version)
+
+    def prune(self):
+        '''Remove previously activated versions older than the current
+        version, keeping the most recent ones.  Versions that were never
+        activated (e.g., a build in progress) are not counted or removed.
+
+        :returns: list of names of the removed versions
+        '''
+        current = self.current_version()
+        if current is None:
+            return []
+        older = [v for v in self.versions()
+                 if v < current and self.is_activated(v)]
+        remove = older[:max(len(older) - (self.keep - 1), 0)]
+        for version in remove:
+            shutil.rmtree(self.path(version))
+            logger.debug('Removed data version %s', version)
+        return remove
+
+
+def validate_version(rdf_database, gexf_files, rdf_snapshot=None):
+    '''Check that the data for a new version is complete before it is
+    made current: the RDF database can be opened and has data, the GEXF
+    files were written, and any network and RDF snapshots can be read.
+
+    :param rdf_database: path to the Sleepycat RDF database
+    :param gexf_files: list of paths to GEXF files
+    :param rdf_snapshot: path to the RDF snapshot, if one is written
+    :returns: list of problems found; empty if the data is valid
+    '''
+    # import here to avoid a circular import
+    from belfast.network.snapshot import snapshot_path
+    from belfast.rdf.snapshot import SnapshotStore
+
+    problems = []
+    graph = rdflib.ConjunctiveGraph('Sleepycat')
+    if graph.open(rdf_database, create=False) != VALID_STORE:
+        problems.append('RDF database %s could not be opened' % rdf_database)
+        triples = None
+    else:
+        try:
+            triples = len(graph)
+            if not triples:
+                problems.append('RDF database %s is empty' % rdf_database)
+        finally:
+            graph.close()
+
+    for gexf_file in gexf_files:
+        if not os.path.exists(gexf_file) or not os.path.getsize(gexf_file):
+            problems.append('GEXF file %s is missing or empty' % gexf_file)
+        network_snapshot = snapshot_path(gexf_file)
+        if os.path.exists(network_snapshot):
+            try:
+                ArrayFile(network_snapshot).close()
+            except Exception as err:
+                problems.append('Network snapshot %s could not be read: %s' \
+                                % (network_snapshot, err))
+
+    if rdf_snapshot:
+        store = SnapshotStore()
+        try:
+            if store.open(rdf_snapshot) != VALID_STORE:
+                problems.append('RDF snapshot %s is missing' % rdf_snapshot)
+            elif triples is not None and len(store) != triples:
+                problems.append('RDF snapshot %s has %d triples; database has %d' \
+                                % (rdf_snapshot, len(store), triples))
+        except Exception as err:
+            problems.append('RDF snapshot %s could not be read: %s' \
+                            % (rdf_snapshot, err))
+        finally:
+            store.close()
+
+    return problems
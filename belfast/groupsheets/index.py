@@ -0,0 +1,258 @@
+'''Precomputed, in-memory index of Belfast Group sheets in the RDF data,
+for listing, filtering, and faceting Group sheets without querying the
+RDF store on every request.
+
+The index is built once from the RDF data and rebuilt only when the
+data changes (based on :meth:`belfast.util.rdf_data_lastmodified`).
+Each Group sheet is stored as a flat, immutable :class:`GroupSheetRecord`
+with all the information needed to filter, sort, and display it.
+'''
+
+from collections import namedtuple, defaultdict
+import logging
+import threading
+import time
+
+import rdflib
+
+from belfast import rdfns
+from belfast.rdf.rdfmap import prefetch
+from belfast.util import rdf_data, rdf_data_lastmodified
+
+
+logger = logging.getLogger(__name__)
+
+
+#: author information for display and linking: uri, profile slug,
+#: last and first name
+AuthorLabel = namedtuple('AuthorLabel',
+                         ['identifier', 'slug', 'lastname', 'firstname'])
+
+#: source archival collection information: uri, name, and access url
+SourceLabel = namedtuple('SourceLabel', ['identifier', 'name', 'access_url'])
+
+
+class GroupSheetRecord(namedtuple('GroupSheetRecord', [
+        'identifier', 'sort_name', 'sort_title', 'authors', 'title',
+        'title_list', 'date', 'coverage', 'num_pages', 'genre',
+        'description', 'url', 'sources'])):
+    '''Flat, immutable record for a single Group sheet.  Provides the same
+    attributes used for displaying :class:`~belfast.groupsheets.rdfmodels.RdfGroupSheet`
+    in Group sheet lists.'''
+    __slots__ = ()
+
+    @property
+    def author_list(self):
+        'list of :class:`AuthorLabel`, sorted by last name'
+        return self.authors
+
+    @property
+    def has_url(self):
+        'boolean indicating if a digital edition is available'
+        return self.url is not None
+
+    @property
+    def tei_id(self):
+        '''TEI identifier for this group sheet, retrieved via ARK URL'''
+        # import here to avoid a circular import
+        from belfast.groupsheets.rdfmodels import id_from_ark
+        if self.url:
+            return id_from_ark(str(self.url))
+
+
+def _sort_title(title, title_list):
+    # sort on first title (if list) or only title; untitled sorts last
+    if title_list:
+        return unicode(title_list[0])
+    if title is not None:
+        return unicode(title)
+    return u'ZZ'
+
+
+def groupsheet_record(groupsheet):
+    '''Generate a :class:`GroupSheetRecord` from an
+    :class:`~belfast.groupsheets.rdfmodels.RdfGroupSheet`.'''
+    authors = tuple(AuthorLabel(unicode(a.identifier), a.slug, a.lastname,
+                                a.firstname)
+                    for a in groupsheet.author_list)
+    sources = tuple(SourceLabel(unicode(s.identifier), s.name, s.access_url)
+                    for s in groupsheet.sources)
+
+    # some Group sheets have a list of titles, others a single title
+    title_list = tuple(groupsheet.title_list)
+    title = groupsheet.title if not title_list else None
+
+    # sort anonymous Group sheet at the beginning of the list
+    names = [a.lastname for a in authors if a.lastname]
+    sort_name = min(names) if names else u'AA'
+
+    url = groupsheet.url
+    return GroupSheetRecord(
+        identifier=unicode(groupsheet.identifier),
+        sort_name=unicode(sort_name),
+        sort_title=_sort_title(title, title_list),
+        authors=authors, title=title, title_list=title_list,
+        date=groupsheet.date, coverage=groupsheet.coverage,
+        num_pages=groupsheet.num_pages, genre=groupsheet.genre,
+        description=groupsheet.description,
+        url=unicode(url.identifier) if url is not None else None,
+        sources=sources)
+
+
+def _positions(bits):
+    # generate the positions of all set bits in an integer bitset,
+    # lowest first
+    while bits:
+        lowest = bits & -bits
+        yield lowest.bit_length() - 1
+        bits ^= lowest
+
+
+def _count(bits):
+    # number of set bits in an integer bitset
+    return bin(bits).count('1')
+
+
+class GroupSheetIndex(object):
+    '''Immutable index of :class:`GroupSheetRecord` for all Group sheets,
+    sorted by author last name and title.
+
+    For filtering and faceting, the index keeps a posting list for each
+    facet value (digital edition, author, source, and coverage) as an
+    integer bitset of record positions, so any combination of filters
+    and all facet counts can be calculated with bitwise intersections
+    rather than by examining every record.
+
+    :param records: list of :class:`GroupSheetRecord`
+    '''
+
+    def __init__(self, records):
+        self.records = tuple(sorted(records,
+                                    key=lambda r: (r.sort_name, r.sort_title)))
+        #: record positions in title order, for sorting author results
+        self.title_order = tuple(sorted(range(len(self.records)),
+                                        key=lambda i: self.records[i].sort_title))
+
+        #: bitset of all records
+        self.all = (1 << len(self.records)) - 1
+        #: bitset of records with a digital edition
+        self.digital = 0
+        #: bitsets by author uri, source uri, and coverage
+        self.by_author = defaultdict(int)
+        self.by_source = defaultdict(int)
+        self.by_coverage = defaultdict(int)
+        #: author and source labels by uri
+        self.authors = {}
+        self.sources = {}
+
+        for i, record in enumerate(self.records):
+            bit = 1 << i
+            if record.has_url:
+                self.digital |= bit
+            for author in record.authors:
+                self.by_author[author.identifier] |= bit
+                self.authors[author.identifier] = author
+            for source in record.sources:
+                self.by_source[source.identifier] |= bit
+                self.sources[source.identifier] = source
+            self.by_coverage[record.coverage] |= bit
+
+        # don't create new entries when looking up unknown values
+        self.by_author = dict(self.by_author)
+        self.by_source = dict(self.by_source)
+        self.by_coverage = dict(self.by_coverage)
+
+    @classmethod
+    def from_graph(cls, graph):
+        '''Build a new index from all Group sheets in an RDF graph.'''
+        # import here to avoid a circular import
+        from belfast.groupsheets.rdfmodels import RdfGroupSheet
+        groupsheets = prefetch([RdfGroupSheet(graph, uri)
+                                for uri in set(graph.subjects(rdflib.RDF.type,
+                                                              rdfns.BG.GroupSheet))],
+                               related=['author_list', 'sources__documents__part_of'])
+        return cls([groupsheet_record(gs) for gs in groupsheets])
+
+    def __len__(self):
+        return len(self.records)
+
+    def bitset(self, author=None, has_url=None, source=None, coverage=None):
+        '''Bitset of record positions matching the specified filters; takes
+        the same parameters as :meth:`filter`.'''
+        bits = self.all
+        if author is not None:
+            bits &= self.by_author.get(unicode(author), 0)
+        if has_url is True:
+            bits &= self.digital
+        if source is not None:
+            bits &= self.by_source.get(unicode(source), 0)
+        if coverage is not None:
+            if coverage == 'undetermined':
+                coverage = None
+            bits &= self.by_coverage.get(coverage, 0)
+        return bits
+
+    def filter(self, author=None, has_url=None, source=None, coverage=None):
+        '''Find Group sheets, optionally filtered by the same attributes
+        as :meth:`~belfast.groupsheets.rdfmodels.get_rdf_groupsheets`.
+
+        :returns: list of :class:`GroupSheetRecord`, sorted by author
+            and title, or only by title when filtering by author
+        '''
+        bits = self.bitset(author=author, has_url=has_url, source=source,
+                           coverage=coverage)
+        if author is not None:
+            # when filtering by author, only sort on title
+            # (better handling for multi-author Group sheets)
+            return [self.records[i] for i in self.title_order
+                    if bits & (1 << i)]
+        return [self.records[i] for i in _positions(bits)]
+
+    def facets(self, author=None, has_url=None, source=None, coverage=None):
+        '''Facet counts for the Group sheets matching the specified filters;
+        takes the same parameters as :meth:`filter`.
+
+        :returns: dictionary with total number of **digital** editions,
+            and dictionaries of **authors** (:class:`AuthorLabel`),
+            **sources** (:class:`SourceLabel`) and **time_periods**
+            (coverage) with the number of Group sheets for each
+        '''
+        bits = self.bitset(author=author, has_url=has_url, source=source,
+                           coverage=coverage)
+
+        def counts(postings, labels=None):
+            totals = {}
+            for value, posting in postings.iteritems():
+                total = _count(bits & posting)
+                if total:
+                    totals[labels[value] if labels else value] = total
+            return totals
+
+        return {
+            'digital': _count(bits & self.digital),
+            'authors': counts(self.by_author, self.authors),
+            'sources': counts(self.by_source, self.sources),
+            'time_periods': counts(self.by_coverage)
+        }
+
+
+_GROUPSHEET_INDEX = None
+_GROUPSHEET_INDEX_VERSION = None
+_index_lock = threading.Lock()
+
+
+def groupsheet_index():
+    '''Shared :class:`GroupSheetIndex` for the current RDF data.  The index
+    is built on first use, and rebuilt when the RDF data last-modification
+    date changes.'''
+    global _GROUPSHEET_INDEX, _GROUPSHEET_INDEX_VERSION
+    version = rdf_data_lastmodified()
+    if _GROUPSHEET_INDEX is None or version != _GROUPSHEET_INDEX_VERSION:
+        with _index_lock:
+            if _GROUPSHEET_INDEX is None or version != _GROUPSHEET_INDEX_VERSION:
+                start = time.time()
+                _GROUPSHEET_INDEX = GroupSheetIndex.from_graph(rdf_data())
+                _GROUPSHEET_INDEX_VERSION = version
+                logger.debug('Indexed %d group sheets in %.02f sec',
+                             len(_GROUPSHEET_INDEX), time.time() - start)
+    return _GROUPSHEET_INDEX
@@ -7,6 +7,7 @@ import rdflib
 import time
 
 from belfast import rdfns
+from belfast.groupsheets.index import groupsheet_index
 from belfast.rdf import rdfmap
 from belfast.rdf.models import RdfResource
 from belfast.util import rdf_data, cached_property
@@ -265,8 +266,11 @@ def groupsheet_by_url(url):
 
 
 def get_rdf_groupsheets(author=None, has_url=None, source=None, coverage=None):
-    '''Query RDF data to get a list of :class:`RdfGroupSheet`
-    optionally filter by various attributes.
+    '''Get a list of Group sheets in the RDF data, optionally filtered by
+    various attributes.  Group sheets are found in the precomputed
+    :class:`~belfast.groupsheets.index.GroupSheetIndex`, and returned as
+    :class:`~belfast.groupsheets.index.GroupSheetRecord`, which provides
+    the same display attributes as :class:`RdfGroupSheet`.
 
     :param author: optional author URI; use to find Group sheets by a specific
         author
@@ -277,73 +281,8 @@ def get_rdf_groupsheets(author=None, has_url=None, source=None, coverage=None):
     :param coverag: filter by coverage dates
     '''
     start = time.time()
-    g = rdf_data()
-    # in most cases, sort by last name and then title
-    sort = '?sort_name ?sort_title'
-
-    fltr = ''
-    if author is not None:
-        fltr = '. ?ms dc:creator <%s> ' % author
-        # when filtering by author, only sort on title
-        # (better handling for multi-author Group sheets)
-        sort = '?sort_title'
-
-    if has_url is True:
-        fltr += '. ?ms schema:URL ?url '
-
-    if source is not None:
-        fltr += '. <%s> schema:mentions ?ms' % source
-
-    if coverage is not None:
-        if coverage == 'undetermined':
-            # TEMPORARY: hopefully we don't actually need to support this...
-            fltr += ' FILTER NOT EXISTS { ?ms dc:coverage ?date } '
-        else:
-            fltr += '. ?ms dc:coverage "%s"' % coverage
-
-    query = '''
-        PREFIX schema: <%(schema)s>
-        PREFIX dc: <%(dc)s>
-        PREFIX rdf: <%(rdf)s>
-        SELECT DISTINCT ?ms
-        WHERE {
-            ?ms rdf:type <%(bg)s> .
-            # one Group sheet is anonymous; make author optional to avoid omitting
-            OPTIONAL {
-               ?ms dc:creator ?author .
-               ?author schema:familyName ?name
-            } .
-            # some Group sheets are untitled; make title optional so we don't lose those
-            OPTIONAL {
-               ?ms dc:title ?title .
-               # some Group sheets have only one title while others have a list
-               OPTIONAL {
-                  ?title rdf:first ?first_title
-               }
-            } .
-            # sort anonymous Group sheet at the beginning of the list
-            BIND (COALESCE(?name, "AA") AS ?sort_name) .
-            # untitled should sort *after* other titles; set default string of ZZ
-            BIND (COALESCE(?title, "ZZ") AS ?title1) .
-            # first title default to empty string
-            BIND (COALESCE(?first_title, "") AS ?first_title1) .
-            # sort on first title (if list) or only title, together
-            BIND (concat(str(?first_title1), str(?title1)) as ?sort_title)
-            %(filter)s
-        } ORDER BY %(sort)s
-        ''' % {'schema': rdfns.SCHEMA_ORG, 'dc': rdfns.DC,
-               'rdf': rdflib.RDF, 'bg': rdfns.BG.GroupSheet,
-               'filter': fltr, 'sort': sort}
-
-    # NOTE: some group sheets have rdf:sequence for titles, others have literal titles
-    # combining first title in sequence (if present) with dc:title literal
-    # so literal and sequence titles can be sorted together
-
-    logger.debug(query)
-    res = g.query(query)
-
-    logger.debug('Found %d group sheets in %.02f sec', len(res),
+    gs = groupsheet_index().filter(author=author, has_url=has_url,
+                                   source=source, coverage=coverage)
+    logger.debug('Found %d group sheets in %.02f sec', len(gs),
                  time.time() - start)
-
-    gs = [RdfGroupSheet(g, r['ms']) for r in res]
     return gs
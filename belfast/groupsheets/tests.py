@@ -9,7 +9,10 @@ from eulexistdb import testutil
 from lxml import etree
 from mock import patch
 import rdflib
+from rdflib.collection import Collection
 
+from belfast import rdfns
+from belfast.groupsheets.index import GroupSheetIndex, groupsheet_index
 from belfast.groupsheets.rdfmodels import TeiGroupSheet, Contents, \
     Poem, id_from_ark, RdfGroupSheet, get_rdf_groupsheets
 from belfast.groupsheets.forms import KeywordSearchForm
@@ -107,6 +110,116 @@ class RdfGroupSheetTest(testutil.TestCase):
         self.assertEqual('1965-04-27', groupsheet.date)
 
 
+class GroupSheetIndexTest(TestCase):
+
+    base = 'http://example.com/'
+
+    def setUp(self):
+        self.graph = rdflib.Graph()
+        add = self.graph.add
+        self.heaney = rdflib.URIRef(self.base + 'people/heaney-seamus/')
+        self.longley = rdflib.URIRef(self.base + 'people/longley-michael/')
+        for uri, first, last in [(self.heaney, 'Seamus', 'Heaney'),
+                                 (self.longley, 'Michael', 'Longley')]:
+            add((uri, rdflib.RDF.type, rdfns.SCHEMA_ORG.Person))
+            add((uri, rdfns.SCHEMA_ORG.givenName, rdflib.Literal(first)))
+            add((uri, rdfns.SCHEMA_ORG.familyName, rdflib.Literal(last)))
+        self.collection = rdflib.URIRef(self.base + 'collections/heaney')
+        add((self.collection, rdflib.RDF.type, rdfns.ARCH.Collection))
+        add((self.collection, rdfns.SCHEMA_ORG.name,
+             rdflib.Literal('Seamus Heaney papers')))
+
+        self.gs = [rdflib.URIRef(self.base + 'groupsheets/%d' % i)
+                   for i in range(4)]
+        for gs in self.gs:
+            add((gs, rdflib.RDF.type, rdfns.BG.GroupSheet))
+        # heaney group sheet with a digital edition
+        add((self.gs[0], rdfns.DC.creator, self.heaney))
+        add((self.gs[0], rdfns.DC.title, rdflib.Literal('Poems')))
+        add((self.gs[0], rdfns.DC.coverage, rdflib.Literal('1963-1966')))
+        add((self.gs[0], rdfns.SCHEMA_ORG.URL,
+             rdflib.URIRef('http://pid.emory.edu/ark:/25593/17md1')))
+        add((self.collection, rdfns.SCHEMA_ORG.mentions, self.gs[0]))
+        # longley group sheet with a list of titles
+        add((self.gs[1], rdfns.DC.creator, self.longley))
+        titles = rdflib.BNode()
+        add((self.gs[1], rdfns.DC.title, titles))
+        Collection(self.graph, titles,
+            [rdflib.Literal('Aubade'), rdflib.Literal('Epithalamion')])
+        add((self.gs[1], rdfns.DC.coverage, rdflib.Literal('1963-1966')))
+        # multi-author group sheet, untitled
+        add((self.gs[2], rdfns.DC.creator, self.heaney))
+        add((self.gs[2], rdfns.DC.creator, self.longley))
+        add((self.collection, rdfns.SCHEMA_ORG.mentions, self.gs[2]))
+        # anonymous group sheet
+        add((self.gs[3], rdfns.DC.title, rdflib.Literal('Anonymous poems')))
+
+        self.index = GroupSheetIndex.from_graph(self.graph)
+
+    def test_filter(self):
+        results = self.index.filter()
+        self.assertEqual(4, len(results))
+        # anonymous first, then sorted by author and title
+        self.assertEqual([unicode(self.gs[i]) for i in [3, 0, 2, 1]],
+                         [r.identifier for r in results])
+        self.assertEqual(['Aubade', 'Epithalamion'], list(results[3].title_list))
+        self.assertEqual(None, results[3].title)
+        self.assertEqual(['Heaney', 'Longley'],
+                         [a.lastname for a in results[2].author_list])
+        self.assertEqual('heaney-seamus', results[2].author_list[0].slug)
+
+        # filter by author sorts on title only
+        results = self.index.filter(author=unicode(self.heaney))
+        self.assertEqual([unicode(self.gs[i]) for i in [0, 2]],
+                         [r.identifier for r in results])
+        results = self.index.filter(has_url=True)
+        self.assertEqual([unicode(self.gs[0])], [r.identifier for r in results])
+        self.assertEqual('http://pid.emory.edu/ark:/25593/17md1', results[0].url)
+        results = self.index.filter(source=unicode(self.collection))
+        self.assertEqual(2, len(results))
+        self.assertEqual('Seamus Heaney papers', results[0].sources[0].name)
+        self.assertEqual(2, len(self.index.filter(coverage='1963-1966')))
+        self.assertEqual(2, len(self.index.filter(coverage='undetermined')))
+        self.assertEqual(1, len(self.index.filter(author=unicode(self.longley),
+                                                  coverage='1963-1966')))
+
+    def test_facets(self):
+        facets = self.index.facets()
+        self.assertEqual(1, facets['digital'])
+        authors = dict((a.lastname, total)
+                       for a, total in facets['authors'].iteritems())
+        self.assertEqual({'Heaney': 2, 'Longley': 2}, authors)
+        self.assertEqual([2], facets['sources'].values())
+        self.assertEqual(2, facets['time_periods']['1963-1966'])
+        self.assertEqual(2, facets['time_periods'][None])
+
+        # counts for filtered results
+        facets = self.index.facets(author=unicode(self.longley))
+        self.assertEqual(0, facets['digital'])
+        authors = dict((a.lastname, total)
+                       for a, total in facets['authors'].iteritems())
+        self.assertEqual({'Heaney': 1, 'Longley': 2}, authors)
+        self.assertEqual({'1963-1966': 1, None: 1}, facets['time_periods'])
+        facets = self.index.facets(has_url=True, source=unicode(self.collection))
+        self.assertEqual(1, facets['digital'])
+        self.assertEqual({}, self.index.facets(source='http://example.com/none')['authors'])
+
+    @patch('belfast.groupsheets.index.rdf_data_lastmodified')
+    @patch('belfast.groupsheets.index.rdf_data')
+    def test_groupsheet_index(self, mockrdf_data, mocklastmod):
+        mockrdf_data.return_value = self.graph
+        mocklastmod.return_value = 1
+        index = groupsheet_index()
+        self.assertEqual(4, len(index))
+        # same data version: index is reused
+        self.assert_(index is groupsheet_index())
+        self.assertEqual(1, mockrdf_data.call_count)
+        # data modified: index is rebuilt
+        mocklastmod.return_value = 2
+        self.graph.remove((self.gs[3], None, None))
+        self.assertEqual(3, len(groupsheet_index()))
+
+
 class KeywordSearchFormTest(testutil.TestCase):
 
     def test_keyword_clean(self):
@@ -1,4 +1,3 @@
-from collections import defaultdict
 from django.core.urlresolvers import reverse
 from django.shortcuts import render
 from django.http import Http404, HttpResponse
@@ -10,6 +9,7 @@ import urllib
 
 from belfast import rdfns
 from belfast.groupsheets.forms import KeywordSearchForm
+from belfast.groupsheets.index import groupsheet_index
 from belfast.groupsheets.rdfmodels import TeiGroupSheet, TeiDocument, \
     get_rdf_groupsheets, groupsheet_by_url
 from belfast.util import rdf_data_lastmodified, network_data_lastmodified, \
@@ -121,24 +121,13 @@ def list_groupsheets(request):
     results = get_rdf_groupsheets(**filters)
     # TODO: support source filter; make more django-like
 
-    # generate labels/totals for 'facet' filters
-    digital_count = 0
-    authors = defaultdict(int)
-    sources = defaultdict(int)
-    time_periods = defaultdict(int)
-    for r in results:
-        # if not already filtered on digital, get a count
-        if filter_digital is None and r.url:
-            digital_count += 1
-        if filter_author is None:
-            # use author list to ensure *all* authors are listed properly
-            for author in r.author_list:
-                authors[author] += 1
-        if filter_source is None:
-            for s in r.sources:
-                sources[s] += 1
-        if filter_time is None:
-            time_periods[r.coverage] += 1
+    # generate labels/totals for 'facet' filters from the group sheet index
+    counts = groupsheet_index().facets(**filters)
+    # if already filtered on a facet, don't display it
+    digital_count = counts['digital'] if filter_digital is None else 0
+    authors = counts['authors'] if filter_author is None else {}
+    sources = counts['sources'] if filter_source is None else {}
+    time_periods = counts['time_periods'] if filter_time is None else {}
 
     # generate lists of dicts for easy sorting in django template
     authors = [{'author': k, 'total': v} for k, v in authors.iteritems()]
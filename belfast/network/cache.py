@@ -0,0 +1,198 @@
+'''Versioned cache for the JSON network data generated by the network
+graph views.  Generating the network JSON (filtering the graph,
+calculating ego graphs and centrality measures) is expensive, but the
+results only change when the data changes, so finished JSON is cached
+with keys that include the RDF and network data last-modification dates.
+
+The cache backend is configured with **NETWORK_JSON_CACHE**, a dictionary
+with a ``backend`` of:
+
+* ``memory`` (default) - cached per process
+* ``file`` - stored in the directory specified by ``location``
+* ``django`` - stored in the Django cache named by ``alias``
+  (default: ``default``)
+
+Set **NETWORK_JSON_CACHE** to None to disable caching.
+'''
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+from django.conf import settings
+
+from belfast.util import rdf_data_lastmodified, network_data_lastmodified
+
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBackend(object):
+    '''Cache network JSON in memory in the current process.  Only
+    content for the current data version is kept.'''
+
+    def __init__(self):
+        self.data = {}
+        self.version = None
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        if version != self.version:
+            return None
+        return self.data.get(key)
+
+    def set(self, key, version, content):
+        with self._lock:
+            if version != self.version:
+                # data has changed; discard content for the old version
+                self.data = {}
+                self.version = version
+            self.data[key] = content
+
+    def clear(self):
+        with self._lock:
+            self.data = {}
+            self.version = None
+
+
+class FileBackend(object):
+    '''Cache network JSON as files in a directory, one subdirectory per
+    data version, so cached content can be shared across processes and
+    server restarts.
+
+    :param location: base directory for cached files
+    '''
+
+    def __init__(self, location):
+        self.location = location
+
+    def _path(self, key, version):
+        return os.path.join(self.location, version, '%s.json' % key)
+
+    def get(self, key, version):
+        try:
+            with open(self._path(key, version), 'rb') as cached:
+                return cached.read()
+        except IOError:
+            return None
+
+    def set(self, key, version, content):
+        path = self._path(key, version)
+        dirname = os.path.dirname(path)
+        if not os.path.isdir(dirname):
+            try:
+                os.makedirs(dirname)
+            except OSError:
+                # may have been created by another process
+                if not os.path.isdir(dirname):
+                    raise
+        # write to a temporary file and rename so readers never see
+        # partial content
+        fd, tmpname = tempfile.mkstemp(dir=dirname)
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(content)
+        os.chmod(tmpname, 0644)
+        os.rename(tmpname, path)
+
+    def clear(self, keep=None):
+        '''Remove cached content, except for the version specified
+        by **keep**.'''
+        if not os.path.isdir(self.location):
+            return
+        for version in os.listdir(self.location):
+            if version == keep:
+                continue
+            path = os.path.join(self.location, version)
+            for name in os.listdir(path):
+                os.remove(os.path.join(path, name))
+            os.rmdir(path)
+
+
+class DjangoCacheBackend(object):
+    '''Cache network JSON in a configured Django cache.
+
+    :param alias: name of the cache in **CACHES**
+    '''
+
+    def __init__(self, alias='default'):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+
+    def _key(self, key, version):
+        return 'belfast-network:%s:%s' % (version, key)
+
+    def get(self, key, version):
+        return self.cache.get(self._key(key, version))
+
+    def set(self, key, version, content):
+        # content is versioned by key, so it can be kept indefinitely
+        self.cache.set(self._key(key, version), content, None)
+
+    def clear(self):
+        # versioned keys for old data will expire from the cache
+        pass
+
+
+def data_version():
+    '''Version identifier for the current RDF and network data, based
+    on the last-modification dates.'''
+    lastmod = max(rdf_data_lastmodified(), network_data_lastmodified())
+    return lastmod.strftime('%Y%m%d%H%M%S%f')
+
+
+def cache_key(view, **params):
+    '''Cache key for a view and any parameters that affect the output,
+    e.g. mode, degree, minimum degree, or person.'''
+    key = '%s?%s' % (view, '&'.join('%s=%s' % (k, params[k])
+                                    for k in sorted(params.keys())))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+_BACKEND = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    '''Configured cache backend, or None if caching is disabled.'''
+    global _BACKEND
+    config = getattr(settings, 'NETWORK_JSON_CACHE', {'backend': 'memory'})
+    if config is None:
+        return None
+    if _BACKEND is None:
+        with _backend_lock:
+            if _BACKEND is None:
+                backend = config.get('backend', 'memory')
+                if backend == 'memory':
+                    _BACKEND = MemoryBackend()
+                elif backend == 'file':
+                    _BACKEND = FileBackend(config['location'])
+                elif backend == 'django':
+                    _BACKEND = DjangoCacheBackend(config.get('alias', 'default'))
+                else:
+                    raise ValueError('Unknown network JSON cache backend %s' % backend)
+    return _BACKEND
+
+
+def cached_json(generate, view, **params):
+    '''Get cached network JSON for a view and parameters, generating and
+    caching it if it is not cached for the current data version.
+
+    :param generate: function to generate the JSON content; called with
+        the specified parameters
+    :param view: view name, used as part of the cache key
+    :returns: JSON content as a string
+    '''
+    backend = get_backend()
+    if backend is None:
+        return generate(**params)
+
+    version = data_version()
+    key = cache_key(view, **params)
+    content = backend.get(key, version)
+    if content is None:
+        logger.debug('Generating network JSON for %s %s', view, params)
+        content = generate(**params)
+        backend.set(key, version, content)
+    return content
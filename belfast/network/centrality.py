@@ -0,0 +1,229 @@
+'''Precomputed centrality measures for the network graphs displayed on
+the site.
+
+Betweenness and eigenvector centrality are expensive to calculate, so
+rather than calculating them for every network JSON request, the data
+prep process calculates degree, betweenness, and eigenvector centrality
+once for each named graph variant (e.g., the full network, or the
+Belfast Group egograph) and stores them as a lookup table of values by
+node (see :mod:`belfast.arrayfile`).  :meth:`belfast.network.util.annotate_graph`
+uses the stored values when the table for a variant matches the graph
+being annotated.
+
+For large graphs, betweenness centrality can be approximated by sampling
+a fixed number of nodes, configured with **NETWORK_BETWEENNESS_SAMPLES**.
+'''
+
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+import networkx as nx
+import numpy
+
+from belfast.arrayfile import write_arrays, ArrayFile, StringTable
+from belfast.network.sparse import SparseGraph
+
+
+logger = logging.getLogger(__name__)
+
+
+#: file extension for centrality table files
+CENTRALITY_EXTENSION = '.nxcent'
+
+#: centrality measures that can be calculated and stored
+MEASURES = ['degree', 'in_degree', 'out_degree', 'betweenness_centrality',
+            'eigenvector_centrality']
+
+
+def centrality_measures(graph, fields=MEASURES, betweenness_samples=None):
+    '''Calculate centrality measures for all nodes in a graph.
+
+    :param graph: :class:`networkx.graph.Graph` or subclass
+    :param fields: list of measures to calculate; any of :data:`MEASURES`
+    :param betweenness_samples: if specified and the graph has more nodes
+        than this, approximate betweenness centrality using this many
+        sample nodes
+    :returns: dictionary of measure name and dictionary of values by node;
+        measures that are not available for the graph (in/out degree for
+        undirected graphs) or could not be calculated are not included
+    '''
+    measures = {}
+    # degree and eigenvector centrality are calculated from a sparse
+    # adjacency matrix
+    sparse = None
+    if set(fields) & set(['degree', 'in_degree', 'out_degree',
+                          'eigenvector_centrality']):
+        sparse = SparseGraph(graph)
+
+    if 'degree' in fields:
+        measures['degree'] = sparse.degree()
+    # in/out degree only available for directed graphs
+    if sparse is not None and sparse.directed:
+        if 'in_degree' in fields:
+            measures['in_degree'] = sparse.in_degree()
+        if 'out_degree' in fields:
+            measures['out_degree'] = sparse.out_degree()
+    if 'betweenness_centrality' in fields:
+        opts = {}
+        if betweenness_samples and graph.number_of_nodes() > betweenness_samples:
+            # use a fixed seed so results are repeatable
+            opts = {'k': betweenness_samples, 'seed': 0}
+            logger.debug('Approximating betweenness centrality with %d samples',
+                         betweenness_samples)
+        measures['betweenness_centrality'] = \
+            nx.algorithms.centrality.betweenness_centrality(graph, **opts)
+    if 'eigenvector_centrality' in fields:
+        # NOTE: for a few graphs in production, eigenvector centrality fails:
+        # "power iteration failed to converge in %d iterations"
+        # (possibly an issue with something in the graph?)
+        # Catch the error and don't include eigenvector centrality
+        # parallel edges in multigraphs are collapsed to a single edge
+        # (keeping one edge's data, as networkx does when converting),
+        # rather than summing their weights as the sparse matrix does
+        if graph.is_multigraph():
+            collapsed = nx.DiGraph(graph) if graph.is_directed() else nx.Graph(graph)
+            sparse = SparseGraph(collapsed)
+        try:
+            measures['eigenvector_centrality'] = sparse.eigenvector_centrality()
+        except nx.NetworkXError as err:
+            logger.warn('Error generating eigenvector centrality: %s' % err)
+    return measures
+
+
+def centrality_path(variant):
+    '''Path for the centrality table for a named graph variant.  Tables
+    are stored in **NETWORK_CENTRALITY_DIR**, or in the same directory as
+    the full network GEXF file if not configured.'''
+    base_dir = getattr(settings, 'NETWORK_CENTRALITY_DIR', None) or \
+        os.path.dirname(settings.GEXF_DATA['full'])
+    return os.path.join(base_dir, 'centrality-%s%s' % (variant, CENTRALITY_EXTENSION))
+
+
+def write_centrality(graph, filename, betweenness_samples=None):
+    '''Calculate all centrality measures for a graph and save them as a
+    centrality table file.
+
+    :param graph: :class:`networkx.graph.Graph` or subclass
+    :param filename: path for the table file
+    :param betweenness_samples: see :meth:`centrality_measures`
+    '''
+    nodes = graph.nodes()
+    measures = centrality_measures(graph, betweenness_samples=betweenness_samples)
+    string_data, string_offsets = StringTable.build(nodes)
+    arrays = {
+        'strings.data': string_data,
+        'strings.offsets': string_offsets,
+    }
+    for name, values in measures.iteritems():
+        arrays['measure.%s' % name] = numpy.array([values[n] for n in nodes],
+                                                  dtype=numpy.float64)
+
+    approximate = bool(betweenness_samples and
+                       graph.number_of_nodes() > betweenness_samples)
+    meta = {
+        'nodes': len(nodes),
+        'edges': graph.number_of_edges(),
+        'measures': sorted(measures.keys()),
+        # measures that were requested but could not be calculated,
+        # so they are not attempted again at request time
+        'unavailable': sorted(set(MEASURES) - set(measures.keys())),
+        'betweenness_samples': betweenness_samples if approximate else None,
+    }
+    write_arrays(filename, arrays, meta)
+    return meta
+
+
+class CentralityTable(object):
+    '''Read-only access to a centrality table file written by
+    :meth:`write_centrality`.  Use ``in`` to check if a measure is
+    available, and index by measure name to get a dictionary of values
+    by node.
+
+    :param filename: path to the table file
+    '''
+
+    def __init__(self, filename):
+        self.arrays = ArrayFile(filename)
+        self.meta = self.arrays.meta
+        #: modification time of the file when it was loaded
+        self.mtime = self.arrays.mtime
+        strings = StringTable(self.arrays['strings.data'],
+                              self.arrays['strings.offsets'])
+        #: node identifiers, in table order
+        self.nodes = [strings[i] for i in range(len(strings))]
+        self._node_set = set(self.nodes)
+        self._values = {}
+
+    @property
+    def unavailable(self):
+        'measures that could not be calculated for this graph'
+        return self.meta.get('unavailable', [])
+
+    def matches(self, graph):
+        '''Check if this table was calculated for the specified graph,
+        i.e. the graph has the same nodes and number of edges.'''
+        return graph.number_of_nodes() == self.meta['nodes'] and \
+            graph.number_of_edges() == self.meta['edges'] and \
+            all(unicode(n) in self._node_set for n in graph.nodes_iter())
+
+    def __contains__(self, measure):
+        return measure in self.meta['measures']
+
+    def __getitem__(self, measure):
+        if measure not in self._values:
+            values = self.arrays['measure.%s' % measure].tolist()
+            if 'degree' in measure:
+                values = [int(v) for v in values]
+            self._values[measure] = dict(zip(self.nodes, values))
+        return self._values[measure]
+
+    def close(self):
+        self.arrays.close()
+
+
+def precompute_centrality(variants, betweenness_samples=None):
+    '''Calculate and save centrality tables for named graph variants.
+
+    :param variants: dictionary of variant name and graph
+    :param betweenness_samples: number of samples for approximating
+        betweenness centrality in large graphs; defaults to the
+        **NETWORK_BETWEENNESS_SAMPLES** setting (exact if not set)
+    :returns: dictionary of variant name and elapsed time in seconds
+    '''
+    if betweenness_samples is None:
+        betweenness_samples = getattr(settings, 'NETWORK_BETWEENNESS_SAMPLES', None)
+    timing = {}
+    for name, graph in variants.iteritems():
+        start = time.time()
+        write_centrality(graph, centrality_path(name),
+                         betweenness_samples=betweenness_samples)
+        timing[name] = time.time() - start
+        logger.debug('Calculated centrality for %s (%d nodes) in %.02f sec',
+                     name, graph.number_of_nodes(), timing[name])
+    return timing
+
+
+# loaded centrality tables, by variant name
+_CENTRALITY = {}
+_centrality_lock = threading.Lock()
+
+
+def centrality_table(variant):
+    '''Shared :class:`CentralityTable` for a named graph variant; returns
+    None if no table has been generated.  Reloaded when the file changes.'''
+    path = centrality_path(variant)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    table = _CENTRALITY.get(variant)
+    if table is None or table.mtime != mtime:
+        with _centrality_lock:
+            table = _CENTRALITY.get(variant)
+            if table is None or table.mtime != mtime:
+                table = _CENTRALITY[variant] = CentralityTable(path)
+    return table
@@ -0,0 +1,227 @@
+'''Precomputed index of the direct connections for each node in the
+network, used to list connected people and organizations on profile
+pages.
+
+For each node, the index stores its neighbors in the network (in either
+direction), sorted by connection strength, with the relationship labels
+and cumulative weight of the edges between them, along with the RDF
+types of every node.  The index is generated from the full network by
+the data prep process and stored as a memory-mapped array file (see
+:mod:`belfast.arrayfile`), so looking up the connections for a profile
+does not require examining the network graph.
+'''
+
+import logging
+import os
+import threading
+
+from django.conf import settings
+import numpy
+import rdflib
+
+from belfast.arrayfile import write_arrays, ArrayFile, StringTable
+from belfast.util import network_data
+
+
+logger = logging.getLogger(__name__)
+
+
+#: file extension for connection index files
+CONNECTIONS_EXTENSION = '.nxconn'
+
+
+def connections_path(gexf_path):
+    '''Path for the connection index corresponding to a GEXF file.'''
+    return os.path.splitext(gexf_path)[0] + CONNECTIONS_EXTENSION
+
+
+def node_connections(network, node):
+    '''Find the direct connections for a single node in a network graph.
+
+    :param network: :mod:`networkx` graph
+    :param node: node identifier
+    :returns: list of tuples of neighbor node, set of relationship terms
+        (edge labels), and cumulative weight of the labeled edges between
+        the two nodes, sorted by strongest connection
+    '''
+    if network.is_directed():
+        edges = network.out_edges(node, data=True) + \
+            network.in_edges(node, data=True)
+    else:
+        edges = network.edges(node, data=True)
+
+    connections = {}
+    for src, target, data in edges:
+        other = target if src == node else src
+        # don't include the current node in its own connections
+        if other == node:
+            continue
+        rels, weight = connections.get(other, (set(), 0))
+        if 'label' in data:
+            weight += data.get('weight', 1)  # assume default of 1 if not set
+            rels.add(data['label'])
+        connections[other] = (rels, weight)
+
+    for rels, weight in connections.itervalues():
+        if 'knows' in rels and 'correspondedWith' in rels:
+            rels.remove('knows')
+
+    # sort by weight so strongest connections will be listed first
+    return sorted(((n, rels, weight) for n, (rels, weight)
+                   in connections.iteritems()),
+                  key=lambda c: (-c[2], c[0]))
+
+
+def write_connections(network, rdfgraph, filename):
+    '''Generate a connection index for every node in a network graph and
+    save it to a file.
+
+    :param network: :mod:`networkx` graph
+    :param rdfgraph: :class:`rdflib.Graph` with RDF types for the nodes
+    :param filename: path for the index file
+    '''
+    string_index = {}
+    string_list = []
+
+    def strings(value):
+        value = unicode(value)
+        if value not in string_index:
+            string_index[value] = len(string_list)
+            string_list.append(value)
+        return string_index[value]
+
+    nodes = network.nodes()
+    node_index = dict((n, i) for i, n in enumerate(nodes))
+    node_ids = [strings(n) for n in nodes]
+
+    # rdf types for each node
+    types = []
+    type_offsets = [0]
+    for n in nodes:
+        types.extend(strings(t) for t in
+                     rdfgraph.objects(rdflib.URIRef(n), rdflib.RDF.type))
+        type_offsets.append(len(types))
+
+    # connections for each node, as ranges of neighbor, weight, and labels
+    conn_offsets = [0]
+    neighbors = []
+    weights = []
+    labels = []
+    label_offsets = [0]
+    for n in nodes:
+        for other, rels, weight in node_connections(network, n):
+            neighbors.append(node_index[other])
+            weights.append(weight)
+            labels.extend(strings(r) for r in sorted(rels))
+            label_offsets.append(len(labels))
+        conn_offsets.append(len(neighbors))
+
+    string_data, string_offsets = StringTable.build(string_list)
+    arrays = {
+        'strings.data': string_data,
+        'strings.offsets': string_offsets,
+        'nodes.id': numpy.array(node_ids, dtype=numpy.int32),
+        'nodes.types': numpy.array(types, dtype=numpy.int32),
+        'nodes.types_offsets': numpy.array(type_offsets, dtype=numpy.int64),
+        'conn.offsets': numpy.array(conn_offsets, dtype=numpy.int64),
+        'conn.neighbor': numpy.array(neighbors, dtype=numpy.int32),
+        'conn.weight': numpy.array(weights, dtype=numpy.float64),
+        'conn.labels': numpy.array(labels, dtype=numpy.int32),
+        'conn.labels_offsets': numpy.array(label_offsets, dtype=numpy.int64),
+    }
+    meta = {
+        'nodes': len(nodes),
+        'edges': network.number_of_edges(),
+    }
+    write_arrays(filename, arrays, meta)
+    logger.debug('Wrote connection index for %d nodes, %d connections to %s',
+                 len(nodes), len(neighbors), filename)
+
+
+class ConnectionIndex(object):
+    '''Read-only access to a connection index file written by
+    :meth:`write_connections`.
+
+    :param filename: path to the index file
+    '''
+
+    def __init__(self, filename):
+        self.arrays = ArrayFile(filename)
+        self.meta = self.arrays.meta
+        #: modification time of the file when it was loaded
+        self.mtime = self.arrays.mtime
+        self.strings = StringTable(self.arrays['strings.data'],
+                                   self.arrays['strings.offsets'])
+        #: node identifiers, in index order
+        self.nodes = [self.strings[i] for i in self.arrays['nodes.id']]
+        self._node_index = dict((n, i) for i, n in enumerate(self.nodes))
+
+    def __contains__(self, node):
+        return node in self._node_index
+
+    def matches(self, network):
+        '''Check if this index was generated from the specified network,
+        i.e. the network has the same number of nodes and edges.'''
+        return network.number_of_nodes() == self.meta['nodes'] and \
+            network.number_of_edges() == self.meta['edges']
+
+    def _range(self, name, i):
+        # values for entry i of a variable-length array
+        offsets = self.arrays['%s_offsets' % name]
+        return self.arrays[name][offsets[i]:offsets[i + 1]]
+
+    def types(self, node):
+        'set of RDF types for a node, as strings'
+        return set(self.strings[t] for t in
+                   self._range('nodes.types', self._node_index[node]))
+
+    def connections(self, node):
+        '''Connections for a node, in the same form as :meth:`node_connections`,
+        with the set of RDF types for each neighbor added; returns an empty
+        list if the node is not in the index.'''
+        if node not in self._node_index:
+            return []
+        i = self._node_index[node]
+        offsets = self.arrays['conn.offsets']
+        start, end = offsets[i], offsets[i + 1]
+        neighbors = self.arrays['conn.neighbor'][start:end].tolist()
+        weights = self.arrays['conn.weight'][start:end].tolist()
+        connections = []
+        for j, n, weight in zip(range(start, end), neighbors, weights):
+            node_id = self.nodes[n]
+            rels = set(self.strings[l] for l in self._range('conn.labels', j))
+            if weight == int(weight):
+                weight = int(weight)
+            connections.append((node_id, rels, weight, self.types(node_id)))
+        return connections
+
+    def close(self):
+        self.arrays.close()
+
+
+# loaded connection indexes, by network name
+_CONNECTIONS = {}
+_connections_lock = threading.Lock()
+
+
+def connection_index(name='full'):
+    '''Shared :class:`ConnectionIndex` for the named network data; returns
+    None if no index has been generated or the index does not match the
+    current network data.  Reloaded when the file changes.'''
+    path = connections_path(settings.GEXF_DATA[name])
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+
+    index = _CONNECTIONS.get(name)
+    if index is None or index.mtime != mtime:
+        with _connections_lock:
+            index = _CONNECTIONS.get(name)
+            if index is None or index.mtime != mtime:
+                index = _CONNECTIONS[name] = ConnectionIndex(path)
+    if not index.matches(network_data(name)):
+        logger.warn('Connection index %s does not match current network data',
+                    path)
+        return None
+    return index
@@ -0,0 +1,132 @@
+'''Fast ego graph extraction from the shared network data.
+
+Generating an ego graph with :meth:`networkx.ego_graph` requires an
+undirected copy of the entire network, filtered by node type, for every
+request.  Instead, :class:`EgoGraphIndex` keeps a prebuilt undirected
+adjacency index of the network for a set of node types, finds the nodes
+within the requested radius by breadth-first search over the index, and
+builds a small graph with only those nodes and the edges between them.
+Indexes are shared (see :meth:`ego_graph_index`) and rebuilt only when
+the network data is reloaded.
+'''
+
+import logging
+import threading
+import time
+
+import networkx as nx
+
+from belfast.util import network_data
+
+
+logger = logging.getLogger(__name__)
+
+
+class EgoGraphIndex(object):
+    '''Undirected adjacency index for a :mod:`networkx` graph, optionally
+    restricted to nodes with a ``type`` attribute in a list of types.
+
+    :param graph: :class:`networkx.graph.Graph` or subclass
+    :param types: optional list of node types to include
+    '''
+
+    def __init__(self, graph, types=None):
+        self.graph = graph
+        self.types = set(types) if types is not None else None
+
+        nodes = [n for n, data in graph.nodes_iter(data=True)
+                 if self.types is None or data.get('type') in self.types]
+        included = set(nodes)
+        #: neighbors for each included node, in either direction
+        self.adjacency = {}
+        for n in nodes:
+            if graph.is_directed():
+                neighbors = set(graph.succ[n]) | set(graph.pred[n])
+            else:
+                neighbors = set(graph.adj[n])
+            self.adjacency[n] = neighbors & included
+
+    def __contains__(self, node):
+        return node in self.adjacency
+
+    def neighborhood(self, node, radius=1):
+        '''Set of nodes within **radius** steps of a node, including the
+        node itself.
+
+        :raises: :class:`KeyError` if the node is not in the index
+        '''
+        # raise an error for unknown nodes, as networkx does
+        if node not in self.adjacency:
+            raise KeyError(node)
+        seen = set([node])
+        level = [node]
+        for i in range(radius):
+            next_level = []
+            for n in level:
+                for nbr in self.adjacency[n]:
+                    if nbr not in seen:
+                        seen.add(nbr)
+                        next_level.append(nbr)
+            if not next_level:
+                break
+            level = next_level
+        return seen
+
+    def ego_graph(self, node, radius=1):
+        '''Generate an undirected ego graph around a node.  Equivalent to
+        :meth:`networkx.ego_graph` on an undirected copy of the indexed
+        graph, but only nodes and edges in the ego graph are copied, so
+        it can be modified (e.g., annotated) without affecting the shared
+        network data.
+
+        :param node: center node
+        :param radius: radius or degree of the ego graph; defaults to 1
+        :returns: :class:`networkx.MultiGraph` if the indexed graph is a
+            multigraph, otherwise :class:`networkx.Graph`
+        '''
+        nodes = self.neighborhood(node, radius)
+        graph = self.graph
+        eg = nx.MultiGraph() if graph.is_multigraph() else nx.Graph()
+        eg.graph.update(graph.graph)
+        for n in nodes:
+            eg.add_node(n, **graph.node[n])
+
+        # same edges as graph.to_undirected(); for directed graphs, use
+        # outbound edges so each edge is added once
+        edges = graph.succ if graph.is_directed() else graph.adj
+        for u in nodes:
+            for v, data in edges[u].iteritems():
+                if v not in nodes:
+                    continue
+                if graph.is_multigraph():
+                    for key, keydata in data.iteritems():
+                        eg.add_edge(u, v, key=key, **keydata)
+                else:
+                    eg.add_edge(u, v, **data)
+        return eg
+
+
+# shared ego graph indexes, by network name and node types
+_EGO_INDEX = {}
+_ego_lock = threading.Lock()
+
+
+def ego_graph_index(types=None, name='full'):
+    '''Shared :class:`EgoGraphIndex` for the named network data and
+    node types.  Rebuilt when the network data is reloaded.
+
+    :param types: optional list of node types to include
+    :param name: network name, as used by :meth:`belfast.util.network_data`
+    '''
+    graph = network_data(name)
+    key = (name, tuple(sorted(types)) if types is not None else None)
+    index = _EGO_INDEX.get(key)
+    if index is None or index.graph is not graph:
+        with _ego_lock:
+            index = _EGO_INDEX.get(key)
+            if index is None or index.graph is not graph:
+                start = time.time()
+                index = _EGO_INDEX[key] = EgoGraphIndex(graph, types)
+                logger.debug('Indexed %d nodes for ego graphs in %.02f sec',
+                             len(index.adjacency), time.time() - start)
+    return index
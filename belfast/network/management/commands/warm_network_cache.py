@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+# script to pre-generate cached network graph JSON for the current data
+
+from optparse import make_option
+import time
+
+from django.core.management.base import BaseCommand
+
+from belfast.network.cache import cached_json, get_backend, data_version, \
+    FileBackend
+from belfast.network.views import group_people_json
+from belfast.people.views import egograph_json
+from belfast.people.rdfmodels import profile_people
+
+
+class Command(BaseCommand):
+    '''Generate and cache network graph JSON for the current RDF and
+    network data, so the first request after a data update is fast'''
+    help = __doc__
+
+    v_normal = 1
+
+    option_list = BaseCommand.option_list + (
+        make_option('-e', '--egographs', action='store_true', default=False,
+            help='Also cache egograph JSON for all people with profiles'),
+    )
+
+    #: group_people_js variants used by the site, as parameters for
+    #: :meth:`~belfast.network.views.group_people_json`
+    group_people_variants = [
+        {'mode': 'egograph', 'output': 'full', 'degree': 1},
+        {'mode': 'egograph', 'output': 'adjacency', 'degree': 1},
+        {'mode': 'egograph', 'output': 'full', 'degree': 2},
+        {'mode': 'egograph', 'output': 'adjacency', 'degree': 2},
+        {'mode': 'groupsheet-model', 'output': 'full'},
+        {'mode': 'groupsheet-model', 'output': 'adjacency'},
+    ]
+
+    def handle(self, *args, **options):
+        verbosity = int(options['verbosity'])
+        backend = get_backend()
+        if backend is None:
+            self.stdout.write('Network JSON cache is disabled; nothing to do')
+            return
+
+        start = time.time()
+        count = 0
+        for params in self.group_people_variants:
+            cached_json(group_people_json, 'group_people_js', **params)
+            count += 1
+            if verbosity > self.v_normal:
+                self.stdout.write('Cached group_people_js %s' % params)
+
+        if options['egographs']:
+            for person in profile_people():
+                cached_json(egograph_json, 'egograph_js',
+                            uri=unicode(person.identifier))
+                count += 1
+                if verbosity > self.v_normal:
+                    self.stdout.write('Cached egograph_js %s' % person.identifier)
+
+        # remove cached files for previous versions of the data
+        if isinstance(backend, FileBackend):
+            backend.clear(keep=data_version())
+
+        if verbosity >= self.v_normal:
+            self.stdout.write('Cached %d network JSON response(s) in %.1f seconds' % \
+                              (count, time.time() - start))
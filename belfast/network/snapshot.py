@@ -0,0 +1,207 @@
+'''Compact binary snapshots of the network graph data, generated from the
+GEXF files by the data prep process.
+
+Parsing a GEXF file is slow, so rather than parsing the XML in every web
+server process, the network is stored as array-backed node and edge
+tables with all node identifiers, labels, and other attribute values
+interned in a single string table (see :mod:`belfast.arrayfile`).
+Snapshot files are memory-mapped, and a :mod:`networkx` graph can be
+rebuilt from them much more quickly than parsing the GEXF file; each
+process still builds its own copy of the graph.
+'''
+
+import logging
+import math
+import numbers
+import os
+
+import networkx as nx
+import numpy
+
+from belfast.arrayfile import write_arrays, ArrayFile, StringTable
+
+
+logger = logging.getLogger(__name__)
+
+
+#: file extension for network snapshot files
+SNAPSHOT_EXTENSION = '.nxsnap'
+
+#: supported networkx graph classes, by name
+GRAPH_TYPES = dict((cls.__name__, cls) for cls in
+                   [nx.Graph, nx.DiGraph, nx.MultiGraph, nx.MultiDiGraph])
+
+
+def snapshot_path(gexf_path):
+    '''Path for the network snapshot corresponding to a GEXF file.'''
+    return os.path.splitext(gexf_path)[0] + SNAPSHOT_EXTENSION
+
+
+def _columns(items, strings):
+    # convert a list of attribute dictionaries into typed columns:
+    # numeric attributes as float arrays (NaN when missing), everything
+    # else as indexes into the string table (-1 when missing)
+    keys = set()
+    for data in items:
+        keys.update(data.keys())
+
+    columns = {}
+    info = {}
+    for key in sorted(keys):
+        values = [data.get(key) for data in items]
+        present = [v for v in values if v is not None]
+        if any(isinstance(v, (dict, list, tuple, set)) for v in present):
+            logger.warn('Skipping non-scalar attribute %s in network snapshot',
+                        key)
+            continue
+        numeric = all(isinstance(v, numbers.Number) and not isinstance(v, bool)
+                      for v in present)
+        if numeric:
+            columns[key] = numpy.array([numpy.nan if v is None else v
+                                        for v in values], dtype=numpy.float64)
+            info[key] = 'int' if all(isinstance(v, (int, long))
+                                     for v in present) else 'float'
+        else:
+            columns[key] = numpy.array([-1 if v is None else strings(v)
+                                        for v in values], dtype=numpy.int32)
+            info[key] = 'bool' if all(isinstance(v, bool) for v in present) \
+                else 'str'
+    return columns, info
+
+
+def write_snapshot(graph, filename):
+    '''Write a :mod:`networkx` graph to a network snapshot file.
+
+    :param graph: :class:`networkx.Graph` or one of its subclasses
+    :param filename: path for the snapshot file
+    '''
+    # intern all strings
+    string_index = {}
+    string_list = []
+
+    def strings(value):
+        value = unicode(value)
+        if value not in string_index:
+            string_index[value] = len(string_list)
+            string_list.append(value)
+        return string_index[value]
+
+    nodes = graph.nodes()
+    node_index = dict((n, i) for i, n in enumerate(nodes))
+    node_ids = numpy.array([strings(n) for n in nodes], dtype=numpy.int32)
+    node_columns, node_info = _columns([graph.node[n] for n in nodes], strings)
+
+    multigraph = graph.is_multigraph()
+    if multigraph:
+        edges = graph.edges(keys=True, data=True)
+        edge_keys = numpy.array([strings(k) for u, v, k, d in edges],
+                                dtype=numpy.int32)
+        edges = [(u, v, d) for u, v, k, d in edges]
+    else:
+        edges = graph.edges(data=True)
+    sources = numpy.array([node_index[u] for u, v, d in edges], dtype=numpy.int32)
+    targets = numpy.array([node_index[v] for u, v, d in edges], dtype=numpy.int32)
+    edge_columns, edge_info = _columns([d for u, v, d in edges], strings)
+
+    string_data, string_offsets = StringTable.build(string_list)
+    arrays = {
+        'strings.data': string_data,
+        'strings.offsets': string_offsets,
+        'nodes.id': node_ids,
+        'edges.source': sources,
+        'edges.target': targets,
+    }
+    if multigraph:
+        arrays['edges.key'] = edge_keys
+    for key, column in node_columns.iteritems():
+        arrays['nodes.attr.%s' % key] = column
+    for key, column in edge_columns.iteritems():
+        arrays['edges.attr.%s' % key] = column
+
+    meta = {
+        'graph_type': type(graph).__name__ if type(graph).__name__ in GRAPH_TYPES \
+            else ('MultiDiGraph' if multigraph else 'Graph'),
+        'graph': dict((k, v) for k, v in graph.graph.iteritems()
+                      if isinstance(v, (basestring, numbers.Number))),
+        'node_attributes': node_info,
+        'edge_attributes': edge_info,
+    }
+    write_arrays(filename, arrays, meta)
+    logger.debug('Wrote network snapshot with %d nodes, %d edges to %s',
+                 len(nodes), len(edges), filename)
+
+
+class NetworkSnapshot(object):
+    '''Read-only access to a network snapshot file written by
+    :meth:`write_snapshot`.  Node and edge tables are available as
+    memory-mapped arrays; use :meth:`to_networkx` to generate a
+    :mod:`networkx` graph.
+
+    :param filename: path to the snapshot file
+    '''
+
+    def __init__(self, filename):
+        self.arrays = ArrayFile(filename)
+        self.meta = self.arrays.meta
+        #: modification time of the snapshot file when it was loaded
+        self.mtime = self.arrays.mtime
+        #: string table
+        self.strings = StringTable(self.arrays['strings.data'],
+                                   self.arrays['strings.offsets'])
+        #: edge sources and targets, as arrays of node indexes
+        self.sources = self.arrays['edges.source']
+        self.targets = self.arrays['edges.target']
+        self._node_ids = None
+
+    @property
+    def node_ids(self):
+        'list of node identifiers, in node index order'
+        if self._node_ids is None:
+            self._node_ids = [self.strings[i] for i in self.arrays['nodes.id']]
+        return self._node_ids
+
+    def number_of_nodes(self):
+        return len(self.arrays['nodes.id'])
+
+    def number_of_edges(self):
+        return len(self.sources)
+
+    def _attributes(self, prefix, info, count):
+        # decode typed attribute columns into a list of dictionaries
+        items = [{} for i in range(count)]
+        for key, kind in info.iteritems():
+            column = self.arrays['%s%s' % (prefix, key)]
+            for i, value in enumerate(column.tolist()):
+                if kind in ('int', 'float'):
+                    if math.isnan(value):
+                        continue
+                    items[i][key] = int(value) if kind == 'int' else value
+                elif value >= 0:
+                    value = self.strings[value]
+                    items[i][key] = value == 'True' if kind == 'bool' else value
+        return items
+
+    def to_networkx(self):
+        '''Generate a new :mod:`networkx` graph from the snapshot data.'''
+        graph = GRAPH_TYPES[self.meta['graph_type']]()
+        graph.graph.update(self.meta.get('graph', {}))
+        node_ids = self.node_ids
+        node_data = self._attributes('nodes.attr.', self.meta['node_attributes'],
+                                     len(node_ids))
+        graph.add_nodes_from(zip(node_ids, node_data))
+
+        edge_data = self._attributes('edges.attr.', self.meta['edge_attributes'],
+                                     self.number_of_edges())
+        sources = self.sources.tolist()
+        targets = self.targets.tolist()
+        if graph.is_multigraph():
+            keys = [self.strings[k] for k in self.arrays['edges.key']]
+            graph.add_edges_from((node_ids[u], node_ids[v], k, d) for u, v, k, d
+                                 in zip(sources, targets, keys, edge_data))
+        else:
+            graph.add_edges_from((node_ids[u], node_ids[v], d) for u, v, d
+                                 in zip(sources, targets, edge_data))
+        return graph
+
+    def close(self):
+        self.arrays.close()
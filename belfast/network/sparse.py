@@ -0,0 +1,147 @@
+'''Sparse matrix representation of a network graph, for calculating
+degree and eigenvector centrality and generating adjacency matrix data
+with vectorized :mod:`numpy` operations rather than iterating over the
+:mod:`networkx` dict-of-dicts structure.
+
+The adjacency matrix is stored in compressed sparse row (CSR) form using
+plain :mod:`numpy` arrays (scipy is not required).  Parallel edges in
+multigraphs are combined by summing their weights, and undirected edges
+are stored in both directions, matching :meth:`networkx.to_numpy_matrix`.
+'''
+
+import json
+
+import networkx as nx
+import numpy
+
+
+def _bincount(values, size, weights=None):
+    # count (or sum weights) of values in the range 0 to size
+    if size == 0:
+        return numpy.zeros(0, dtype=numpy.int64)
+    return numpy.bincount(values, weights=weights, minlength=size)
+
+
+class SparseGraph(object):
+    '''Compressed sparse row adjacency matrix for a :mod:`networkx` graph.
+    Rows and columns are in the order of :meth:`networkx.Graph.nodes`,
+    which is also the node order used by
+    :meth:`networkx.readwrite.json_graph.node_link_data`.
+
+    :param graph: :class:`networkx.graph.Graph` or subclass
+    :param weight: edge attribute to use as the edge weight; edges without
+        it have a weight of 1
+    '''
+
+    def __init__(self, graph, weight='weight'):
+        self.nodes = graph.nodes()
+        self.directed = graph.is_directed()
+        size = len(self.nodes)
+        index = dict((n, i) for i, n in enumerate(self.nodes))
+
+        edges = graph.edges(data=True)
+        sources = numpy.fromiter((index[u] for u, v, d in edges),
+                                 dtype=numpy.int64, count=len(edges))
+        targets = numpy.fromiter((index[v] for u, v, d in edges),
+                                 dtype=numpy.int64, count=len(edges))
+        weights = numpy.fromiter((d.get(weight, 1) for u, v, d in edges),
+                                 dtype=numpy.float64, count=len(edges))
+
+        # degree counts edges, not weights (self-loops count twice)
+        if self.directed:
+            self.in_degrees = _bincount(targets, size)
+            self.out_degrees = _bincount(sources, size)
+            self.degrees = self.in_degrees + self.out_degrees
+        else:
+            self.in_degrees = self.out_degrees = None
+            self.degrees = _bincount(sources, size) + \
+                _bincount(targets, size)
+
+        if not self.directed:
+            # store undirected edges in both directions; self-loops once
+            mirror = sources != targets
+            sources, targets = numpy.concatenate([sources, targets[mirror]]), \
+                numpy.concatenate([targets, sources[mirror]])
+            weights = numpy.concatenate([weights, weights[mirror]])
+
+        # sort by row and column and sum duplicate (parallel) edges
+        order = numpy.lexsort((targets, sources))
+        sources, targets, weights = sources[order], targets[order], weights[order]
+        if len(sources):
+            first = numpy.ones(len(sources), dtype=bool)
+            first[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+            starts = numpy.flatnonzero(first)
+            weights = numpy.add.reduceat(weights, starts)
+            sources, targets = sources[starts], targets[starts]
+
+        #: column index for each stored value
+        self.indices = targets
+        #: stored values (edge weights)
+        self.data = weights
+        #: row index for each stored value
+        self.rows = sources
+        #: start offset of each row in :attr:`indices` and :attr:`data`
+        self.indptr = numpy.zeros(size + 1, dtype=numpy.int64)
+        numpy.cumsum(_bincount(sources, size),
+                     out=self.indptr[1:])
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def _by_node(self, values):
+        return dict(zip(self.nodes, values.tolist()))
+
+    def degree(self):
+        'dictionary of degree by node'
+        return self._by_node(self.degrees)
+
+    def in_degree(self):
+        'dictionary of in degree by node (directed graphs only)'
+        return self._by_node(self.in_degrees)
+
+    def out_degree(self):
+        'dictionary of out degree by node (directed graphs only)'
+        return self._by_node(self.out_degrees)
+
+    def eigenvector_centrality(self, max_iter=100, tol=1.0e-6):
+        '''Eigenvector centrality by power iteration, using the same
+        starting vector, normalization, and convergence test as
+        :meth:`networkx.eigenvector_centrality`.
+
+        :raises: :class:`networkx.NetworkXError` if power iteration does
+            not converge within **max_iter** iterations
+        '''
+        size = len(self.nodes)
+        if size == 0:
+            raise nx.NetworkXException('Empty graph.')
+        x = numpy.ones(size) / size
+        for i in range(max_iter):
+            xlast = x
+            # x = A^T x: each node receives the score of its in-neighbors
+            x = _bincount(self.indices, size,
+                          weights=xlast[self.rows] * self.data)
+            norm = numpy.sqrt((x ** 2).sum())
+            if norm:
+                x = x / norm
+            if numpy.abs(x - xlast).sum() < size * tol:
+                return self._by_node(x)
+        raise nx.NetworkXError('eigenvector_centrality(): power iteration ' +
+                               'failed to converge in %d iterations.' % (i + 1))
+
+    def adjacency_json(self):
+        '''Adjacency matrix as a JSON list of lists, for generating a chord
+        diagram.  Generated directly from the sparse data, one row at a
+        time, without creating a dense matrix; output is the same as
+        serializing :meth:`networkx.to_numpy_matrix` as a list.'''
+        size = len(self.nodes)
+        zeros = [json.dumps(0.0)] * size
+        indptr = self.indptr.tolist()
+        indices = self.indices.tolist()
+        data = self.data.tolist()
+        rows = []
+        for i in range(size):
+            row = list(zeros)
+            for j in range(indptr[i], indptr[i + 1]):
+                row[indices[j]] = json.dumps(data[j])
+            rows.append('[%s]' % ', '.join(row))
+        return '[%s]' % ', '.join(rows)
@@ -5,7 +5,34 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.urlresolvers import reverse
 from django.test import TestCase
+from django.test.utils import override_settings
+from mock import patch, Mock
+import networkx as nx
+import rdflib
+from networkx.readwrite import gexf
+
+from belfast.network import cache
+from belfast.network.cache import cached_json, cache_key, MemoryBackend, \
+    FileBackend
+from belfast.network.centrality import write_centrality, centrality_path, \
+    centrality_table, CentralityTable, precompute_centrality, \
+    centrality_measures
+from belfast.network.connections import node_connections, \
+    write_connections, connections_path, connection_index, ConnectionIndex
+from belfast.network.egograph import EgoGraphIndex, ego_graph_index
+from belfast.network.sparse import SparseGraph
+from belfast.network.snapshot import write_snapshot, snapshot_path, \
+    NetworkSnapshot
+from belfast.network.util import annotate_graph
+from belfast.util import network_data
 
 
 class SimpleTest(TestCase):
@@ -14,3 +41,412 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class NetworkSnapshotTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='belfast-nx-')
+        self.network = nx.MultiDiGraph()
+        self.network.add_node(u'http://example.com/people/heaney-seamus/',
+                              label=u'Seamus Heaney', type='Person')
+        self.network.add_node(u'http://example.com/groups/belfast/',
+                              label=u'Belfast Group', type='Organization')
+        self.network.add_node(u'http://dbpedia.org/resource/Bellagh\xe9')
+        self.network.add_edge(u'http://example.com/people/heaney-seamus/',
+                              u'http://example.com/groups/belfast/',
+                              label='member', weight=5)
+        self.network.add_edge(u'http://example.com/people/heaney-seamus/',
+                              u'http://example.com/groups/belfast/',
+                              label='knows', weight=2.5)
+        self.gexf_file = os.path.join(self.tmpdir, 'test.gexf')
+        gexf.write_gexf(self.network, self.gexf_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_round_trip(self):
+        filename = snapshot_path(self.gexf_file)
+        self.assertEqual(os.path.join(self.tmpdir, 'test.nxsnap'), filename)
+        write_snapshot(self.network, filename)
+        snapshot = NetworkSnapshot(filename)
+        self.assertEqual(3, snapshot.number_of_nodes())
+        self.assertEqual(2, snapshot.number_of_edges())
+
+        graph = snapshot.to_networkx()
+        self.assert_(isinstance(graph, nx.MultiDiGraph))
+        self.assertEqual(sorted(self.network.nodes()), sorted(graph.nodes()))
+        for node, data in self.network.nodes(data=True):
+            self.assertEqual(data, graph.node[node])
+        edges = graph.get_edge_data(u'http://example.com/people/heaney-seamus/',
+                                    u'http://example.com/groups/belfast/')
+        self.assertEqual(set([('member', 5), ('knows', 2.5)]),
+                         set((e['label'], e['weight']) for e in edges.values()))
+        self.assert_(isinstance(edges.values()[0]['label'], unicode))
+
+        # undirected graph
+        write_snapshot(nx.Graph(self.network), filename)
+        graph = NetworkSnapshot(filename).to_networkx()
+        self.assert_(isinstance(graph, nx.Graph))
+        self.assertEqual(1, graph.number_of_edges())
+
+    def test_network_data(self):
+        with override_settings(GEXF_DATA={'test': self.gexf_file}):
+            # no snapshot: loaded from gexf
+            graph = network_data('test')
+            self.assertEqual(3, graph.number_of_nodes())
+            # shared until the data changes
+            self.assert_(graph is network_data('test'))
+
+            # snapshot is used when available
+            self.network.add_node(u'http://example.com/people/longley-michael/')
+            write_snapshot(self.network, snapshot_path(self.gexf_file))
+            self.assertEqual(4, network_data('test').number_of_nodes())
+
+            # reloaded when modified
+            self.network.add_node(u'http://example.com/people/mahon-derek/')
+            write_snapshot(self.network, snapshot_path(self.gexf_file))
+            mtime = time.time() + 10
+            os.utime(snapshot_path(self.gexf_file), (mtime, mtime))
+            self.assertEqual(5, network_data('test').number_of_nodes())
+
+            # gexf is used if it has been updated since the snapshot
+            gexf.write_gexf(nx.MultiDiGraph(), self.gexf_file)
+            mtime += 10
+            os.utime(self.gexf_file, (mtime, mtime))
+            self.assertEqual(0, network_data('test').number_of_nodes())
+
+
+class NetworkJsonCacheTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='belfast-nxcache-')
+        # reset configured backend between tests
+        cache._BACKEND = None
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        cache._BACKEND = None
+
+    def test_cache_key(self):
+        self.assertEqual(cache_key('group_people_js', mode='egograph', degree=1),
+                         cache_key('group_people_js', degree=1, mode='egograph'))
+        self.assertNotEqual(cache_key('group_people_js', mode='egograph', degree=1),
+                            cache_key('group_people_js', mode='egograph', degree=2))
+        self.assertNotEqual(cache_key('full_js', mode='full'),
+                            cache_key('group_people_js', mode='full'))
+
+    def test_memory_backend(self):
+        backend = MemoryBackend()
+        self.assertEqual(None, backend.get('key', 'v1'))
+        backend.set('key', 'v1', '[1]')
+        self.assertEqual('[1]', backend.get('key', 'v1'))
+        self.assertEqual(None, backend.get('key', 'v2'))
+        # content for the old version is discarded
+        backend.set('other', 'v2', '[2]')
+        self.assertEqual(None, backend.get('key', 'v1'))
+        self.assertEqual('[2]', backend.get('other', 'v2'))
+
+    def test_file_backend(self):
+        backend = FileBackend(self.tmpdir)
+        self.assertEqual(None, backend.get('key', 'v1'))
+        backend.set('key', 'v1', '[1]')
+        backend.set('key', 'v2', '[2]')
+        self.assertEqual('[1]', backend.get('key', 'v1'))
+        self.assertEqual('[2]', backend.get('key', 'v2'))
+        backend.clear(keep='v2')
+        self.assertEqual(['v2'], os.listdir(self.tmpdir))
+        self.assertEqual(None, backend.get('key', 'v1'))
+        self.assertEqual('[2]', backend.get('key', 'v2'))
+
+    @patch('belfast.network.cache.data_version')
+    def test_cached_json(self, mockversion):
+        generate = Mock(return_value='{}')
+        mockversion.return_value = 'v1'
+        with override_settings(NETWORK_JSON_CACHE={'backend': 'file',
+                                                   'location': self.tmpdir}):
+            self.assertEqual('{}', cached_json(generate, 'test', mode='full'))
+            generate.assert_called_once_with(mode='full')
+            # second request is served from the cache
+            self.assertEqual('{}', cached_json(generate, 'test', mode='full'))
+            self.assertEqual(1, generate.call_count)
+            # different parameters are generated separately
+            cached_json(generate, 'test', mode='adjacency')
+            self.assertEqual(2, generate.call_count)
+
+            # new data version invalidates cached content
+            mockversion.return_value = 'v2'
+            cached_json(generate, 'test', mode='full')
+            self.assertEqual(3, generate.call_count)
+
+        cache._BACKEND = None
+        with override_settings(NETWORK_JSON_CACHE=None):
+            cached_json(generate, 'test', mode='full')
+            cached_json(generate, 'test', mode='full')
+            self.assertEqual(5, generate.call_count)
+
+
+class NetworkViewsTest(TestCase):
+
+    @patch('belfast.network.views.cached_json')
+    @patch('belfast.network.views.network_data')
+    def test_full_js_min_degree(self, mocknetwork, mockcached):
+        network = nx.MultiDiGraph()
+        network.add_edges_from([('a', 'b'), ('a', 'c'), ('a', 'd')])
+        network.add_node('sheet', type='BelfastGroupSheet')
+        mocknetwork.return_value = network
+        mockcached.return_value = '{}'
+        url = reverse('network:js', kwargs={'mode': 'full'})
+
+        # max degree 3, plus one possible group edge per groupsheet
+        for value, expected in [('3', 3), ('1000', 5), ('1', None),
+                                ('-4', None), ('bogus', None), ('', None)]:
+            response = self.client.get(url, {'min_degree': value})
+            self.assertEqual(200, response.status_code)
+            args, kwargs = mockcached.call_args
+            self.assertEqual(expected, kwargs['min_degree'],
+                             'min_degree %r should be used as %r' % (value, expected))
+
+
+class CentralityTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='belfast-centrality-')
+        self.network = nx.DiGraph()
+        self.network.add_edges_from([(u'heaney', u'group'), (u'longley', u'group'),
+                                     (u'mahon', u'group'), (u'heaney', u'longley'),
+                                     (u'group', u'hobsbaum')])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_write_centrality(self):
+        filename = os.path.join(self.tmpdir, 'test.nxcent')
+        meta = write_centrality(self.network, filename)
+        self.assertEqual(5, meta['nodes'])
+        self.assertEqual(None, meta['betweenness_samples'])
+
+        table = CentralityTable(filename)
+        self.assert_(table.matches(self.network))
+        self.assert_('betweenness_centrality' in table)
+        self.assertEqual(self.network.degree(), table['degree'])
+        self.assertEqual(self.network.in_degree(), table['in_degree'])
+        between = nx.betweenness_centrality(self.network)
+        for node, value in between.iteritems():
+            self.assertAlmostEqual(value, table['betweenness_centrality'][node])
+
+        # different graph does not match
+        graph = self.network.copy()
+        graph.add_edge(u'mahon', u'heaney')
+        self.assertFalse(table.matches(graph))
+
+        # approximate betweenness for graphs larger than the sample size
+        meta = write_centrality(self.network, filename, betweenness_samples=3)
+        self.assertEqual(3, meta['betweenness_samples'])
+
+    @patch('belfast.network.util.centrality_measures')
+    def test_annotate_graph(self, mockmeasures):
+        fields = ['degree', 'in_degree', 'betweenness_centrality']
+        with override_settings(NETWORK_CENTRALITY_DIR=self.tmpdir):
+            self.assertEqual(None, centrality_table('test'))
+            precompute_centrality({'test': self.network})
+            self.assert_(os.path.exists(centrality_path('test')))
+
+            # stored values are used when the table matches
+            graph = annotate_graph(self.network.copy(), fields=fields,
+                                   variant='test')
+            self.assertEqual(0, mockmeasures.call_count)
+            self.assertEqual(4, graph.node[u'group']['degree'])
+            self.assertEqual(3, graph.node[u'group']['in_degree'])
+            self.assert_(graph.node[u'group']['betweenness'] > 0)
+
+            # calculated when the graph doesn't match the table
+            mockmeasures.return_value = {}
+            graph = self.network.copy()
+            graph.remove_node(u'hobsbaum')
+            annotate_graph(graph, fields=fields, variant='test')
+            mockmeasures.assert_called_with(graph, fields)
+
+
+class SparseGraphTest(TestCase):
+
+    def setUp(self):
+        self.network = nx.MultiDiGraph()
+        self.network.add_edges_from([(u'heaney', u'group'), (u'longley', u'group'),
+                                     (u'mahon', u'group'), (u'heaney', u'longley'),
+                                     (u'group', u'heaney'), (u'group', u'hobsbaum')])
+        self.network.add_edge(u'heaney', u'group', weight=3)
+        self.network.add_node(u'carson')
+
+    def test_degree(self):
+        sparse = SparseGraph(self.network)
+        self.assertEqual(6, len(sparse))
+        self.assertEqual(self.network.degree(), sparse.degree())
+        self.assertEqual(self.network.in_degree(), sparse.in_degree())
+        self.assertEqual(self.network.out_degree(), sparse.out_degree())
+
+        graph = self.network.to_undirected()
+        graph.add_edge(u'carson', u'carson')
+        self.assertEqual(graph.degree(), SparseGraph(graph).degree())
+
+    def test_eigenvector_centrality(self):
+        graph = nx.Graph(self.network)
+        expected = nx.eigenvector_centrality(graph)
+        result = SparseGraph(graph).eigenvector_centrality()
+        for node, value in expected.iteritems():
+            self.assertAlmostEqual(value, result[node], places=4)
+
+        # failure to converge raises the same error as networkx
+        self.assertRaises(nx.NetworkXError,
+                          SparseGraph(graph).eigenvector_centrality, max_iter=1)
+
+    def test_multigraph_eigenvector_centrality(self):
+        # parallel edges (heaney -> group, with different weights) are
+        # collapsed as networkx does, not summed
+        fields = ['eigenvector_centrality']
+        for graph, collapsed in [(self.network, nx.DiGraph(self.network)),
+                                 (self.network.to_undirected(),
+                                  nx.Graph(self.network.to_undirected()))]:
+            self.assert_(graph.is_multigraph())
+            expected = nx.eigenvector_centrality(collapsed)
+            result = centrality_measures(graph, fields=fields)['eigenvector_centrality']
+            for node, value in expected.iteritems():
+                self.assertAlmostEqual(value, result[node], places=4)
+
+    def test_adjacency_json(self):
+        for graph in [self.network, nx.DiGraph(self.network),
+                      self.network.to_undirected()]:
+            self.assertEqual(json.dumps(nx.to_numpy_matrix(graph).tolist()),
+                             SparseGraph(graph).adjacency_json())
+        self.assertEqual('[]', SparseGraph(nx.Graph()).adjacency_json())
+
+
+class EgoGraphTest(TestCase):
+
+    def setUp(self):
+        self.network = nx.MultiDiGraph()
+        for node, nodetype in [(u'heaney', 'Person'), (u'longley', 'Person'),
+                               (u'mahon', 'Person'), (u'group', 'Organization'),
+                               (u'belfast', 'Place'), (u'hobsbaum', 'Person')]:
+            self.network.add_node(node, type=nodetype, label=node.title())
+        self.network.add_edge(u'heaney', u'group', key=0, label='member')
+        self.network.add_edge(u'group', u'heaney', key=0, label='member')
+        self.network.add_edge(u'heaney', u'group', key=1, label='knows')
+        self.network.add_edge(u'longley', u'group', label='member')
+        self.network.add_edge(u'heaney', u'belfast', label='livedIn')
+        self.network.add_edge(u'belfast', u'mahon', label='birthPlace')
+        self.network.add_edge(u'hobsbaum', u'longley', label='knows', weight=2)
+
+    def nx_ego_graph(self, node, radius, types=None):
+        # ego graph generated by copying and filtering the full network
+        undirected = self.network.to_undirected()
+        if types is not None:
+            for n in undirected.nodes():
+                if undirected.node[n].get('type') not in types:
+                    undirected.remove_node(n)
+        return nx.ego_graph(undirected, node, radius=radius)
+
+    def assertSameGraph(self, expected, graph):
+        self.assertEqual(type(expected), type(graph))
+        self.assertEqual(sorted(expected.nodes(data=True)),
+                         sorted(graph.nodes(data=True)))
+        # undirected edges may be reported in either direction
+        edges = lambda g: sorted((tuple(sorted([u, v])), k, d)
+                                 for u, v, k, d in g.edges(keys=True, data=True))
+        self.assertEqual(edges(expected), edges(graph))
+
+    def test_ego_graph(self):
+        index = EgoGraphIndex(self.network)
+        self.assert_(u'belfast' in index)
+        self.assertEqual(set([u'heaney', u'group', u'belfast']),
+                         index.neighborhood(u'heaney'))
+        for radius in [1, 2]:
+            for node in [u'heaney', u'hobsbaum']:
+                self.assertSameGraph(self.nx_ego_graph(node, radius),
+                                     index.ego_graph(node, radius))
+
+        types = ['Person', 'Organization']
+        index = EgoGraphIndex(self.network, types)
+        self.assertFalse(u'belfast' in index)
+        self.assertSameGraph(self.nx_ego_graph(u'heaney', 2, types),
+                             index.ego_graph(u'heaney', 2))
+        self.assertRaises(KeyError, index.ego_graph, u'belfast')
+
+        # ego graph can be modified without changing the network
+        eg = index.ego_graph(u'heaney')
+        eg.node[u'heaney']['degree'] = 3
+        eg.remove_node(u'group')
+        self.assert_('degree' not in self.network.node[u'heaney'])
+        self.assert_(self.network.has_edge(u'heaney', u'group'))
+
+    @patch('belfast.network.egograph.network_data')
+    def test_ego_graph_index(self, mocknetwork):
+        mocknetwork.return_value = self.network
+        index = ego_graph_index(['Person'])
+        self.assert_(index is ego_graph_index(['Person']))
+        self.assert_(index is not ego_graph_index())
+        # rebuilt when the network is reloaded
+        mocknetwork.return_value = self.network.copy()
+        self.assert_(index is not ego_graph_index(['Person']))
+
+
+class ConnectionIndexTest(TestCase):
+    heaney = u'http://example.com/people/heaney-seamus/'
+    longley = u'http://example.com/people/longley-michael/'
+    group = u'http://example.com/groups/belfast/'
+    place = u'http://example.com/places/belfast/'
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='belfast-conn-')
+        self.network = nx.MultiDiGraph()
+        self.network.add_edge(self.heaney, self.group, label='member')
+        self.network.add_edge(self.heaney, self.longley, label='knows', weight=2)
+        self.network.add_edge(self.longley, self.heaney, label='correspondedWith',
+                              weight=3)
+        self.network.add_edge(self.heaney, self.place)  # no label
+        self.network.add_edge(self.heaney, self.heaney, label='knows')
+
+        self.rdfgraph = rdflib.Graph()
+        schema = rdflib.Namespace('http://schema.org/')
+        for uri, rdftype in [(self.heaney, schema.Person),
+                             (self.longley, schema.Person),
+                             (self.group, schema.Organization),
+                             (self.place, schema.Place)]:
+            self.rdfgraph.add((rdflib.URIRef(uri), rdflib.RDF.type, rdftype))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_node_connections(self):
+        conns = node_connections(self.network, self.heaney)
+        self.assertEqual([
+            (self.longley, set(['correspondedWith']), 5),
+            (self.group, set(['member']), 1),
+            (self.place, set(), 0)], conns)
+        self.assertEqual([(self.heaney, set(['member']), 1)],
+                         node_connections(self.network, self.group))
+
+    def test_connection_index(self):
+        gexf_file = os.path.join(self.tmpdir, 'test.gexf')
+        filename = connections_path(gexf_file)
+        self.assertEqual(os.path.join(self.tmpdir, 'test.nxconn'), filename)
+        write_connections(self.network, self.rdfgraph, filename)
+
+        index = ConnectionIndex(filename)
+        self.assert_(index.matches(self.network))
+        self.assert_(self.heaney in index)
+        self.assertEqual([], index.connections(u'http://example.com/unknown'))
+        conns = index.connections(self.heaney)
+        expected = node_connections(self.network, self.heaney)
+        self.assertEqual(expected, [c[:3] for c in conns])
+        self.assertEqual(set([u'http://schema.org/Person']), conns[0][3])
+
+        with override_settings(GEXF_DATA={'full': gexf_file}):
+            with patch('belfast.network.connections.network_data') as mocknetwork:
+                mocknetwork.return_value = self.network
+                self.assert_(isinstance(connection_index(), ConnectionIndex))
+                # index is not used when network data has changed
+                network = self.network.copy()
+                network.add_edge(self.group, self.place)
+                mocknetwork.return_value = network
+                self.assertEqual(None, connection_index())
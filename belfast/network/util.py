@@ -1,62 +1,47 @@
 import logging
-import networkx as nx
+
+from belfast.network.centrality import centrality_table, \
+    centrality_measures
 
 
 logger = logging.getLogger(__name__)
 
-def annotate_graph(graph, fields=[]):
+def annotate_graph(graph, fields=[], variant=None):
     '''Annotate a :mod:`networkx` graph with network information.
 
     :param graph: :class:`networkx.graph.Graph` or subclass
     :param fields: list of fields to be added to the nodes in the graph;
         can include any of: degree, in_degree, out_degree,
         betweenness_centrality, eigenvector_centrality
+    :param variant: optional name of the graph variant; if precomputed
+        centrality for this variant is available and matches the graph
+        (see :mod:`belfast.network.centrality`), stored values are used
+        instead of calculating them
 
     :returns: a graph with the requested annotations added to each node
         in the graph
     '''
-
-    if 'degree' in fields:
-        degree = graph.degree()
-    # TODO: do we need to check that graph is directional for in/out degree?
-    if 'in_degree' in fields and hasattr(graph, 'in_degree'):
-        in_degree = graph.in_degree()
-    if 'out_degree' in fields and hasattr(graph, 'out_degree'):
-        out_degree = graph.out_degree()
-    if 'betweenness_centrality' in fields:
-        between = nx.algorithms.centrality.betweenness_centrality(graph)
-    if 'eigenvector_centrality' in fields:
-        use_g = graph
-        if isinstance(graph, nx.MultiDiGraph):
-            use_g = nx.DiGraph(graph)
-        elif isinstance(graph, nx.MultiGraph):
-            use_g = nx.Graph(graph)
-
-        # NOTE: for a few graphs in production, eigenvector centrality fails:
-        # "power iteration failed to converge in %d iterations"
-        # (possibly an issue with something in the graph?)
-        # Catch the error and don't include eigenvector centrality in
-        # the graph
-        try:
-            eigenv = nx.algorithms.centrality.eigenvector_centrality(use_g)
-        except nx.NetworkXError as err:
-            logger.warn('Error generating eigenvector centrality: %s' % err)
-            # remove from the list of fields so it will
-            # be skipped below
-            del fields[fields.index('eigenvector_centrality')]
-
+    measures = {}
+    if variant is not None:
+        table = centrality_table(variant)
+        if table is not None and table.matches(graph):
+            for field in fields:
+                if field in table:
+                    measures[field] = table[field]
+            # don't attempt measures that failed during precomputation
+            fields = [f for f in fields if f not in table.unavailable]
+        else:
+            logger.debug('No precomputed centrality for %s graph', variant)
+
+    remaining = [f for f in fields if f not in measures]
+    if remaining:
+        measures.update(centrality_measures(graph, remaining))
 
     for node in graph.nodes():
-        if 'degree' in fields:
-            graph.node[node]['degree'] = degree[node]
-        if 'in_degree' in fields and hasattr(graph, 'in_degree'):
-            graph.node[node]['in_degree']= in_degree[node]
-        if 'out_degree' in fields and hasattr(graph, 'out_degree'):
-            graph.node[node]['out_degree']= out_degree[node]
-        if 'betweenness_centrality' in fields:
-            graph.node[node]['betweenness'] = between[node]
-        if 'eigenvector_centrality' in fields:
-            graph.node[node]['eigenvector_centrality'] = eigenv[node]
+        for field, values in measures.iteritems():
+            # betweenness is stored on the node with a shorter name
+            name = 'betweenness' if field == 'betweenness_centrality' else field
+            graph.node[node][name] = values[node]
 
     return graph
 
@@ -16,6 +16,8 @@ from belfast.util import network_data, rdf_data,  \
 from belfast.rdfns import BELFAST_GROUP_URI
 from belfast.groupsheets.rdfmodels import RdfGroupSheet
 from belfast.people.rdfmodels import RdfOrganization, RdfPerson, find_places
+from belfast.network.cache import cached_json
+from belfast.network.sparse import SparseGraph
 from belfast.network.util import annotate_graph
 
 
@@ -87,6 +89,36 @@ def _network_graph(min_degree=1, **kwargs):
     return graph
 
 
+def group_egograph(degree=1):
+    '''Undirected egograph of people and organizations centered around
+    the Belfast Group.
+
+    :param degree: radius of the egograph, 1 or 2
+    '''
+    extra_opts = {}
+    # NOTE: degree 2 graph is large enough that it *must* be filtered
+    # to be sensible and usable on the webpage;
+    # by trial & error, I found a minimum degree of 5 to be reasonable
+    if degree == 2:
+        extra_opts['min_degree'] = 5
+
+    belfast_group = RdfOrganization(rdf_data(), rdflib.URIRef(BELFAST_GROUP_URI))
+    return belfast_group.ego_graph(radius=degree, types=['Person', 'Organization'],
+                                   **extra_opts)
+
+
+def network_variants():
+    '''Named variants of the network graph displayed on the site, for
+    precomputing centrality measures (see
+    :mod:`belfast.network.centrality`).'''
+    return {
+        'full': _network_graph(),
+        'egograph-1': group_egograph(1),
+        'egograph-2': group_egograph(2),
+        'groupsheet-model': network_data('bg1'),
+    }
+
+
 @last_modified(rdf_nx_lastmod)
 def full_js(request, mode):
     '''Return full network graph data as JSON.  Optionally filter
@@ -108,25 +140,55 @@ def full_js(request, mode):
     '''
 
 
-    # optionally filter by minimum degree
-    min_degree =  request.GET.get('min_degree', None)
+    # optionally filter by minimum degree; limited to the range of
+    # values that give distinct results, since the value is part of
+    # the cache key
+    try:
+        min_degree = int(request.GET.get('min_degree', None))
+    except (TypeError, ValueError):
+        min_degree = None
+    if min_degree is not None:
+        if min_degree <= 1:
+            min_degree = None
+        else:
+            min_degree = min(min_degree, _max_degree() + 1)
+
+    data = cached_json(full_json, 'full_js', mode=mode, min_degree=min_degree)
+    return HttpResponse(data, content_type='application/json')
+
+
+def _max_degree():
+    # upper bound for node degree in the network graph generated by
+    # _network_graph: degree in the network data, plus one edge
+    # to the group for each groupsheet
+    network = network_data()
+    groupsheets = sum(1 for n, data in network.nodes_iter(data=True)
+                      if data.get('type') == 'BelfastGroupSheet')
+    return max(network.degree().values() or [0]) + groupsheets
+
+
+def full_json(mode, min_degree=None):
+    '''Generate full network graph data as JSON for :meth:`full_js`.
+
+    :param mode: full or adjacency
+    :param min_degree: optional minimum degree filter
+    '''
     filter = {}
     if min_degree:
-        filter['min_degree'] = int(min_degree)
+        filter['min_degree'] = min_degree
 
     graph = _network_graph(**filter)
     if mode == 'full':
         graph = annotate_graph(graph, fields=['degree', 'in_degree', 'out_degree',
                                               'betweenness_centrality',
-                                              'eigenvector_centrality'])
+                                              'eigenvector_centrality'],
+                               variant='full')
         # standard nodes & links data
-        data = json_graph.node_link_data(graph)
+        return json.dumps(json_graph.node_link_data(graph))
 
     if mode == 'adjacency':
         # adjacency matrix for generating chord diagram
-        matrix = nx.linalg.graphmatrix.adjacency_matrix(graph)
-        data = matrix.tolist()
-    return HttpResponse(json.dumps(data), content_type='application/json')
+        return SparseGraph(graph).adjacency_json()
 
 
 @last_modified(rdf_nx_lastmod)
@@ -153,7 +215,7 @@ def gexf_content(request, mode):
         # - same data used in :meth:`full_js`
         graph = _network_graph()
     elif mode == 'groupsheets':
-        graph = gexf.read_gexf(settings.GEXF_DATA['bg1'])
+        graph = network_data('bg1')
 
     buf = StringIO()
     gexf.write_gexf(graph, buf)
@@ -229,51 +291,57 @@ def group_people_js(request, mode='egograph', output='full'):
         used for generating chord diagram
     '''
 
+    params = {}
     if mode == 'egograph':
         degree = request.GET.get('degree', 1)
-        extra_opts = {}
         try:
             degree = int(degree)
             # currently only support 1 or 2 degree
             degree = max(1, min(degree, 2))
-            # NOTE: degree 2 graph is large enough that it *must* be filtered
-            # to be sensible and usable on the webpage;
-            # by trial & error, I found a minimum degree of 5 to be reasonable
-            if degree == 2:
-                extra_opts['min_degree'] = 5
         except ValueError:
             # if a value is passed that can't be converted to int, fallback to 1
             degree = 1
+        params['degree'] = degree
+
+    data = cached_json(group_people_json, 'group_people_js', mode=mode,
+                       output=output, **params)
+    return HttpResponse(data, content_type='application/json')
+
 
-        belfast_group = RdfOrganization(network_data().copy(), BELFAST_GROUP_URI)
-        graph = belfast_group.ego_graph(radius=degree, types=['Person', 'Organization'],
-                                        **extra_opts)
+def group_people_json(mode='egograph', output='full', degree=1):
+    '''Generate Belfast Group network graph data as JSON for
+    :meth:`group_people_js`.
 
-        # annotate nodes in graph with degree
+    :param mode: egograph or groupsheet-model
+    :param output: full or adjacency
+    :param degree: degree of the egograph, 1 or 2
+    '''
+    if mode == 'egograph':
+        graph = group_egograph(degree)
         # FIXME: not a directional graph; in/out degree not available
-        graph = annotate_graph(graph,
-            fields=['degree', 'in_degree', 'out_degree',
-                    'betweenness_centrality',
-                    'eigenvector_centrality'])
+        fields = ['degree', 'in_degree', 'out_degree',
+                  'betweenness_centrality', 'eigenvector_centrality']
+        variant = 'egograph-%d' % degree
 
     elif mode == 'groupsheet-model':
-        graph = gexf.read_gexf(settings.GEXF_DATA['bg1'])
-        graph = annotate_graph(graph,
-            fields=['degree', #'in_degree', 'out_degree',
-                   'betweenness_centrality',
-                   'eigenvector_centrality'])
+        graph = network_data('bg1')
+        fields = ['degree', #'in_degree', 'out_degree',
+                  'betweenness_centrality', 'eigenvector_centrality']
+        variant = 'groupsheet-model'
 
-    if output == 'full':
-        data = json_graph.node_link_data(graph)
     if output == 'adjacency':
-        # adjacency matrix for generating chord diagram
-        matrix = nx.convert_matrix.to_numpy_matrix(graph)
-
-        # NOTE: this also works, but as of networx 1.9 requires scipy
-        # matrix = nx.linalg.graphmatrix.adjacency_matrix(graph)
-        data = matrix.tolist()
+        # adjacency matrix for generating chord diagram, generated
+        # from a sparse matrix rather than a dense numpy matrix;
+        # node annotations are not needed
+        return SparseGraph(graph).adjacency_json()
 
-    return HttpResponse(json.dumps(data), content_type='application/json')
+    if output == 'full':
+        if mode == 'groupsheet-model':
+            # copy, since annotation modifies the graph
+            graph = graph.copy()
+        # annotate nodes in graph with degree and centrality
+        graph = annotate_graph(graph, fields=fields, variant=variant)
+        return json.dumps(json_graph.node_link_data(graph))
 
 
 @last_modified(rdf_nx_lastmod)
@@ -290,7 +358,9 @@ def node_info(request):
     if node_id is None:
         raise Http404
     # TODO: better to get from gexf or rdf ?
-    graph = gexf.read_gexf(settings.GEXF_DATA['full'])
+    graph = network_data()
+    if node_id not in graph:
+        raise Http404
     node = graph.node[node_id]
     context = {'node': node}
     if node.get('type', None) == 'Person':
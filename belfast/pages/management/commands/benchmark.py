@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+# script to benchmark data prep stages and views against synthetic data
+
+from optparse import make_option
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from belfast.benchmark import run_benchmarks, compare_results
+
+
+class Command(BaseCommand):
+    '''Benchmark data prep stages and frequently used views against
+    synthetic data at one or more scales of the real dataset size'''
+    help = __doc__
+
+    v_normal = 1
+
+    option_list = BaseCommand.option_list + (
+        make_option('-s', '--scale', type='float', action='append', dest='scales',
+            help='Dataset scale relative to the real data (can be repeated; ' +
+                 'default: 1)'),
+        make_option('-n', '--repeat', type='int', default=5,
+            help='Number of timed calls for each view (default: 5)'),
+        make_option('--seed', type='int', default=0,
+            help='Random seed for generating synthetic data (default: 0)'),
+        make_option('-o', '--output',
+            help='Save results as JSON to the specified file'),
+        make_option('-b', '--baseline',
+            help='Compare with results previously saved with --output'),
+        make_option('-d', '--dir',
+            help='Directory for the generated data (not removed afterwards; ' +
+                 'default: temporary directory)'),
+        make_option('-t', '--threshold', type='float', default=0.2,
+            help='Fraction slower than the baseline to report as a ' +
+                 'regression (default: 0.2)'),
+    )
+
+    def handle(self, *args, **options):
+        verbosity = options['verbosity']
+        baseline = {}
+        if options['baseline']:
+            try:
+                with open(options['baseline']) as infile:
+                    baseline = dict((float(r['scale']), r) for r in json.load(infile))
+            except (IOError, ValueError) as err:
+                raise CommandError('Error loading baseline %s: %s' % \
+                                   (options['baseline'], err))
+
+        results = []
+        regressions = 0
+        for scale in options['scales'] or [1.0]:
+            if verbosity >= self.v_normal:
+                self.stdout.write('-- Benchmarking at %gx scale' % scale)
+            directory = None
+            if options['dir']:
+                directory = os.path.join(options['dir'], 'scale-%g' % scale)
+            result = run_benchmarks(scale=scale, repeat=options['repeat'],
+                                    seed=options['seed'], directory=directory,
+                                    verbosity=max(0, verbosity - 1))
+            results.append(result)
+
+            if verbosity >= self.v_normal:
+                for name in sorted(result['stages']):
+                    self.stdout.write('stage %s: %.3f sec' % \
+                        (name, result['stages'][name]['elapsed']))
+                for name in sorted(result['views']):
+                    timing = result['views'][name]
+                    self.stdout.write('view %s: %.3f sec median (first %.3f sec)' % \
+                        (name, timing['median'], timing['first']))
+
+            if scale in baseline:
+                for name, before, after, regression in \
+                  compare_results(baseline[scale], result, options['threshold']):
+                    if regression:
+                        regressions += 1
+                    if regression or verbosity > self.v_normal:
+                        self.stdout.write('%s%s: %.3f sec (baseline %.3f sec, %+.0f%%)' % \
+                            ('REGRESSION ' if regression else '', name, after,
+                             before, 100 * (after - before) / before if before else 0))
+
+        if options['output']:
+            with open(options['output'], 'w') as outfile:
+                json.dump(results, outfile, indent=1, sort_keys=True)
+
+        if regressions:
+            raise CommandError('%d benchmark%s slower than the baseline' % \
+                (regressions, '' if regressions == 1 else 's'))
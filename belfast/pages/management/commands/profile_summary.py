@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+# script to summarize profiles saved by belfast.profiling.ProfileMiddleware
+
+from optparse import make_option
+import glob
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from belfast.profiling import saved_profile_groups, format_groups
+
+
+class Command(BaseCommand):
+    '''Summarize saved view profiles by view and module group'''
+    help = __doc__
+
+    option_list = BaseCommand.option_list + (
+        make_option('-d', '--dir',
+            help='Profile directory (default: PROFILE_DIR setting)'),
+        make_option('--view', action='append', dest='views',
+            help='Only summarize the specified view (can be repeated)'),
+    )
+
+    def handle(self, *args, **options):
+        profile_dir = options['dir'] or getattr(settings, 'PROFILE_DIR', None)
+        if not profile_dir or not os.path.isdir(profile_dir):
+            raise CommandError('No profile directory specified or configured')
+
+        summaries = {}
+        files = glob.glob(os.path.join(profile_dir, '*.prof')) + \
+            glob.glob(os.path.join(profile_dir, '*.collapsed'))
+        for path in files:
+            try:
+                view, groups = saved_profile_groups(path)
+            except Exception as err:
+                self.stderr.write('Error reading %s: %s' % (path, err))
+                continue
+            if options['views'] and view not in options['views']:
+                continue
+            summary = summaries.setdefault(view, {'requests': 0, 'groups': {}})
+            summary['requests'] += 1
+            for group, seconds in groups.iteritems():
+                summary['groups'][group] = summary['groups'].get(group, 0) + seconds
+
+        # list views with the most profiled time first
+        for view in sorted(summaries, key=lambda v: -sum(summaries[v]['groups'].values())):
+            summary = summaries[view]
+            self.stdout.write('%s (%d profiled request%s)' % \
+                (view, summary['requests'], '' if summary['requests'] == 1 else 's'))
+            self.stdout.write(format_groups(summary['groups']))
@@ -5,7 +5,21 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+import os
+import shutil
+import tempfile
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
 from django.test import TestCase
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+
+from belfast.benchmark import synthetic_rdf, time_call, compare_results
+from belfast.dataversions import DataVersions, validate_version
+from belfast.profiling import module_group, RequestProfile, \
+    ProfileMiddleware, saved_profile_groups, view_summaries
 
 
 class SimpleTest(TestCase):
@@ -14,3 +28,258 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+def slow_view(request):
+    time.sleep(0.05)
+    return HttpResponse('done')
+
+
+class ProfilingTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='belfast-profiles-')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_module_group(self):
+        self.assertEqual('rdflib',
+            module_group('/env/lib/python2.7/site-packages/rdflib/graph.py'))
+        self.assertEqual('django',
+            module_group('/srv/belfast/env/lib/python2.7/site-packages/django/db/utils.py'))
+        self.assertEqual('belfast', module_group('/srv/site/belfast/util.py'))
+        self.assertEqual('other', module_group('/usr/lib/python2.7/json/__init__.py'))
+        self.assertEqual('other', module_group('~'))
+
+    def test_cprofile(self):
+        profile = RequestProfile('cprofile')
+        response = profile.runcall(slow_view, None)
+        self.assertEqual('done', response.content)
+        self.assert_(profile.elapsed >= 0.05)
+        self.assert_('belfast' in profile.groups())
+        self.assert_('slow_view' in profile.report())
+
+        path = profile.save(self.tmpdir, 'belfast.pages.tests.slow_view')
+        self.assert_(path.endswith('.prof'))
+        view, groups = saved_profile_groups(path)
+        self.assertEqual('belfast.pages.tests.slow_view', view)
+        self.assertEqual(set(profile.groups().keys()), set(groups.keys()))
+
+    def test_sample(self):
+        profile = RequestProfile('sample', interval=0.005)
+        profile.runcall(slow_view, None)
+        self.assert_(profile.profiler.samples > 0)
+        self.assert_('slow_view' in profile.profiler.collapsed())
+
+        path = profile.save(self.tmpdir, 'belfast.pages.tests.slow_view')
+        self.assert_(path.endswith('.collapsed'))
+        view, groups = saved_profile_groups(path, interval=0.005)
+        self.assertAlmostEqual(sum(profile.groups().values()),
+                               sum(groups.values()))
+
+    def test_middleware(self):
+        middleware = ProfileMiddleware()
+        factory = RequestFactory()
+
+        # not profiled by default
+        request = factory.get('/')
+        middleware.process_request(request)
+        self.assertEqual(None, middleware.process_view(request, slow_view, [], {}))
+
+        with override_settings(DEBUG=True, PROFILE_DIR=self.tmpdir):
+            request = factory.get('/', HTTP_X_PROFILE='sample')
+            middleware.process_request(request)
+            response = middleware.process_view(request, slow_view, [], {})
+            response = middleware.process_response(request, response)
+            self.assertEqual('done', response.content)
+            self.assert_(os.path.exists(os.path.join(self.tmpdir,
+                                                     response['X-Profile-File'])))
+            self.assert_('belfast.pages.tests.slow_view' in view_summaries())
+
+            # ?prof displays the profile
+            request = factory.get('/', {'prof': ''})
+            middleware.process_request(request)
+            response = middleware.process_view(request, slow_view, [], {})
+            response = middleware.process_response(request, response)
+            self.assert_('slow_view' in response.content)
+
+        # header is ignored when not in debug mode
+        request = factory.get('/', HTTP_X_PROFILE='sample')
+        request.user = None
+        middleware.process_request(request)
+        self.assertEqual(None, request.profiler)
+
+        # ?prof on a randomly sampled request is profiled but not displayed
+        # when not in debug mode
+        with override_settings(DEBUG=False, PROFILE_SAMPLE_RATE=1,
+                               PROFILE_MODE='sample'):
+            request = factory.get('/', {'prof': ''})
+            request.user = None
+            middleware.process_request(request)
+            self.assertNotEqual(None, request.profiler)
+            response = middleware.process_view(request, slow_view, [], {})
+            response = middleware.process_response(request, response)
+            self.assertEqual('done', response.content)
+
+
+class BenchmarkTest(TestCase):
+
+    def test_synthetic_rdf(self):
+        import rdflib
+        from belfast import rdfns
+        graph = rdflib.ConjunctiveGraph()
+        sizes = synthetic_rdf(graph, scale=1, seed=0)
+        self.assertEqual(sizes['groupsheets'],
+            len(list(graph.subjects(rdflib.RDF.type, rdfns.BIBO.Manuscript))))
+        self.assertEqual(sizes['people'],
+            len(set(graph.subjects(rdflib.RDF.type, rdfns.SCHEMA_ORG.Person))))
+        # same data generated for the same seed
+        other = rdflib.ConjunctiveGraph()
+        synthetic_rdf(other, scale=1, seed=0)
+        self.assertEqual(len(graph), len(other))
+
+    def test_time_call(self):
+        calls = []
+        timing = time_call(lambda: calls.append(1), repeat=3)
+        self.assertEqual(4, len(calls))
+        self.assertEqual(3, timing['runs'])
+        self.assert_(timing['min'] <= timing['median'] <= timing['max'])
+
+    def test_compare_results(self):
+        baseline = {'stages': {'smush': {'elapsed': 1.0}},
+                    'views': {'profile': {'median': 0.1},
+                              'map_js': {'median': 0.2}}}
+        current = {'stages': {'smush': {'elapsed': 1.1}},
+                   'views': {'profile': {'median': 0.2},
+                             'node_info': {'median': 0.2}}}
+        comparison = compare_results(baseline, current, threshold=0.2)
+        self.assertEqual([('stage smush', 1.0, 1.1, False),
+                          ('view profile', 0.1, 0.2, True)], comparison)
+
+
+class DataVersionsTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='belfast-dataversions-')
+        self.versions = DataVersions(self.tmpdir, keep=2)
+        self.current = os.path.join(self.tmpdir, 'current')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_create_activate(self):
+        self.assertEqual(None, self.versions.current_version())
+        first = self.versions.create()
+        self.assertEqual([], os.listdir(self.versions.path(first)))
+        # no current version yet
+        self.assertEqual(None, self.versions.current_version())
+
+        os.makedirs(os.path.join(self.versions.path(first), 'rdf.bdb'))
+        for filename in ['rdf.bdb/spo', 'rdf.bdb/__db.001']:
+            with open(os.path.join(self.versions.path(first), filename), 'w') as out:
+                out.write('data')
+        self.versions.activate(first)
+        self.assertEqual(first, self.versions.current_version())
+        self.assert_(os.path.islink(self.current))
+        self.assertEqual(first, os.readlink(self.current),
+                         'current link should be relative')
+
+        # new version copied from current, without environment files
+        second = self.versions.create()
+        self.assertNotEqual(first, second)
+        self.assertEqual(['spo'], os.listdir(os.path.join(self.versions.path(second),
+                                                          'rdf.bdb')))
+        # current is unchanged until the new version is activated
+        self.assertEqual(first, self.versions.current_version())
+        self.versions.activate(second)
+        self.assertEqual(second, self.versions.current_version())
+        self.assertEqual([first, second], self.versions.versions())
+
+        # clear starts from nothing
+        third = self.versions.create(clear=True)
+        self.assertEqual([], os.listdir(self.versions.path(third)))
+
+        self.assertRaises(ValueError, self.versions.activate, 'bogus')
+
+    def test_prune(self):
+        names = ['20140101-000000', '20140102-000000', '20140103-000000',
+                 '20140104-000000']
+        for name in names:
+            os.makedirs(self.versions.path(name))
+        self.assertEqual([], self.versions.prune(), 'nothing pruned with no current version')
+        for name in names[:3]:
+            self.versions.activate(name)
+        self.assertEqual(names[:1], self.versions.prune())
+        # previous and newer versions are kept
+        self.assertEqual(names[1:], self.versions.versions())
+
+        # versions that were never activated (e.g. a failed build) are
+        # not counted as previous versions
+        failed = '20140102-120000'
+        os.makedirs(self.versions.path(failed))
+        self.versions.activate(names[3])
+        self.assertEqual(names[1:2], self.versions.prune())
+        self.assertEqual([failed] + names[2:], self.versions.versions())
+
+    def test_remove(self):
+        first = self.versions.create()
+        self.versions.activate(first)
+        second = self.versions.create()
+        self.assertFalse(self.versions.is_activated(second),
+                         'activation marker should not be copied')
+        self.assertRaises(ValueError, self.versions.remove, first)
+        self.versions.remove(second)
+        self.assertEqual([first], self.versions.versions())
+
+    def test_version_settings(self):
+        rdf_path = os.path.join(self.current, 'rdf.bdb')
+        gexf_data = {'full': os.path.join(self.current, 'gexf', 'full.gexf')}
+        other = os.path.join(self.tmpdir, 'elsewhere', 'prep-state.json')
+        version_dir = self.versions.path('v1')
+
+        self.assertEqual(os.path.join(version_dir, 'rdf.bdb'),
+                         self.versions.versioned_path(rdf_path, 'v1'))
+        self.assertEqual(other, self.versions.versioned_path(other, 'v1'))
+
+        with override_settings(RDF_DATABASE=rdf_path, GEXF_DATA=gexf_data,
+                               GEXF_DATA_DIR=os.path.join(self.current, 'gexf'),
+                               RDF_PREP_STATE=other, RDF_SNAPSHOT=None):
+            values = self.versions.version_settings('v1')
+            self.assertEqual(os.path.join(version_dir, 'rdf.bdb'),
+                             values['RDF_DATABASE'])
+            self.assertEqual(os.path.join(version_dir, 'gexf'),
+                             values['GEXF_DATA_DIR'])
+            self.assertEqual({'full': os.path.join(version_dir, 'gexf', 'full.gexf')},
+                             values['GEXF_DATA'])
+            self.assertEqual(other, values['RDF_PREP_STATE'])
+            self.assert_('RDF_SNAPSHOT' not in values)
+
+        with override_settings(RDF_DATABASE=other, GEXF_DATA=gexf_data):
+            self.assertRaises(ImproperlyConfigured, self.versions.version_settings, 'v1')
+
+    def test_validate_version(self):
+        import rdflib
+        rdf_path = os.path.join(self.tmpdir, 'rdf.bdb')
+        gexf_file = os.path.join(self.tmpdir, 'full.gexf')
+        graph = rdflib.ConjunctiveGraph('Sleepycat')
+        graph.open(rdf_path, create=True)
+        graph.close()
+
+        problems = validate_version(rdf_path, [gexf_file])
+        self.assertEqual(2, len(problems))
+        self.assert_('empty' in problems[0])
+        self.assert_('GEXF file' in problems[1])
+
+        graph.open(rdf_path, create=False)
+        graph.add((rdflib.URIRef('http://example.com/'), rdflib.RDF.type,
+                   rdflib.URIRef('http://schema.org/WebSite')))
+        graph.close()
+        with open(gexf_file, 'w') as out:
+            out.write('<gexf/>')
+        self.assertEqual([], validate_version(rdf_path, [gexf_file]))
+
+        problems = validate_version(rdf_path, [gexf_file],
+                                    os.path.join(self.tmpdir, 'rdf.snapshot'))
+        self.assertEqual(1, len(problems))
+        self.assert_('RDF snapshot' in problems[0])
@@ -1,5 +1,4 @@
 import logging
-import networkx as nx
 import rdflib
 import time
 
@@ -10,7 +9,10 @@ from django.db.models import get_model
 from belfast import rdfns
 from belfast.rdf import rdfmap
 from belfast.rdf.models import RdfResource
+from belfast.rdf.queries import run_query, local_prefix
 from belfast.util import rdf_data, network_data, cached_property
+from belfast.network.connections import connection_index, node_connections
+from belfast.network.egograph import ego_graph_index
 from belfast.network.util import filter_graph
 
 logger = logging.getLogger(__name__)
@@ -37,24 +39,9 @@ class RdfEntity(RdfResource):
         :param min_degree: optionally filter nodes in the generated ego graph
             by minimum degree
         '''
-        network = network_data()
-        undirected_net = network.to_undirected()
-
-        # filter network *before* generating ego graph
-        # so we don't get disconnected nodes
-        if types is not None:
-            for n in undirected_net.nodes():
-                if 'type' not in undirected_net.node[n] or \
-                   undirected_net.node[n]['type'] not in types:
-                    undirected_net.remove_node(n)
-
-        # converted multidigraph to undirected
-        # to make it possible to find all neighbors,
-        # not just outbound connections
-        # (should be a way to get this from a digraph...)
-
-        eg = nx.ego_graph(undirected_net, self.nx_node_id,
-                            radius=radius)
+        # use a prebuilt undirected adjacency index for the network,
+        # filtered by type, rather than copying the entire network
+        eg = ego_graph_index(types).ego_graph(self.nx_node_id, radius=radius)
         if min_degree is not None:
             return filter_graph(eg, min_degree=min_degree)
         return eg
@@ -68,21 +55,18 @@ class RdfEntity(RdfResource):
         network = network_data()
         graph = rdf_data()
 
-        if self.nx_node_id not in network.nodes():
+        if self.nx_node_id not in network:
             return {}
 
-        # this also works...
-        # neighbors = network.neighbors(self.nx_node_id)
-        ego_graph = self.ego_graph()
-        neighbors = ego_graph.nodes()
-
-        connections = {}
-        for node in neighbors:
-            weight = 0
-            # don't include the current person in their own connections
-            if node == self.nx_node_id:
-                continue
+        # use the precomputed connection index when available
+        index = connection_index()
+        if index is not None:
+            return [(resource(graph, rdflib.URIRef(node)), (rels, weight))
+                    for node, rels, weight, types in index.connections(self.nx_node_id)
+                    if rdftype is None or unicode(rdftype) in types]
 
+        connections = []
+        for node, rels, weight in node_connections(network, self.nx_node_id):
             uriref = rdflib.URIRef(node)
             # if an rdf type was specified, filter out items that do not
             # match that type.
@@ -90,29 +74,10 @@ class RdfEntity(RdfResource):
                (uriref, rdflib.RDF.type, rdftype) not in graph:
                 continue
 
-            res = resource(graph, uriref)
-            rels = set()
-            # find any edges between this node and me
-            # include data to simplify accessing edge label
-            # use edges & labels from original multidigraph
-            all_edges = network.out_edges(node, data=True) + \
-                network.in_edges(node, data=True)
-
-            for edge in all_edges:
-                src, target, data = edge
-                if self.nx_node_id in edge and 'label' in data:
-                    weight += data.get('weight', 1)  # assume default of 1 if not set
-                    rels.add(data['label'])
+            connections.append((resource(graph, uriref), (rels, weight)))
 
-            if 'knows' in rels and 'correspondedWith' in rels:
-                rels.remove('knows')
-
-            # connections[res] = {'rels': rels, 'weight': weight}
-            connections[res] = (rels, weight)
-
-        # sort by weight so strongest connections will be listed first
-        conn =  sorted(connections.items(), key=lambda x: x[1][1], reverse=True)
-        return conn
+        # already sorted by weight, so strongest connections are listed first
+        return connections
 
     @cached_property
     def connected_people(self):
@@ -167,7 +132,7 @@ class RdfLocation(RdfEntity):
     @property
     def texts(self):
         'list of poems that mention this location'
-        return [RdfPoem(res.graph, res.identifier)
+        return [rdfmap.share_prefetched(self, RdfPoem(res.graph, res.identifier))
                 for res in self.mentioned_in
                 if rdfns.FREEBASE['book/poem'] in res.rdf_types]
 
@@ -184,7 +149,7 @@ class RdfLocation(RdfEntity):
         '''List of :class:`RdfPerson` connected to this location.'''
         # NOTE: this seems clunky, but seems to be significantly faster than
         # getting the same data via sparql query
-        return [RdfPerson(self.graph, r.identifier)
+        return [rdfmap.share_prefetched(self, RdfPerson(self.graph, r.identifier))
                 for r in set(self.born_here + self.worked_here + self.home_here)]
 
 
@@ -215,21 +180,21 @@ class RdfOrganization(RdfEntity):
     #: list of other URIs that are equilvaent to this one
     same_as = rdfmap.ValueList(rdflib.OWL.sameAs, transitive=True)
 
-    @property
+    @cached_property
     def viaf_uri(self):
         'VIAF URi for this organization'
         for uri in self.same_as:
             if 'viaf.org' in uri:
                 return uri
 
-    @property
+    @cached_property
     def dbpedia_uri(self):
         'DBpedia URI for this organization'
         for uri in self.same_as:
             if 'dbpedia.org' in uri:
                 return uri
 
-    @property
+    @cached_property
     def dbpedia(self):
         ':class:`DBpediaEntity` for this organization'
         if self.dbpedia_uri is not None:
@@ -253,7 +218,7 @@ class RdfPerson(RdfEntity):
             self._current_site = Site.objects.get(id=settings.SITE_ID)
         return self._current_site
 
-    @property
+    @cached_property
     def local_uri(self):
         'local site URI for the person'
         return str(self.identifier).startswith('http://%s' % self.current_site.domain)
@@ -266,7 +231,7 @@ class RdfPerson(RdfEntity):
     #: first name (schema.org/givenName)
     firstname = rdfmap.Value(rdfns.SCHEMA_ORG.givenName)
 
-    @property
+    @cached_property
     def fullname(self):
         'fullname (constructed from first and last names if available)'
         if self.lastname and self.firstname:
@@ -279,20 +244,20 @@ class RdfPerson(RdfEntity):
     #: list of other URIs equivalent to the current entity, via owl:sameAs
     same_as = rdfmap.ValueList(rdflib.OWL.sameAs, transitive=True)
 
-    @property
+    @cached_property
     def dbpedia_uri(self):
         'dbpedia URI'
         for uri in self.same_as:
             if 'dbpedia.org' in uri:
                 return uri
 
-    @property
+    @cached_property
     def dbpedia(self):
         ':class:`DBpediaEntity` for this resource'
         if self.dbpedia_uri is not None:
             return DBpediaEntity(self.graph, self.dbpedia_uri)
 
-    @property
+    @cached_property
     def viaf_uri(self):
         'VIAF URI'
         for uri in self.same_as:
@@ -308,7 +273,7 @@ class RdfPerson(RdfEntity):
     #: description
     description = rdfmap.Value(rdfns.SCHEMA_ORG.description)
 
-    @property
+    @cached_property
     def description_context(self):
         '''Description context - identifier for the document where the
         description of this person comes from.'''
@@ -354,7 +319,7 @@ class RdfPerson(RdfEntity):
         'all locations (work and home)'
         return self.work_locations + self.home_locations
 
-    @property
+    @cached_property
     def has_profile(self):
         'boolean flag to indicate if this person should have a local profile page'
         # current requirements: local uri and has a description
@@ -366,7 +331,7 @@ class RdfPerson(RdfEntity):
     #: list of documents authored by this person
     documents = rdfmap.ResourceList(rdfns.DC.creator, RdfResource, is_object=False)
 
-    @property
+    @cached_property
     def groupsheets(self):
         # list of Group sheets by this person
         return [d for d in self.documents if rdfns.BG.GroupSheet in d.rdf_types]
@@ -409,18 +374,8 @@ def profile_people():
     g = rdf_data()
     start = time.time()
     current_site = Site.objects.get(id=settings.SITE_ID)
-    res = g.query('''
-        PREFIX schema: <%(schema)s>
-        PREFIX rdf: <%(rdf)s>
-        SELECT DISTINCT ?person
-        WHERE {
-          ?person rdf:type schema:Person .
-          ?person schema:familyName ?name .
-          FILTER regex(str(?person), "^http://%(site)s")
-        } ORDER BY ?name
-        ''' % {'schema': rdfns.SCHEMA_ORG, 'rdf': rdflib.RDF,
-               'site': current_site.domain}
-        )
+    res = run_query(g, 'local_people',
+                    local_prefix=local_prefix(current_site.domain))
     # FIXME:  should be possible to filter at this level
     # on precense of a dbpedia description or a local schema description
     # but can't get the query to work...
@@ -429,11 +384,14 @@ def profile_people():
                  time.time() - start))
     # people = [RdfPerson(g.get_context(r['person']), r['person']) for r in res]
     people = [RdfPerson(g, r['person']) for r in res]
-    return people
+    return rdfmap.prefetch(people)
 
 
 def find_places():
     'Generate a list of :class:`RdfLocation` associated with Belfast Group people.'
     g = rdf_data()
-    return [RdfLocation(g, subj) for subj in g.subjects(predicate=rdflib.RDF.type,
-                                                       object=rdfns.SCHEMA_ORG.Place)]
+    places = [RdfLocation(g, subj) for subj in g.subjects(predicate=rdflib.RDF.type,
+                                                         object=rdfns.SCHEMA_ORG.Place)]
+    # fetch place details and related people and texts for display in bulk
+    return rdfmap.prefetch(places, related=['mentioned_in', 'born_here',
+                                            'worked_here', 'home_here'])
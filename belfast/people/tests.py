@@ -91,6 +91,27 @@ class PeopleViewsTest(TestCase):
                 % o.name)
 
 
+    @patch('belfast.people.views.cached_json')
+    @patch('belfast.people.views.rdf_data')
+    def test_egograph_js(self, mockrdf, mockcached):
+        mockrdf.return_value = self.graph
+        mockcached.return_value = '{}'
+        response = self.client.get(reverse('people:egograph-js',
+                                           kwargs={'id': 'not-a-person'}))
+        self.assertEqual(404, response.status_code,
+                         'egograph json should return 404 for unknown person')
+        self.assertEqual(0, mockcached.call_count,
+                         'egograph json should not be cached for unknown person')
+
+        # uri is based on the site, not the request host
+        response = self.client.get(reverse('people:egograph-js',
+                                           kwargs={'id': 'michael-longley'}),
+                                   HTTP_HOST='other.example.org')
+        self.assertEqual(200, response.status_code)
+        args, kwargs = mockcached.call_args
+        self.assertEqual(unicode(self.person.identifier), kwargs['uri'])
+
+
 class RdfPersonTest(TestCase):
     graph = rdflib.Graph()
     graph.parse(path.join(FIXTURE_DIR, 'testdata.rdf'))
@@ -12,6 +12,7 @@ from belfast.util import rdf_data, rdf_data_lastmodified, \
     network_data_lastmodified, local_uri
 from belfast.groupsheets.rdfmodels import get_rdf_groupsheets
 from belfast.people.rdfmodels import profile_people, RdfPerson, RdfPoem
+from belfast.network.cache import cached_json
 from belfast.network.util import annotate_graph
 
 
@@ -59,9 +60,21 @@ def profile(request, id):
 @last_modified(rdf_nx_lastmod)  # uses both rdf and gexf
 def egograph_js(request, id):
     'Egograph information as JSON for a single person.'
-    uri = local_uri(reverse('people:profile', args=[id]), request)
-    g = rdf_data()
-    person = RdfPerson(g, rdflib.URIRef(uri))
+    # uri is based on the configured site rather than the request, and
+    # only cached for people in the data, since it is part of the cache key
+    uri = local_uri(reverse('people:profile', args=[id]))
+    if not (rdflib.URIRef(uri), rdflib.RDF.type, rdfns.SCHEMA_ORG.Person) in rdf_data():
+        raise Http404
+    data = cached_json(egograph_json, 'egograph_js', uri=uri)
+    return HttpResponse(data, content_type='application/json')
+
+
+def egograph_json(uri):
+    '''Generate egograph data as JSON for :meth:`egograph_js`.
+
+    :param uri: person URI
+    '''
+    person = RdfPerson(rdf_data(), rdflib.URIRef(uri))
     graph = person.ego_graph(radius=1,
                              types=['Person', 'Organization', 'Place'])
     # annotate nodes in graph with degree
@@ -72,7 +85,7 @@ def egograph_js(request, id):
                                           'eigenvector_centrality'])
 
     data = json_graph.node_link_data(graph)
-    return HttpResponse(json.dumps(data), content_type='application/json')
+    return json.dumps(data)
 
 
 # NOTE: egograph view no longer in use, but might want to consider
@@ -1,116 +1,311 @@
-# Orignal version taken from http://www.djangosnippets.org/snippets/186/
-# Original author: udfalkso
-# Modified by: Shwagroo Team
-
-import sys
-import os
-import re
-import hotshot, hotshot.stats
-import tempfile
-import StringIO
-
-from django.conf import settings
-
-
-words_re = re.compile(r'\s+')
-
-group_prefix_re = [
-    re.compile("^.*/django/[^/]+"),
-    re.compile("^(.*)/[^/]+$"),  # extract module path
-    re.compile(".*"),           # catch strange entries
-]
-
-
-class ProfileMiddleware(object):
-    """
-    Displays hotshot profiling for any view.
-    http://yoursite.com/yourview/?prof
-
-    Add the "prof" key to query string by appending ?prof (or &prof=)
-    and you'll see the profiling results in your browser.
-    It's set up to only be available in django's debug mode, is available for superuser otherwise,
-    but you really shouldn't add this middleware to any production configuration.
-
-    WARNING: It uses hotshot profiler which is not thread safe.
-    """
-    def process_request(self, request):
-        if (settings.DEBUG or request.user.is_superuser) and 'prof' in request.GET:
-            self.tmpfile = tempfile.mktemp()
-            self.prof = hotshot.Profile(self.tmpfile)
-
-    def process_view(self, request, callback, callback_args, callback_kwargs):
-        if (settings.DEBUG or request.user.is_superuser) and 'prof' in request.GET:
-            return self.prof.runcall(callback, request, *callback_args, **callback_kwargs)
-
-    def get_group(self, filename):
-        for g in group_prefix_re:
-            name = g.findall(filename)
-            if name:
-                return name[0]
-
-    def get_summary(self, results_dict, summary):
-        items = [(item[1], item[0]) for item in results_dict.items()]
-        items.sort(reverse=True)
-        items = items[:40]
-
-        res = "      tottime\n"
-        for item in items:
-            res += "%4.1f%% %7.3f %s\n" % (100*item[0]/summary
-                                           if summary else 0, item[0],
-                                           item[1])
-        return res
-
-    def summary_for_files(self, stats_str):
-        stats_str = stats_str.split("\n")[5:]
-
-        mystats = {}
-        mygroups = {}
-
-        total = 0
-
-        for s in stats_str:
-            fields = words_re.split(s)
-            if len(fields) == 7:
-                time = float(fields[2])
-                total += time
-                filename = fields[6].split(":")[0]
-
-                if filename not in mystats:
-                    mystats[filename] = 0
-                mystats[filename] += time
-
-                group = self.get_group(file)
-                if group not in mygroups:
-                    mygroups[group] = 0
-                mygroups[group] += time
-
-        return "<pre>" + \
-               " ---- By file ----\n\n" + self.get_summary(mystats, total) + "\n" + \
-               " ---- By group ---\n\n" + self.get_summary(mygroups, total) + \
-               "</pre>"
-
-    def process_response(self, request, response):
-        if (settings.DEBUG or request.user.is_superuser) and request.GET.has_key('prof'):
-            self.prof.close()
-
-            out = StringIO.StringIO()
-            old_stdout = sys.stdout
-            sys.stdout = out
-
-            stats = hotshot.stats.load(self.tmpfile)
-            stats.sort_stats('time', 'calls')
-            stats.print_stats()
-
-            sys.stdout = old_stdout
-            stats_str = out.getvalue()
-
-            if response and response.content and stats_str:
-                response.content = "<pre>" + stats_str + "</pre>"
-
-            response.content = "\n".join(response.content.split("\n")[:40])
-
-            response.content += self.summary_for_files(stats_str)
-
-            os.unlink(self.tmpfile)
-
-        return response
+'''Profiling middleware for finding slow views, safe to use with
+multi-threaded servers: profiler state is kept on each request rather than
+on the middleware.
+
+Profiles are collected with :mod:`cProfile`, or with a low-overhead
+sampling profiler (:class:`StackSampler`) that periodically records the
+call stack of the thread handling the request.  Profiling is activated
+for a request by:
+
+* adding ``?prof`` to the query string, to display the results in the
+  browser (cProfile; only in DEBUG mode or for superusers)
+* an ``X-Profile`` request header, with a value of ``cprofile`` or
+  ``sample`` (only in DEBUG mode or for superusers)
+* random sampling of requests, configured with **PROFILE_SAMPLE_RATE**
+  (fraction of requests to profile, using **PROFILE_MODE**, which
+  defaults to ``sample``)
+
+If **PROFILE_DIR** is configured, cProfile results are saved there as
+``.prof`` files (readable with :mod:`pstats`) and sampling results as
+``.collapsed`` stack files (as used by flame graph tools).  Time for each
+profiled request is summarized by module group (see :data:`MODULE_GROUPS`)
+and aggregated by view; see :meth:`view_summaries` for the current process,
+or the ``profile_summary`` manage command for saved profiles.
+'''
+
+from collections import defaultdict
+import cProfile
+import logging
+import os
+import pstats
+import random
+import re
+import StringIO
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.html import escape
+
+
+logger = logging.getLogger(__name__)
+
+
+#: top-level packages that time is grouped by in profile summaries;
+#: anything else is grouped as ``other``
+MODULE_GROUPS = ['belfast', 'rdflib', 'networkx', 'django']
+
+_group_re = re.compile(r'[/\\](%s)[/\\]' % '|'.join(MODULE_GROUPS))
+
+
+def module_group(filename):
+    '''Module group for a source filename, based on the last package
+    directory in :data:`MODULE_GROUPS` in the path.'''
+    groups = _group_re.findall(filename)
+    return groups[-1] if groups else 'other'
+
+
+class StackSampler(object):
+    '''Sample the call stack of a single thread at a regular interval,
+    from a separate thread.
+
+    :param thread_id: identifier of the thread to sample; defaults to
+        the current thread
+    :param interval: time between samples, in seconds
+    '''
+
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id or threading.current_thread().ident
+        self.interval = interval
+        #: number of samples, by stack (outermost frame first)
+        self.stacks = defaultdict(int)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            if stack:
+                self.stacks[tuple(reversed(stack))] += 1
+
+    @property
+    def samples(self):
+        return sum(self.stacks.itervalues())
+
+    def collapsed(self):
+        'Samples in collapsed stack format, one line per distinct stack'
+        return ''.join('%s %d\n' % (';'.join('%s (%s:%d)' % (name, filename, line)
+                                             for filename, line, name in stack),
+                                    count)
+                       for stack, count in sorted(self.stacks.iteritems()))
+
+
+def stats_by_group(stats):
+    '''Total internal time in seconds by module group for
+    :class:`pstats.Stats`.'''
+    groups = defaultdict(float)
+    for (filename, line, name), data in stats.stats.iteritems():
+        groups[module_group(filename)] += data[2]  # total time
+    return dict(groups)
+
+
+def samples_by_group(stacks, interval):
+    '''Estimated time in seconds by module group for sampled stacks,
+    based on the innermost frame of each sample.'''
+    groups = defaultdict(float)
+    for stack, count in stacks.iteritems():
+        groups[module_group(stack[-1][0])] += count * interval
+    return dict(groups)
+
+
+class RequestProfile(object):
+    '''Profile a single view call.
+
+    :param mode: ``cprofile`` or ``sample``
+    :param interval: sampling interval in seconds, for sample mode
+    '''
+
+    def __init__(self, mode='cprofile', interval=None):
+        self.mode = mode
+        self.interval = interval or getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0.005)
+        self.profiler = None
+        self.elapsed = None
+
+    def runcall(self, func, *args, **kwargs):
+        'Call a function with profiling and return the result'
+        start = time.time()
+        if self.mode == 'sample':
+            self.profiler = StackSampler(interval=self.interval)
+            self.profiler.start()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.profiler.stop()
+                self.elapsed = time.time() - start
+        else:
+            self.profiler = cProfile.Profile()
+            try:
+                return self.profiler.runcall(func, *args, **kwargs)
+            finally:
+                self.elapsed = time.time() - start
+
+    def groups(self):
+        'Time in seconds by module group'
+        if self.mode == 'sample':
+            return samples_by_group(self.profiler.stacks, self.interval)
+        return stats_by_group(pstats.Stats(self.profiler))
+
+    def save(self, directory, view):
+        '''Save the profile to a directory, with a filename based on the
+        view name; returns the path to the file.'''
+        filename = '%s__%d_%d_%d.%s' % (view, time.time() * 1000, os.getpid(),
+            threading.current_thread().ident,
+            'collapsed' if self.mode == 'sample' else 'prof')
+        path = os.path.join(directory, filename)
+        if self.mode == 'sample':
+            with open(path, 'w') as outfile:
+                outfile.write(self.profiler.collapsed())
+        else:
+            self.profiler.dump_stats(path)
+        return path
+
+    def report(self, limit=40):
+        'Plain-text report of the profile, for display'
+        out = StringIO.StringIO()
+        out.write('%s profile: %.3f sec\n\n' % (self.mode, self.elapsed))
+        if self.mode == 'sample':
+            out.write('%d samples\n' % self.profiler.samples)
+        else:
+            stats = pstats.Stats(self.profiler, stream=out)
+            stats.sort_stats('time', 'calls')
+            stats.print_stats(limit)
+        out.write('\n ---- By module group ----\n\n')
+        out.write(format_groups(self.groups()))
+        return out.getvalue()
+
+
+def format_groups(groups):
+    'Format time by module group as text, largest first'
+    total = sum(groups.itervalues())
+    return ''.join('%5.1f%% %8.3f %s\n' % (100 * t / total if total else 0, t, g)
+                   for g, t in sorted(groups.iteritems(), key=lambda i: -i[1]))
+
+
+_collapsed_frame_re = re.compile(r'\((?P<filename>.*):\d+\)$')
+
+
+def saved_profile_groups(path, interval=None):
+    '''Time in seconds by module group for a profile saved by
+    :meth:`RequestProfile.save`.
+
+    :returns: tuple of view name and dictionary of module group times
+    '''
+    view = os.path.basename(path).split('__')[0]
+    if path.endswith('.collapsed'):
+        if interval is None:
+            interval = getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0.005)
+        groups = defaultdict(float)
+        with open(path) as infile:
+            for line in infile:
+                stack, count = line.rstrip('\n').rsplit(' ', 1)
+                match = _collapsed_frame_re.search(stack.split(';')[-1])
+                filename = match.group('filename') if match else ''
+                groups[module_group(filename)] += int(count) * interval
+        return view, dict(groups)
+    return view, stats_by_group(pstats.Stats(path))
+
+
+# time by module group for profiled requests in this process, by view
+_SUMMARIES = {}
+_summary_lock = threading.Lock()
+
+
+def add_summary(view, groups):
+    'Add the module group times for a profiled request to the view summary'
+    with _summary_lock:
+        summary = _SUMMARIES.setdefault(view, {'requests': 0, 'groups': {}})
+        summary['requests'] += 1
+        for group, seconds in groups.iteritems():
+            summary['groups'][group] = summary['groups'].get(group, 0) + seconds
+
+
+def view_summaries():
+    '''Aggregated profile summaries for requests profiled by this process,
+    as a dictionary of view name and dictionary with number of
+    **requests** and total seconds by module group in **groups**.'''
+    with _summary_lock:
+        return dict((view, {'requests': s['requests'], 'groups': dict(s['groups'])})
+                    for view, s in _SUMMARIES.iteritems())
+
+
+def view_name(view_func):
+    'Dotted name for a view function, for use in summaries and filenames'
+    return '%s.%s' % (view_func.__module__,
+                      getattr(view_func, '__name__', view_func.__class__.__name__))
+
+
+class ProfileMiddleware(object):
+    '''Profile view calls; see :mod:`belfast.profiling` for how profiling
+    is activated and where results are saved.  Should not be used in
+    production without **PROFILE_SAMPLE_RATE** and the default sampling
+    mode, since cProfile adds significant overhead.'''
+
+    modes = ['cprofile', 'sample']
+
+    def allowed(self, request):
+        user = getattr(request, 'user', None)
+        return settings.DEBUG or (user is not None and user.is_superuser)
+
+    def profile_mode(self, request):
+        # determine if and how the current request should be profiled
+        if 'prof' in request.GET and self.allowed(request):
+            return 'cprofile'
+        header = request.META.get('HTTP_X_PROFILE')
+        if header and self.allowed(request):
+            return header if header in self.modes else 'cprofile'
+        rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+        if rate and random.random() < rate:
+            return getattr(settings, 'PROFILE_MODE', 'sample')
+
+    def process_request(self, request):
+        mode = self.profile_mode(request)
+        request.profiler = RequestProfile(mode) if mode else None
+        # only display the profile in place of the response when ?prof
+        # was allowed, not for requests profiled by random sampling
+        request.profile_display = 'prof' in request.GET and \
+            self.allowed(request)
+
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        profile = getattr(request, 'profiler', None)
+        if profile is not None:
+            request.profiler_view = view_name(callback)
+            return profile.runcall(callback, request, *callback_args,
+                                   **callback_kwargs)
+
+    def process_response(self, request, response):
+        profile = getattr(request, 'profiler', None)
+        if profile is None or profile.elapsed is None:
+            return response
+
+        view = request.profiler_view
+        add_summary(view, profile.groups())
+        profile_dir = getattr(settings, 'PROFILE_DIR', None)
+        if profile_dir:
+            try:
+                path = profile.save(profile_dir, view)
+                response['X-Profile-File'] = os.path.basename(path)
+            except (IOError, OSError) as err:
+                logger.warn('Error saving profile for %s: %s', view, err)
+        logger.debug('Profiled %s (%s): %.3f sec', view, profile.mode,
+                     profile.elapsed)
+
+        if getattr(request, 'profile_display', False):
+            return HttpResponse('<pre>%s</pre>' % escape(profile.report()))
+        return response
@@ -0,0 +1,179 @@
+'''Streaming bulk load and export of line-based RDF (N-Triples and
+N-Quads) for the local RDF datastore.
+
+Unlike :meth:`rdflib.Graph.parse`, which builds the entire parsed graph in
+memory before adding it to the store, data is read one line at a time
+and added to the store in fixed-size batches, so memory use does not
+depend on the size of the file being loaded.  Similarly, data is exported
+one quad at a time as it is read from the store, rather than serializing
+the entire graph to a string.
+'''
+
+import codecs
+import gzip
+import logging
+import sys
+import time
+
+from rdflib.plugins.parsers.ntriples import NTriplesParser, ParseError, \
+    r_wspace, r_tail
+from rdflib.plugins.serializers.nquads import _nq_row
+
+
+logger = logging.getLogger(__name__)
+
+
+def open_rdf(filename):
+    '''Open a file of RDF data for reading, automatically decompressing
+    gzipped content.  Use ``-`` to read from standard input.'''
+    if filename == '-':
+        return sys.stdin
+    with open(filename, 'rb') as infile:
+        magic = infile.read(2)
+    if magic == '\x1f\x8b':
+        return gzip.open(filename, 'rb')
+    return open(filename, 'rb')
+
+
+def open_output(filename, compress=False):
+    '''Open a file for writing RDF data, optionally gzip-compressed.
+    Use ``-`` to write to standard output.'''
+    if filename == '-':
+        if compress:
+            return gzip.GzipFile(fileobj=sys.stdout, mode='wb')
+        return sys.stdout
+    if compress:
+        return gzip.open(filename, 'wb')
+    return open(filename, 'wb')
+
+
+def write_quads(graph, out, contexts=None):
+    '''Write the contents of a context-aware graph as N-Quads, one quad at
+    a time as it is read from the store.
+
+    :param graph: :class:`rdflib.ConjunctiveGraph`
+    :param out: file-like object to write to
+    :param contexts: optional list of contexts (graphs) to be exported;
+        defaults to all contexts in the graph
+    :returns: number of quads written
+    '''
+    if contexts is None:
+        contexts = graph.contexts()
+    count = 0
+    for ctx in contexts:
+        for triple in ctx.triples((None, None, None)):
+            out.write(_nq_row(triple, ctx.identifier).encode('utf-8'))
+            count += 1
+    return count
+
+
+class QuadReader(NTriplesParser):
+    '''Incremental N-Triples and N-Quads parser.  Rather than adding
+    parsed data to a graph, :meth:`quads` generates one quad at a time.
+
+    :param default_context: context identifier for triples that do not
+        specify one (i.e., all N-Triples data)
+    '''
+
+    def __init__(self, default_context=None):
+        NTriplesParser.__init__(self)
+        self.default_context = default_context
+
+    def quads(self, stream):
+        '''Generator of subject, predicate, object, context identifier
+        tuples parsed from a file-like object.'''
+        self.file = codecs.getreader('utf-8')(stream)
+        self.buffer = ''
+        while True:
+            self.line = line = self.readline()
+            if self.line is None:
+                break
+            try:
+                quad = self.parse_quad()
+            except ParseError as err:
+                raise ParseError('Invalid line (%s):\n%r' % (err, line))
+            if quad is not None:
+                yield quad
+
+    def parse_quad(self):
+        # parse the current line; returns None for blank lines and comments
+        self.eat(r_wspace)
+        if not self.line or self.line.startswith('#'):
+            return None
+        subject = self.subject()
+        self.eat(r_wspace)
+        predicate = self.predicate()
+        self.eat(r_wspace)
+        obj = self.object()
+        self.eat(r_wspace)
+        context = self.uriref() or self.nodeid() or self.default_context
+        self.eat(r_tail)
+        if self.line:
+            raise ParseError('Trailing garbage')
+        return subject, predicate, obj, context
+
+
+class BulkLoader(object):
+    '''Add quads to a context-aware graph in batches, committing and
+    syncing the store after each batch.
+
+    :param graph: :class:`rdflib.ConjunctiveGraph` to load data into
+    :param batch_size: number of triples to add per batch
+    :param progress: optional callback, called after each batch with
+        the total number of triples loaded and the elapsed time in seconds
+    '''
+
+    def __init__(self, graph, batch_size=10000, progress=None):
+        self.graph = graph
+        self.batch_size = batch_size
+        self.progress = progress
+        self.total = 0
+        self.elapsed = 0
+        self._start = None
+        self._contexts = {}
+
+    def context(self, identifier):
+        'Graph for a context identifier, with None as the default context'
+        if identifier is None:
+            return self.graph.default_context
+        if identifier not in self._contexts:
+            self._contexts[identifier] = self.graph.get_context(identifier)
+        return self._contexts[identifier]
+
+    def load(self, quads):
+        '''Load an iterable of subject, predicate, object, context identifier
+        tuples.
+
+        :returns: number of triples loaded
+        '''
+        if self._start is None:
+            self._start = time.time()
+        loaded = 0
+        batch = []
+        for s, p, o, ctx in quads:
+            batch.append((s, p, o, self.context(ctx)))
+            if len(batch) >= self.batch_size:
+                loaded += self.flush(batch)
+                batch = []
+        if batch:
+            loaded += self.flush(batch)
+        return loaded
+
+    def flush(self, batch):
+        # add a batch of quads to the store and persist it
+        self.graph.addN(batch)
+        self.graph.commit()
+        if hasattr(self.graph.store, 'sync'):
+            self.graph.store.sync()
+        self.total += len(batch)
+        self.elapsed = time.time() - self._start
+        logger.debug('Loaded %d triples in %.1fs', self.total, self.elapsed)
+        if self.progress is not None:
+            self.progress(self.total, self.elapsed)
+        return len(batch)
+
+    def rate(self):
+        'Triples loaded per second'
+        if not self.elapsed:
+            return 0
+        return self.total / self.elapsed
@@ -0,0 +1,125 @@
+'''Change tracking for incremental data prep.
+
+Each graph context added by the data prep process (harvested webpages,
+local fixtures) is recorded with a content hash of the triples as they
+were originally added.  When the content is harvested again and the hash
+has not changed, the existing (already cleaned) context is kept, and
+the cleanup stages in :mod:`belfast.rdf.clean` only need to process
+contexts that are new or have changed since the stage last ran.
+
+Tracking information is stored as JSON in **RDF_PREP_STATE**, which
+defaults to a file in the **RDF_DATABASE** directory, so that it is
+removed along with the data when the database is cleared.
+'''
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+import rdflib
+
+
+logger = logging.getLogger(__name__)
+
+
+def _term_key(term):
+    # blank node identifiers are different every time data is parsed,
+    # so they are not included in the content hash
+    if isinstance(term, rdflib.BNode):
+        return u'_:'
+    return term.n3()
+
+
+def content_hash(triples):
+    '''Content hash for an iterable of triples, independent of triple
+    order and blank node identifiers.'''
+    lines = sorted(u' '.join(_term_key(t) for t in triple) for triple in triples)
+    sha = hashlib.sha1()
+    for line in lines:
+        sha.update(line.encode('utf-8'))
+        sha.update('\n')
+    return sha.hexdigest()
+
+
+def default_state_file():
+    'Default location for the prep state file, based on configuration'
+    state_file = getattr(settings, 'RDF_PREP_STATE', None)
+    if state_file is None:
+        state_file = os.path.join(settings.RDF_DATABASE, 'prep-state.json')
+    return state_file
+
+
+class ChangeTracker(object):
+    '''Track graph contexts for incremental data prep: a hash of the
+    source content each context was added from, which prep stages have
+    processed each context, and a hash of the context content after the
+    last stage that processed it.
+
+    A stage needs to process a context if it has not yet processed the
+    current content, or if the context was modified since it was last
+    processed (e.g., annotated, re-added, or updated by another stage
+    processing a different context).
+
+    :param filename: path to the JSON state file; defaults to
+        :meth:`default_state_file`
+    :param full: if True, treat every context as changed, to force
+        reprocessing all the data
+    '''
+
+    def __init__(self, filename=None, full=False):
+        self.filename = filename or default_state_file()
+        self.full = full
+        self.contexts = {}
+        if os.path.exists(self.filename):
+            with open(self.filename) as statefile:
+                self.contexts = json.load(statefile).get('contexts', {})
+
+    def changed(self, identifier, source):
+        '''Check if the source content hash for a context is different
+        from the recorded version (or if the context is not tracked).'''
+        entry = self.contexts.get(unicode(identifier))
+        return self.full or entry is None or entry.get('source') != source
+
+    def record(self, identifier, source):
+        '''Record new source content for a context; all stages will
+        need to process it again.'''
+        self.contexts[unicode(identifier)] = {'source': source, 'hash': None,
+                                              'stages': []}
+
+    def pending(self, graph, stage):
+        '''List of contexts in a conjunctive graph that need to be
+        processed by the specified stage.'''
+        contexts = []
+        for ctx in graph.contexts():
+            entry = self.contexts.get(unicode(ctx.identifier))
+            if self.full or entry is None or stage not in entry['stages']:
+                contexts.append(ctx)
+            elif entry['hash'] != content_hash(ctx):
+                # modified since last processed; all stages need to run again
+                entry['stages'] = []
+                contexts.append(ctx)
+        logger.debug('%d context(s) pending for %s', len(contexts), stage)
+        return contexts
+
+    def mark_processed(self, contexts, stage):
+        '''Record that a stage has processed a list of contexts, along
+        with the resulting content hash of each one.'''
+        for ctx in contexts:
+            entry = self.contexts.setdefault(unicode(ctx.identifier),
+                {'source': None, 'hash': None, 'stages': []})
+            entry['hash'] = content_hash(ctx)
+            if stage not in entry['stages']:
+                entry['stages'].append(stage)
+
+    def save(self):
+        'Save the tracking information to the state file.'
+        dirname = os.path.dirname(os.path.abspath(self.filename))
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        fd, tmpname = tempfile.mkstemp(dir=dirname)
+        with os.fdopen(fd, 'w') as tmp:
+            json.dump({'contexts': self.contexts}, tmp, indent=1, sort_keys=True)
+        os.rename(tmpname, self.filename)
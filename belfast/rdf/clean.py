@@ -18,6 +18,7 @@ from belfast import rdfns
 from belfast.util import local_uri
 from belfast.rdf import rdfmap
 from belfast.rdf.qub import QUB
+from belfast.rdf.queries import run_query, local_prefix
 
 logger = logging.getLogger(__name__)
 
@@ -36,12 +37,15 @@ class IdentifyGroupSheets(object):
     '''
 
     total = 0
-    def __init__(self, graph, verbosity=1):
+    def __init__(self, graph, verbosity=1, contexts=None):
 
         self.verbosity = verbosity
 
         # iterate over all contexts in a conjunctive graph and process each one
-        for ctx in graph.contexts():
+        # (or only the specified contexts, e.g. new or changed data)
+        if contexts is None:
+            contexts = graph.contexts()
+        for ctx in contexts:
             self.total += self.process_graph(ctx)
 
     def process_graph(self, graph):
@@ -57,22 +61,8 @@ class IdentifyGroupSheets(object):
         # NOTE: previously rel was ?ms schema:mentions Belfast Group
         # findingaids have now been updated to use schema:producer
         # -- for now, leaving the rel unspecified to catch all items
-        res = graph.query('''
-            PREFIX dc: <%(dc)s>
-            PREFIX rdf: <%(rdf)s>
-            PREFIX bibo: <%(bibo)s>
-            SELECT ?ms
-            WHERE {
-                ?ms rdf:type bibo:Manuscript .
-                ?ms ?rel <%(belfast_group)s> .
-                ?ms dc:creator ?auth
-            }
-            ''' % {'dc': rdfns.DC,
-                   'rdf': rdflib.RDF,
-                   'bibo': rdfns.BIBO,
-                   'belfast_group': rdfns.BELFAST_GROUP_URI
-                   }
-            )
+        res = run_query(graph, 'manuscripts_related_to',
+                        group=rdfns.BELFAST_GROUP_URIREF)
         # searching for all manuscript that 'mention' belfast group
         # NOTE: schema:mentions NOT the right relation here;
         # needs to be fixed in findingaids and then here
@@ -88,23 +78,8 @@ class IdentifyGroupSheets(object):
 
             # TODO: will also need to find ms associated with / presented at BG
             # NOTE: need a way to filter non-belfast group content
-            res = graph.query('''
-                PREFIX schema: <%(schema)s>
-                PREFIX rdf: <%(rdf)s>
-                PREFIX bibo: <%(bibo)s>
-                SELECT ?ms
-                WHERE {
-                    ?doc schema:about <%(belfast_group)s> .
-                    ?doc schema:about ?coll .
-                    ?coll schema:mentions ?ms .
-                    ?ms rdf:type bibo:Manuscript
-                }
-                ''' % {'schema': rdfns.SCHEMA_ORG,
-                       'rdf': rdflib.RDF,
-                       'bibo': rdfns.BIBO,
-                       'belfast_group': rdfns.BELFAST_GROUP_URI
-                       }
-            )
+            res = run_query(graph, 'collection_manuscripts_about',
+                            group=rdfns.BELFAST_GROUP_URIREF)
 
         # if no manuscripts are found, stop and do not update the file
         if len(res) == 0:
@@ -144,12 +119,15 @@ class SmushGroupSheets(object):
     # untitled works into a single work
     groupsheet_ids = defaultdict(list)
 
-    def __init__(self, graph, verbosity=1):
+    def __init__(self, graph, verbosity=1, contexts=None):
         self.verbosity = verbosity
         self.full_graph = graph
 
         # iterate over all contexts in a conjunctive graph and process each one
-        for ctx in graph.contexts():
+        # (or only the specified contexts, e.g. new or changed data)
+        if contexts is None:
+            contexts = graph.contexts()
+        for ctx in contexts:
             self.process_graph(ctx)
 
         # dictionary to keep track of unique group sheet ids within a particular graph,
@@ -318,27 +296,112 @@ class SmushGroupSheets(object):
         smush(graph, new_uris)
 
 
-def smush(graph, urimap):
-    '''Iterate over all triples in a graph and convert any
-    URIs in the specified dictionary key to the new identifier in the
-    corresponding value.'''
+class UriRewrites(object):
+    '''Collect URI rewrites (e.g., blank nodes or external URIs to be
+    converted to local URIs) and apply them to a graph in a single batch.
+
+    Rather than iterating over every triple in the graph, only triples that
+    mention one of the URIs being replaced are found, using the subject and
+    object indexes of the store, and all of the changes are applied together
+    and committed once.  For context-aware graphs, updated triples are kept
+    in the contexts they came from.
+
+    :param graph: :class:`rdflib.Graph` or :class:`rdflib.ConjunctiveGraph`
+    :param urimap: optional initial dictionary of old URI and new URI
+    '''
 
-    # special cases / exemptions
-    # predicates where the object should *NOT* smushed
-    # e.g., TEI groupsheet url or sameAs from local uri to VIAF or similar
+    #: predicates where the object should *NOT* be smushed
+    #: e.g., TEI groupsheet url or sameAs from local uri to VIAF or similar
     exceptions = [rdfns.SCHEMA_ORG.URL, rdflib.OWL.sameAs]
 
-    for s, p, o in graph:
-        orig_s = s
-        orig_o = o
-        s = urimap.get(s, s)
-        if not p in exceptions:
-            o = urimap.get(o, o)
+    def __init__(self, graph, urimap=None):
+        self.graph = graph
+        self.urimap = {}
+        if urimap:
+            self.update(urimap)
+
+    def __len__(self):
+        return len(self.urimap)
+
+    def add(self, old, new):
+        'Add a single URI rewrite'
+        if old != new:
+            self.urimap[old] = new
+
+    def update(self, urimap):
+        'Add all the URI rewrites in a dictionary'
+        for old, new in urimap.iteritems():
+            self.add(old, new)
+
+    def resolve(self, uri):
+        '''Final replacement for a URI, following any chained rewrites
+        (e.g., A to B and B to C), as if they had been applied in order.'''
+        seen = set([uri])
+        while uri in self.urimap:
+            uri = self.urimap[uri]
+            if uri in seen:
+                break
+            seen.add(uri)
+        return uri
+
+    def _statements(self, pattern):
+        # triples matching a pattern, with the context they belong to
+        if getattr(self.graph, 'context_aware', False):
+            for s, p, o, ctx in self.graph.quads(pattern):
+                yield s, p, o, ctx
+        else:
+            for s, p, o in self.graph.triples(pattern):
+                yield s, p, o, None
+
+    def apply(self):
+        '''Apply all collected rewrites to the graph.
+
+        :returns: number of triples updated
+        '''
+        if not self.urimap:
+            return 0
+
+        # find only the statements that reference one of the old uris
+        statements = {}
+        for uri in self.urimap:
+            for pattern in [(uri, None, None), (None, None, uri)]:
+                for s, p, o, ctx in self._statements(pattern):
+                    key = (s, p, o, ctx.identifier if ctx is not None else None)
+                    statements[key] = ctx
+
+        removed = []
+        added = []
+        for (s, p, o, ctx_id), ctx in statements.iteritems():
+            new_s = self.resolve(s)
+            new_o = o if p in self.exceptions else self.resolve(o)
+            if new_s != s or new_o != o:
+                removed.append((s, p, o, ctx))
+                added.append((new_s, p, new_o, ctx))
+
+        for s, p, o, ctx in removed:
+            if ctx is None:
+                self.graph.remove((s, p, o))
+            else:
+                self.graph.remove((s, p, o, ctx))
+        if getattr(self.graph, 'context_aware', False):
+            self.graph.addN(added)
+        else:
+            for s, p, o, ctx in added:
+                self.graph.add((s, p, o))
+        self.graph.commit()
+
+        logger.debug('Rewrote %d uri(s) in %d triple(s)', len(self.urimap),
+                     len(added))
+        self.urimap = {}
+        return len(added)
+
+
+def smush(graph, urimap):
+    '''Convert any URIs in the specified dictionary key to the new identifier
+    in the corresponding value, everywhere they occur in the graph.  See
+    :class:`UriRewrites`.'''
+    return UriRewrites(graph, urimap).apply()
 
-        if orig_s != s or orig_o != o:
-            # if changed remove old version, add new version
-            graph.remove((orig_s, p, orig_o))
-            graph.add((s, p, o))
 
 class Person(rdflib.resource.Resource):
     'minimal person resource, for use in cleaning up person data'
@@ -404,14 +467,21 @@ class ProfileUris(object):
     who will have profile pages on the site; smush or add relations to
     any additional information that will be needed for generating profiles.'''
 
-    def __init__(self, graph, verbosity=1):
+    def __init__(self, graph, verbosity=1, contexts=None):
         self.verbosity = verbosity
         self.current_site = Site.objects.get(id=settings.SITE_ID)
 
         self.full_graph = graph
+        # uris to be converted throughout the full graph are collected
+        # while processing contexts and applied in a single batch
+        self.fullgraph_uris = UriRewrites(graph)
         # iterate over all contexts in a conjunctive graph and process each one
-        for ctx in list(graph.contexts()):  # store before iterating in case of changes
+        # (or only the specified contexts, e.g. new or changed data)
+        if contexts is None:
+            contexts = graph.contexts()
+        for ctx in list(contexts):  # store before iterating in case of changes
             self.process_graph(ctx)
+        self.fullgraph_uris.apply()
 
         # TODO: consider keeping track of total number of replacements to assist with testing
         # (might be inflated due to blank nodes across contexts...)
@@ -441,20 +511,9 @@ class ProfileUris(object):
         # (adds affiliation rel for all groupsheet authors)
 
         # sparql query to find groupsheet authors
-        query = '''
-            PREFIX schema: <%(schema)s>
-            PREFIX dc: <%(dc)s>
-            PREFIX rdf: <%(rdf)s>
-            SELECT DISTINCT ?author
-            WHERE {
-                ?ms rdf:type <%(bg)s> .
-                ?ms dc:creator ?author .
-                FILTER regex(str(?author), "^(?!http://%(local_domain)s)")
-            }''' % {'schema': rdfns.SCHEMA_ORG, 'dc': rdfns.DC,
-                    'rdf': rdflib.RDF, 'bg': rdfns.BG.GroupSheet,
-                    'local_domain': self.current_site.domain}
+        local = local_prefix(self.current_site.domain)
         start = time.time()
-        res = graph.query(query)
+        res = run_query(graph, 'nonlocal_groupsheet_authors', local_prefix=local)
         if res:
             logger.debug('Found %d group sheets author(s) in %.02f sec', len(res),
                 time.time() - start)
@@ -462,18 +521,8 @@ class ProfileUris(object):
 
         start = time.time()
         # query to find people with any rdf relation to the belfast group
-        query = '''
-            PREFIX schema: <%(schema)s>
-            PREFIX rdf: <%(rdf)s>
-            SELECT DISTINCT ?person
-            WHERE {
-                ?person rdf:type schema:Person .
-                ?person ?rel <%(bg_uri)s>
-                FILTER regex(str(?person), "^(?!http://%(local_domain)s)")
-            }''' % {'schema': rdfns.SCHEMA_ORG,
-                    'rdf': rdflib.RDF, 'bg_uri': rdfns.BELFAST_GROUP_URI,
-                    'local_domain': self.current_site.domain}
-        res = graph.query(query)
+        res = run_query(graph, 'nonlocal_people_related_to',
+                        group=rdfns.BELFAST_GROUP_URIREF, local_prefix=local)
         if res:
             logger.debug('Found %d people connected to the Belfast Group in %.02f sec',
                         len(res), time.time() - start)
@@ -527,7 +576,6 @@ class ProfileUris(object):
         # and where things are going wrong when people get lost
 
         ctx_uris = {}
-        fullgraph_uris = {}
         people = self.belfast_group_people(graph)
         # nothing to do in this graph context; stop processing
         if not people:
@@ -572,12 +620,12 @@ class ProfileUris(object):
             # proper URIs (e.g. VIAF ids) should be converted anywhere
             # they occur, throughout the graph
             if not isinstance(subject, rdflib.BNode):
-                fullgraph_uris[subject] = uriref
+                self.fullgraph_uris.add(subject, uriref)
 
             # NOTE: dbpedia rel will be harvested via VIAF
 
-        # after processing people in this context, convert all uris
-        smush(self.full_graph, fullgraph_uris)
+        # after processing people in this context, convert uris in the
+        # context; full graph uris are converted after all contexts
         smush(graph, ctx_uris)
 
 
@@ -613,18 +661,30 @@ class InferConnections(object):
     date_re = re.compile(r'^(?P<year>\d{4})(-(?P<month>\d{2})-(?P<day>\d{2}))?(/(?P<year2>\d{4}))?$')
 
 
-    def __init__(self, graph):
+    def __init__(self, graph, contexts=None):
         self.full_graph = graph
         self.current_site = Site.objects.get(id=settings.SITE_ID)
 
-        for ctx in graph.contexts():
+        # process all contexts, or only the specified contexts
+        # (e.g. new or changed data)
+        groupsheets = None
+        if contexts is None:
+            contexts = graph.contexts()
+        else:
+            contexts = list(contexts)
+            # group sheets in the contexts being processed
+            groupsheets = set()
+            for ctx in contexts:
+                groupsheets.update(ctx.subjects(rdflib.RDF.type, rdfns.BG.GroupSheet))
+
+        for ctx in contexts:
             self.process_graph(ctx)
 
         # NOTE: running this only on context graphs **misses* some people
         # (probably due to a bug with context earlier in the data prep
         # process, possibly relating to external data like VIAF)
         # Run on the entire network to avoid missing anyone.
-        self.bg_associates(graph)
+        self.bg_associates(graph, groupsheets)
 
     def process_graph(self, graph):
         '''Process a graph and add direct relationships for authors of poems
@@ -646,38 +706,40 @@ class InferConnections(object):
             # infer ownership of groupsheet copies based on archival collection
             self.ownership(m, graph)
 
-    def bg_associates(self, graph):
-        # *** find authors and owners of groupsheets and explicitly associate
-        # them with the Belfast Group
-        res = graph.query('''
-                PREFIX schema: <%(schema)s>
-                PREFIX dc: <%(dc)s>
-                PREFIX rdf: <%(rdf)s>
-                PREFIX bg: <%(bg)s>
-                SELECT DISTINCT ?person
-                WHERE {
-                    ?ms rdf:type bg:GroupSheet .
-                    {?ms dc:creator ?person }
-                      UNION
-                    {?person schema:owns ?ms }
-                }
-                ''' % {'schema': rdfns.SCHEMA_ORG, 'dc': rdfns.DC,
-                       'rdf': rdflib.RDF, 'bg': rdfns.BG}
-        )
-        for r in res:
+    def bg_associates(self, graph, groupsheets=None):
+        '''Find authors and owners of groupsheets and explicitly associate
+        them with the Belfast Group.
+
+        :param graph: full graph
+        :param groupsheets: optional set of group sheet URIs; if specified,
+            only authors and owners of these group sheets are processed
+        '''
+        if groupsheets is None:
+            res = run_query(graph, 'groupsheet_people')
+            people = [r['person'] for r in res]
+        else:
+            people = set()
+            for ms in groupsheets:
+                people.update(graph.objects(ms, rdfns.DC.creator))
+                people.update(graph.subjects(rdfns.SCHEMA_ORG.owns, ms))
+
+        # local uris are converted everywhere in the graph in one batch
+        rewrites = UriRewrites(self.full_graph)
+        for person in people:
             # triple to indicate the author is affiliated with BG
-            bg_assoc = (r['person'], rdfns.SCHEMA_ORG.affiliation, rdflib.URIRef(rdfns.BELFAST_GROUP_URI))
+            bg_assoc = (person, rdfns.SCHEMA_ORG.affiliation, rdflib.URIRef(rdfns.BELFAST_GROUP_URI))
             if bg_assoc not in graph:
                 graph.add(bg_assoc)
 
             # if person does not have a local uri (i.e., owner and not author),
             # generate one now (can't detect sooner)
-            if not str(r['person']).startswith('http://%s' % self.current_site.domain):
-                uri = ProfileUris.convert_to_localprofile(graph, r['person'],
+            if not str(person).startswith('http://%s' % self.current_site.domain):
+                uri = ProfileUris.convert_to_localprofile(graph, person,
                     self.full_graph)
                 if uri is not None:
                     # if local uri was generated, convert everywhere in the graph
-                    smush(self.full_graph, {r['person']: rdflib.URIRef(uri)})
+                    rewrites.add(person, rdflib.URIRef(uri))
+        rewrites.apply()
 
 
     def time_period(self, ms, graph):
@@ -11,6 +11,8 @@ from djangotoolbox.db.base import NonrelDatabaseFeatures, \
     NonrelDatabaseValidation, NonrelDatabaseIntrospection, \
     NonrelDatabaseCreation
 
+from belfast.rdf import storestats
+
 logger = logging.getLogger(__name__)
 
 
@@ -57,11 +59,28 @@ class DatabaseWrapper(NonrelDatabaseWrapper):
         self.validation = DatabaseValidation(self)
         self.introspection = DatabaseIntrospection(self)
 
+        self.open_graph()
+
+    def open_graph(self):
+        # open the database by its real path, so that if it is in a
+        # versioned data directory (see belfast.dataversions), this
+        # connection stays with the same version until it is reopened
+        self.path = os.path.realpath(self.settings_dict['NAME'])
         logger.debug('opening Sleepycat RDF DB connection')
-        self.db_connection = rdflib.ConjunctiveGraph('Sleepycat')
+        # use an instrumented graph to record store access per request,
+        # if configured
+        graph_class = storestats.InstrumentedGraph if storestats.enabled() \
+            else rdflib.ConjunctiveGraph
+        if not os.path.isdir(os.path.dirname(self.path)):
+            # e.g., no data version has been activated yet
+            logger.error('Sleepycat RDF DB directory %s does not exist',
+                         os.path.dirname(self.path))
+            self.db_connection = graph_class('IOMemory')
+            return
+
+        self.db_connection = graph_class('Sleepycat')
         try:
-            rval = self.db_connection.open(self.settings_dict['NAME'],
-                                           create=False)
+            rval = self.db_connection.open(self.path, create=False)
         except (MemoryError, DBRunRecoveryError, DBPageNotFoundError):
             logger.warn('Sleepycat RDF DB Error; clearing __db.00x files')
             # if we got far enough to open the store, close it
@@ -73,20 +92,40 @@ class DatabaseWrapper(NonrelDatabaseWrapper):
             # Removing the __db.00x files clears the sessions and makes
             # it possible to re-open a connection without losing any
             # of the RDF data.
-            db_session_files = glob.glob(os.path.join(self.settings_dict['NAME'], '__db.00?'))
+            db_session_files = glob.glob(os.path.join(self.path, '__db.00?'))
             for dbfile in db_session_files:
                 os.remove(dbfile)
             # re-open the db, which should create new __db.00x files
-            rval = self.db_connection.open(self.settings_dict['NAME'], create=False)
+            rval = self.db_connection.open(self.path, create=False)
 
         if rval == NO_STORE:
             # if store doesn't exist yet, go ahead and create it
             logger.debug('Sleepycat RDF DB does not yet exist, creating it')
-            self.db_connection.open(self.settings_dict['NAME'], create=True)
+            self.db_connection.open(self.path, create=True)
 
         elif rval != VALID_STORE:
             logger.error('Sleepycat RDF DB is not valid')
 
+    def reopen_if_replaced(self):
+        '''Reopen the database if the configured path now refers to a
+        different database, i.e. a new data version has been activated.'''
+        if os.path.realpath(self.settings_dict['NAME']) == self.path:
+            return
+        logger.info('RDF DB %s has been replaced; reopening',
+                    self.settings_dict['NAME'])
+        if self._graph_is_open():
+            self.db_connection.close()
+        self.open_graph()
+
+    def _graph_is_open(self):
+        # in-memory stores have no is_open method
+        is_open = getattr(self.db_connection.store, 'is_open', None)
+        return is_open() if is_open is not None else False
+
+    def close_if_unusable_or_obsolete(self):
+        # called by django at the start and end of every request
+        self.reopen_if_replaced()
+
     def close(self):
         logger.debug('RDF DB wrapper close requested')
         # when running unit tests, django seems to close the db
@@ -96,6 +135,6 @@ class DatabaseWrapper(NonrelDatabaseWrapper):
         if getattr(settings, 'RDF_DATABASE_TESTMODE', False):
             logger.debug('RDF DB testmode, not closing Sleepycat RDF DB connection')
             return
-        if self.db_connection.store.is_open():
+        if self._graph_is_open():
             logger.debug('closing Sleepycat RDF DB connection')
             self.db_connection.close()
\ No newline at end of file
@@ -0,0 +1,65 @@
+import logging
+
+import rdflib
+
+from djangotoolbox.db.base import NonrelDatabaseWrapper
+
+from belfast.rdf import storestats
+from belfast.rdf.snapshot import open_snapshot
+from belfast.rdf.db_backends.sleepycat.base import DatabaseFeatures, \
+    DatabaseOperations, DatabaseClient, DatabaseCreation, DatabaseValidation, \
+    DatabaseIntrospection
+
+logger = logging.getLogger(__name__)
+
+
+## NOTE: like the sleepycat backend, this is a *bare-minimum* backend that
+# only provides access to the database connection.  The RDF data is read
+# from a read-only snapshot generated by the data prep process
+# (see belfast.rdf.snapshot); configure with NAME set to the snapshot file.
+
+
+class DatabaseWrapper(NonrelDatabaseWrapper):
+    def __init__(self, *args, **kwds):
+        super(DatabaseWrapper, self).__init__(*args, **kwds)
+        self.features = DatabaseFeatures(self)
+        self.ops = DatabaseOperations(self)
+        self.client = DatabaseClient(self)
+        self.creation = DatabaseCreation(self)
+        self.validation = DatabaseValidation(self)
+        self.introspection = DatabaseIntrospection(self)
+
+        self.open_graph()
+
+    def open_graph(self):
+        # snapshot stores are shared by all threads in the process
+        store = open_snapshot(self.settings_dict['NAME'])
+        if store is None:
+            logger.error('RDF snapshot %s does not exist',
+                         self.settings_dict['NAME'])
+            store = 'IOMemory'
+        else:
+            logger.debug('using RDF snapshot %s', self.settings_dict['NAME'])
+
+        graph_class = storestats.InstrumentedGraph if storestats.enabled() \
+            else rdflib.ConjunctiveGraph
+        self.db_connection = graph_class(store)
+
+    def reopen_if_replaced(self):
+        '''Switch to the current snapshot store, if the snapshot file has
+        been replaced (e.g. a new data version has been activated; see
+        :mod:`belfast.dataversions`).'''
+        store = open_snapshot(self.settings_dict['NAME'])
+        if store is not None and store is not self.db_connection.store:
+            logger.info('RDF snapshot %s has been replaced',
+                        self.settings_dict['NAME'])
+            self.open_graph()
+
+    def close_if_unusable_or_obsolete(self):
+        # called by django at the start and end of every request
+        self.reopen_if_replaced()
+
+    def close(self):
+        # nothing to close; the snapshot store is shared and read-only,
+        # and is replaced when a new snapshot is written
+        logger.debug('RDF DB wrapper close requested; snapshot stays open')
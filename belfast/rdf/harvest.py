@@ -1,12 +1,16 @@
 # harvest rdf
 
+from collections import namedtuple
 from datetime import datetime
+from multiprocessing.pool import ThreadPool
 import os
+import Queue
 import rdflib
 import re
 import requests
 import SPARQLWrapper
 import sys
+import threading
 from urlparse import urlparse
 import logging
 
@@ -19,10 +23,20 @@ except ImportError:
     ProgressBar = None
 
 from belfast import rdfns
+from belfast.rdf.changes import content_hash
+from belfast.rdf.httpsession import http_session
+from belfast.rdf.queries import run_query, local_prefix
 
 
 logger = logging.getLogger(__name__)
 
+
+#: result of fetching a single url for :class:`HarvestRdf`: the url,
+#: http response, parsed RDF data (as an :class:`rdflib.Graph`), and an
+#: error message if the url could not be loaded or parsed
+HarvestResult = namedtuple('HarvestResult', ['url', 'response', 'data', 'error'])
+
+
 class HarvestRdf(object):
     '''Harvest RDF data and add it to a local RDF datastore.
 
@@ -35,24 +49,48 @@ class HarvestRdf(object):
     :param graph: optional :class:`rdflib.graph.Graph`, if specified, harvested
         data will be added to the existing graph with a new graph context for
         each url
+    :param no_cache: request no cache when harvesting
+    :param workers: number of urls to fetch concurrently; defaults to
+        **HARVEST_WORKERS** if configured, otherwise 1 (one url at a time)
+    :param per_host: maximum number of concurrent requests to any single
+        host; defaults to **HARVEST_PER_HOST_LIMIT** if configured, otherwise 4
+    :param tracker: optional :class:`~belfast.rdf.changes.ChangeTracker`;
+        if specified, data that is unchanged since the last harvest is not
+        replaced, and new or changed data is recorded
     '''
 
     URL_QUEUE = set()  # use set to ensure we avoid duplication
     PROCESSED_URLS = set()
     total = 0
     harvested = 0
+    unchanged = 0
     errors = 0
 
     _serialize_opts = {}
 
+    #: response status codes that indicate a redirect to be queued
+    redirect_codes = [requests.codes.moved, requests.codes.see_other,
+                      requests.codes.found]
+
     def __init__(self, urls, output_dir=None, find_related=False, verbosity=1,
-                 format=None, graph=None, no_cache=False):
+                 format=None, graph=None, no_cache=False, workers=None,
+                 per_host=None, tracker=None):
         self.URL_QUEUE.update(set(urls))
         self.find_related = find_related
         self.base_dir = output_dir
         self.verbosity = int(verbosity)
         self.graph = graph
         self.no_cache = no_cache
+        self.tracker = tracker
+
+        if workers is None:
+            workers = getattr(settings, 'HARVEST_WORKERS', 1)
+        self.workers = max(1, int(workers))
+        if per_host is None:
+            per_host = getattr(settings, 'HARVEST_PER_HOST_LIMIT', 4)
+        self.per_host = max(1, int(per_host))
+        # urls currently being fetched, so they are not queued twice
+        self.in_progress = set()
 
         self.format = format
         if format is not None:
@@ -71,105 +109,174 @@ class HarvestRdf(object):
         else:
             progress = None
 
-        while self.URL_QUEUE:
-            url = self.URL_QUEUE.pop()
-            self.harvest_rdf(url)
-            self.total += 1
-            self.PROCESSED_URLS.add(url)
-            if progress:
-                progress.maxval = self.total + len(self.URL_QUEUE)
-                progress.update(len(self.PROCESSED_URLS))
+        if self.workers > 1:
+            self.process_concurrently(progress)
+        else:
+            while self.URL_QUEUE:
+                url = self.URL_QUEUE.pop()
+                self.harvest_rdf(url)
+                self.url_processed(url, progress)
 
         if progress:
             progress.finish()
 
         # report if sufficient numbers:
         if self.verbosity >= 1 and (self.harvested > 5 or self.errors):
-            print 'Processed %d url%s: %d harvested, %d error%s' % \
+            print 'Processed %d url%s: %d harvested, %d unchanged, %d error%s' % \
                   (len(self.PROCESSED_URLS),
                    '' if len(self.PROCESSED_URLS) == 1 else 's',
-                   self.harvested, self.errors,
+                   self.harvested, self.unchanged, self.errors,
                    '' if self.errors == 1 else 's')
 
+    def process_concurrently(self, progress=None):
+        '''Process the url queue with a pool of worker threads.  Requests
+        and RDFa parsing run in the workers, limited to :attr:`per_host`
+        concurrent requests for any one host; all updates to the graph
+        (and discovery of related urls) happen serially in the calling
+        thread as results come back.'''
+        results = Queue.Queue()
+        host_limits = {}
+        pool = ThreadPool(self.workers)
+        pending = 0
+        try:
+            while self.URL_QUEUE or pending:
+                while self.URL_QUEUE:
+                    url = self.URL_QUEUE.pop()
+                    self.in_progress.add(url)
+                    host = urlparse(url).netloc
+                    if host not in host_limits:
+                        host_limits[host] = threading.BoundedSemaphore(self.per_host)
+                    # conditional request headers are based on the graph,
+                    # so determine them here rather than in the worker
+                    pool.apply_async(self.fetch,
+                                     (url, self.request_headers(url),
+                                      host_limits[host]),
+                                     callback=results.put)
+                    pending += 1
+
+                result = results.get()
+                pending -= 1
+                self.in_progress.discard(result.url)
+                self.process_result(result)
+                self.url_processed(result.url, progress)
+        finally:
+            pool.close()
+            pool.join()
+
+    def url_processed(self, url, progress=None):
+        # update totals and progress after processing a url
+        self.total += 1
+        self.PROCESSED_URLS.add(url)
+        if progress:
+            progress.maxval = self.total + len(self.URL_QUEUE) + \
+                len(self.in_progress)
+            progress.update(len(self.PROCESSED_URLS))
+
     def harvest_rdf(self, url):
         '''Harvest RDF from a particular URL.
 
         '''
-        g = self.graph.get_context(url)
-        if g and len(g):
-            last_modified = g.value(g.identifier, rdfns.SCHEMA_ORG.dateModified)
-            # TODO: use g.set(triple) to replace; may need to adjust date formats
-            try:
-                if self.no_cache:
-                    headers={'cache-control': 'no-cache'}
-                else:
-                    headers={'if-modified-since': last_modified}
-
-                response = requests.get(url, headers=headers,
-                                        allow_redirects=False)
-                # if this is a redirect, don't follow but add the real
-                # url to the queue; this avoids an issue where related
-                # links are generated relative to the initial url rather
-                #  than the actual, resolved url
-                if response.status_code in [requests.codes.moved,
-                                            requests.codes.see_other,
-                                            requests.codes.found]:
-                    self.queue_url(response.headers['location'])
-                    return
-
-                elif response.status_code == requests.codes.not_modified:
-                    # print '%s not modified since last harvested' % url
-                    return  # nothing to do
-                else:
-                    # otherwise, remove the current context to avoid errors/duplication
-                    self.graph.remove_context(g)
-
-            except Exception as err:
-                print 'Error attempting to load %s - %s' % (url, err)
-                self.errors += 1
-                return
-
-                # last_modified = g.value(g.identifier, rdfns.SCHEMA_ORG.dateModified)
-                # TODO: use g.set(triple) to replace
-
-        else:
+        self.process_result(self.fetch(url, self.request_headers(url)))
+
+    def request_headers(self, url):
+        '''Determine HTTP request headers for harvesting the specified url.
+        If data has already been harvested from this url, the last-modified
+        date is used to make a conditional request.'''
+        headers = {}
+        if self.no_cache:
+            headers['cache-control'] = 'no-cache'
+        elif self.graph is not None:
+            g = self.graph.get_context(url)
+            if g and len(g):
+                # TODO: use g.set(triple) to replace; may need to adjust date formats
+                last_modified = g.value(g.identifier, rdfns.SCHEMA_ORG.dateModified)
+                if last_modified is not None:
+                    headers['if-modified-since'] = last_modified
+        return headers
+
+    def fetch(self, url, headers, host_limit=None):
+        '''Request a url and parse any RDFa in the response into a temporary
+        graph.  Does not modify the harvest graph, so it is safe to call
+        from a worker thread.  Errors are reported on the result rather than
+        raised.
+
+        :param url: url to be fetched
+        :param headers: dictionary of HTTP request headers
+        :param host_limit: optional semaphore used to limit concurrent
+            requests to the url host
+        :returns: :class:`HarvestResult`
+        '''
+        try:
+            if host_limit is not None:
+                host_limit.acquire()
             try:
-                headers = {}
-                if self.no_cache:
-                    headers['cache-control'] = 'no-cache'
-                response = requests.get(url, headers=headers,
-                    allow_redirects=False)
-                if response.status_code in [requests.codes.moved,
-                                            requests.codes.see_other,
-                                            requests.codes.found]:
-                    self.queue_url(response.headers['location'])
-                    return
-
-            except Exception as err:
-                print 'Error attempting to load %s - %s' % (url, err)
-                self.errors += 1
-                return
-
-        # g = rdflib.ConjunctiveGraph()
-        # use the conjunctive graph store for persistence, url as context
-
-        # TODO: if context already present, use last-modified from the rdf
-        # and conditional GET to speed this up
+                # don't follow redirects, but add the real url to the queue;
+                # this avoids an issue where related links are generated
+                # relative to the initial url rather than the actual, resolved url
+                response = http_session().get(url, headers=headers,
+                                              allow_redirects=False)
+            finally:
+                if host_limit is not None:
+                    host_limit.release()
+        except Exception as err:
+            return HarvestResult(url, None, None,
+                                 'Error attempting to load %s - %s' % (url, err))
 
-        # either new or old version removed
-        g = rdflib.Graph(self.graph.store, url)
+        if response.status_code in self.redirect_codes or \
+           response.status_code == requests.codes.not_modified:
+            return HarvestResult(url, response, None, None)
 
+        data = rdflib.Graph(identifier=url)
         try:
-            data = g.parse(data=response.content, location=url, format='rdfa')
+            data.parse(data=response.content, location=url, format='rdfa')
             # NOTE: this was working previously, and should be fine,
             # but now generates an RDFa parsing error / ascii codec error
             # data = g.parse(location=url, format='rdfa')
         except Exception as err:
-            print 'Error attempting to parse %s - %s' % (url, err)
+            return HarvestResult(url, response, None,
+                                 'Error attempting to parse %s - %s' % (url, err))
+
+        return HarvestResult(url, response, data, None)
+
+    def process_result(self, result):
+        '''Add the data from a :class:`HarvestResult` to the graph,
+        replacing any previously harvested version, and queue related urls
+        if :attr:`find_related` is set.'''
+        url = result.url
+        response = result.response
+
+        if response is not None:
+            if response.status_code in self.redirect_codes:
+                self.queue_url(response.headers['location'])
+                return
+
+            elif response.status_code == requests.codes.not_modified:
+                # print '%s not modified since last harvested' % url
+                return  # nothing to do
+
+        # if the content is the same as the previous harvest, keep the
+        # existing (already processed) version of the data
+        content = None
+        unchanged = False
+        if self.tracker is not None and self.graph is not None and \
+           result.error is None and len(result.data):
+            content = content_hash(result.data)
+            g = self.graph.get_context(url)
+            unchanged = not self.tracker.changed(url, content) and g and len(g)
+
+        if response is not None and not unchanged:
+            # otherwise, remove the current context to avoid errors/duplication
+            if self.graph is not None:
+                g = self.graph.get_context(url)
+                if g and len(g):
+                    self.graph.remove_context(g)
+
+        if result.error is not None:
+            print result.error
             self.errors += 1
-            self.graph.remove_context(g)
             return
 
+        data = result.data
         triple_count = len(data)
         # if no rdf data was found, report and return
         if triple_count == 0:
@@ -180,18 +287,26 @@ class HarvestRdf(object):
             if self.verbosity > 1:
                 print 'Parsed %d triples from %s' % (triple_count, url)
 
+        if unchanged:
+            if self.verbosity > 1:
+                print '%s unchanged since last harvested' % url
+            self.unchanged += 1
 
-        # replace schema.org/dateModified with full date-time from http response
-        # so we can use it for conditional get when re-harvesting
-        if 'last-modified' in response.headers:
-            g.set((g.identifier, rdfns.SCHEMA_ORG.dateModified, rdflib.Literal(response.headers['last-modified'])))
+        elif self.graph is not None:
+            # use the conjunctive graph store for persistence, url as context
+            g = rdflib.Graph(self.graph.store, url)
+            g.addN((s, p, o, g) for s, p, o in data)
 
-        # TODO: add graph with context?
-        if self.graph is not None:
+            # replace schema.org/dateModified with full date-time from http response
+            # so we can use it for conditional get when re-harvesting
+            if 'last-modified' in response.headers:
+                g.set((g.identifier, rdfns.SCHEMA_ORG.dateModified,
+                       rdflib.Literal(response.headers['last-modified'])))
 
-            # automatically updates in the store
-            pass
-            # self.graph.addN([(s, p, o, url) for s, p, o in data])
+            # record new content so later prep stages will process it
+            if self.tracker is not None:
+                self.tracker.record(url, content)
+            self.harvested += 1
 
         else:
             filename = self.filename_from_url(url)
@@ -199,8 +314,7 @@ class HarvestRdf(object):
                 print 'Saving as %s' % filename
                 with open(filename, 'w') as datafile:
                     data.serialize(datafile, **self._serialize_opts)
-
-        self.harvested += 1
+            self.harvested += 1
 
         # if find related is true, look for urls related to this one
         # via either schema.org relatedLink or dcterms:hasPart
@@ -251,9 +365,10 @@ class HarvestRdf(object):
             return os.path.join(self.base_dir, '%s.%s' % (filebase, self.format))
 
     def queue_url(self, url):
-        # Add a url to the queue if it is not already queued
+        # Add a url to the queue if it is not already queued, in progress,
         # or processed.  Returns True if a url was queued.
-        if url not in self.URL_QUEUE and url not in self.PROCESSED_URLS:
+        if url not in self.URL_QUEUE and url not in self.PROCESSED_URLS \
+           and url not in self.in_progress:
             self.URL_QUEUE.add(url)
             return True
         return False
@@ -293,18 +408,7 @@ class Annotate(object):
         # and probably should pull default title/name
 
         start = datetime.now()
-        res = self.graph.query('''
-            PREFIX schema: <%(schema)s>
-            PREFIX rdf: <%(rdf)s>
-            PREFIX geo: <%(geo)s>
-            SELECT DISTINCT ?uri
-            WHERE {
-                ?uri rdf:type schema:Place .
-
-            }
-            ''' % {'schema': rdfns.SCHEMA_ORG, 'rdf': rdflib.RDF,
-                   'geo': rdfns.GEO}
-        )
+        res = run_query(self.graph, 'places')
         # FILTER NOT EXISTS {?uri geo:lat ?lat}
         logger.info('Found %d places without lat/long in %s' % \
                     (len(res), datetime.now() - start))
@@ -337,7 +441,7 @@ class Annotate(object):
                         rdf_url = 'http://www.geonames.org/%s/about.rdf' % geonames_id
                     else:
                         rdf_url = uri
-                    data = requests.get(rdf_url, headers={'accept': 'application/rdf+xml'})
+                    data = http_session().get(rdf_url, headers={'accept': 'application/rdf+xml'})
                     if data.status_code == requests.codes.ok:
                         g.parse(data=data.content)
 
@@ -367,20 +471,8 @@ class Annotate(object):
 
         # find VIAF uris for people with local uris
         start = datetime.now()
-        res = self.graph.query('''
-            PREFIX schema: <%(schema)s>
-            PREFIX rdf: <%(rdf)s>
-            PREFIX owl: <%(owl)s>
-            SELECT DISTINCT ?viaf
-            WHERE {
-                ?uri rdf:type schema:Person .
-                ?uri owl:sameAs ?viaf
-                FILTER regex(str(?uri), "^http://%(domain)s")
-                FILTER regex(str(?viaf), "^http://viaf.org")
-            }
-            ''' % {'schema': rdfns.SCHEMA_ORG, 'rdf': rdflib.RDF,
-                   'owl': rdflib.OWL, 'domain': self.current_site.domain}
-        )
+        res = run_query(self.graph, 'local_people_viaf',
+                        local_prefix=local_prefix(self.current_site.domain))
         logger.info('Found %d VIAF person(s) in %s',
                     len(res), datetime.now() - start)
 
@@ -401,19 +493,17 @@ class Annotate(object):
                 continue
 
             # Use requests with content negotiation to load the data
-            data = requests.get(str(uri), headers={'accept': 'application/rdf+xml'})
+            try:
+                data = http_session().get(str(uri), headers={'accept': 'application/rdf+xml'})
+            except requests.RequestException as err:
+                logger.warn('Error loading VIAF data for %s : %s', uri, err)
+                data = None
 
-            if data.status_code == requests.codes.ok:
+            if data is not None and data.status_code == requests.codes.ok:
                 tmpgraph = rdflib.Graph()
                 tmpgraph.parse(data=data.content)
 
-                names = tmpgraph.query('''
-                    PREFIX foaf: <%(foaf)s>
-                    SELECT ?name
-                    WHERE {
-                       <%(uri)s> foaf:name ?name
-                    }
-                    ''' % {'foaf': rdfns.FOAF, 'uri': uri})
+                names = run_query(tmpgraph, 'foaf_names', uri=uri)
                 # NOTE: viaf names don't seem to be tagged by language
                 # (restricting to language returns nothing)
                 #     FILTER (lang(?name) = 'en')
@@ -441,37 +531,61 @@ class Annotate(object):
             progress.finish()
 
 
+    #: DBpedia properties to harvest for people, as SPARQL variable name
+    #: and RDF predicate
+    dbpedia_properties = [
+        ('abstract', rdfns.DBPEDIA_OWL.abstract),
+        ('wikipedia', rdfns.FOAF.isPrimaryTopicOf),
+    ]
+
+    #: SPARQL query for information about a batch of DBpedia uris;
+    #: restricted to the english abstract and wikipedia url, to avoid
+    #: the enormous responses generated by DESCRIBE for some records
+    dbpedia_query = u'''
+        PREFIX dbpedia-owl: <%(dbpedia_owl)s>
+        PREFIX foaf: <%(foaf)s>
+        SELECT ?uri ?abstract ?wikipedia
+        WHERE {
+            VALUES ?uri { %(uris)s }
+            OPTIONAL {
+                ?uri dbpedia-owl:abstract ?abstract
+                FILTER (lang(?abstract) = "en")
+            }
+            OPTIONAL { ?uri foaf:isPrimaryTopicOf ?wikipedia }
+        }
+    '''
+
     def dbpedia_people(self):
         '''Iterate over DBpedia identifiers in the local dataset and pull
         needed information from DBpedia for those entities, particularly abstract
-        (description) and link to Wikipedia.'''
+        (description) and link to Wikipedia.
+
+        DBpedia uris are queried in batches of **DBPEDIA_BATCH_SIZE**, with
+        up to **DBPEDIA_WORKERS** batches requested concurrently from the
+        **DBPEDIA_SPARQL_ENDPOINT**.'''
 
         # not sure what graph context makes the most sense, so grouping by source
         context = self.graph.get_context('http://dbpedia.org/')
 
-        dbpedia_sparql = SPARQLWrapper.SPARQLWrapper("http://dbpedia.org/sparql")
-
         start = datetime.now()
         # find dbedia uris referenced by local uris
-        res = self.graph.query('''
-            PREFIX schema: <%(schema)s>
-            PREFIX rdf: <%(rdf)s>
-            PREFIX owl: <%(owl)s>
-            SELECT DISTINCT ?dbp
-            WHERE {
-                ?uri rdf:type schema:Person .
-                ?uri owl:sameAs ?viaf .
-                ?viaf owl:sameAs ?dbp
-                FILTER regex(str(?uri), "^http://%(domain)s")
-                FILTER regex(str(?dbp), "^http://dbpedia.org")
-            }
-            ''' % {'schema': rdfns.SCHEMA_ORG, 'rdf': rdflib.RDF,
-                   'owl': rdflib.OWL, 'domain': self.current_site.domain}
-        )
+        res = run_query(self.graph, 'local_people_dbpedia',
+                        local_prefix=local_prefix(self.current_site.domain))
         logger.info('Found %d DBpedia person(s) in %s',
                     len(res), datetime.now() - start)
 
-        uris = [unicode(r['dbp']).encode('ascii', 'ignore') for r in res]
+        # skip any uris where info has already been harvested
+        # (every dbpedia page should have a link to its corresponding wikipedia url)
+        uris = [rdflib.URIRef(unicode(r['dbp']).encode('ascii', 'ignore'))
+                for r in res]
+        uris = [u for u in uris
+                if self.graph.value(u, rdfns.FOAF.isPrimaryTopicOf) is None]
+
+        batch_size = getattr(settings, 'DBPEDIA_BATCH_SIZE', 50)
+        batches = [uris[i:i + batch_size]
+                   for i in range(0, len(uris), batch_size)]
+        if not batches:
+            return
 
         if len(uris) >= 5 and ProgressBar and os.isatty(sys.stderr.fileno()):
             widgets = [Percentage(), ' (', SimpleProgress(), ')',
@@ -481,56 +595,76 @@ class Annotate(object):
         else:
             progress = None
 
-        for uri in uris:
-
-            wikipedia_url = self.graph.value(uri, rdfns.FOAF.isPrimaryTopicOf)
-            if wikipedia_url:
-                # skipping; info has already been harvested
-                # (every dbpedia page should have a link to its corresponding wikipedia url)
-                continue
-
-            try:
-                uriref = rdflib.URIRef(uri)
-                dbpedia_sparql.setQuery(u'DESCRIBE <%s>' % uriref)
-                logger.debug('describing %s', uri)
-                # NOTE: DESCRIBE <uri> is the simplest query that's
-                # close to what we want and returns a response that
-                # can be easily converted to an rdflib graph, but it generates
-                # too many results for records like United States, England
-                dbpedia_sparql.setReturnFormat(SPARQLWrapper.RDF)
-
-                # convert to rdflib graph, then filter out any triples
-                # where our uri is not the subject
-                tmp_graph = dbpedia_sparql.query().convert()
-
-                for predicate in [rdfns.DBPEDIA_OWL.abstract,
-                                  rdfns.FOAF.isPrimaryTopicOf]:
-                    # rdfns.DBPEDIA_OWL.thumbnail]:
-                    objects = list(tmp_graph.objects(uriref, predicate))
-                    if objects:
-                        # if something returns multiple values (i.e. abstract)
-                        # find the one in english
-                        if len(objects) > 1:
-                            for o in objects:
-                                if o.language == 'en':
-                                    obj = o
-                                    break
-                        else:
-                            obj = objects[0]
-
-                        context.add((uriref, predicate, obj))
-                        logger.debug('Adding %s %s %s', uriref, predicate, obj)
-
-            except Exception as err:
-                print 'Error getting DBpedia data for %s : %s' % (uri, err)
+        # query batches concurrently, but add results to the graph
+        # from the main thread only
+        workers = min(getattr(settings, 'DBPEDIA_WORKERS', 4), len(batches))
+        pool = ThreadPool(workers)
+        try:
+            for batch, triples, error in pool.imap_unordered(self.dbpedia_batch,
+                                                             batches):
+                if error is not None:
+                    print error
+                for triple in triples:
+                    context.add(triple)
+                    logger.debug('Adding %s %s %s', *triple)
 
-            if progress:
-                processed += 1
-                progress.update(processed)
+                if progress:
+                    processed += len(batch)
+                    progress.update(processed)
+        finally:
+            pool.close()
+            pool.join()
 
         if progress:
             progress.finish()
 
+    def dbpedia_batch(self, uris):
+        '''Query DBpedia for abstract and Wikipedia url for a batch of uris.
+        Safe to call from a worker thread; errors are returned rather
+        than raised.
+
+        :param uris: list of :class:`rdflib.URIRef`
+        :returns: tuple of the list of uris, a list of triples to be added,
+            and an error message (None on success)
+        '''
+        endpoint = getattr(settings, 'DBPEDIA_SPARQL_ENDPOINT',
+                           'http://dbpedia.org/sparql')
+        query = self.dbpedia_query % {
+            'dbpedia_owl': rdfns.DBPEDIA_OWL, 'foaf': rdfns.FOAF,
+            'uris': ' '.join(u.n3() for u in uris)
+        }
+        logger.debug('querying DBpedia for %d uris', len(uris))
+        result_format = 'application/sparql-results+json'
+        try:
+            response = http_session().get(endpoint,
+                params={'query': query, 'format': result_format},
+                headers={'accept': result_format})
+            response.raise_for_status()
+            bindings = response.json()['results']['bindings']
+        except Exception as err:
+            return (uris, [], 'Error getting DBpedia data for %s : %s' % \
+                    (', '.join(uris), err))
+
+        triples = set()
+        for row in bindings:
+            uri = rdflib.URIRef(row['uri']['value'])
+            for name, predicate in self.dbpedia_properties:
+                if name in row:
+                    triples.add((uri, predicate, sparql_json_term(row[name])))
+        return (uris, triples, None)
+
+
+def sparql_json_term(value):
+    '''Convert a single value from a SPARQL JSON result binding to the
+    corresponding :mod:`rdflib` term.'''
+    if value['type'] == 'uri':
+        return rdflib.URIRef(value['value'])
+    elif value['type'] == 'bnode':
+        return rdflib.BNode(value['value'])
+    # literal or typed-literal
+    datatype = value.get('datatype')
+    return rdflib.Literal(value['value'], lang=value.get('xml:lang'),
+                          datatype=rdflib.URIRef(datatype) if datatype else None)
 
 
 # old/deprecated version
@@ -555,15 +689,8 @@ class HarvestRelated(object):
         for name, url in self.sources:
             # find anything that is a subject or object and has a
             # viaf, dbpedia, or geoname uri
-            res = self.graph.query('''
-                SELECT DISTINCT ?uri
-                WHERE {
-                    { ?uri ?p ?o }
-                UNION
-                    { ?s ?p ?uri }
-                FILTER regex(str(?uri), "^%s") .
-                }
-            ''' % url)
+            res = run_query(self.graph, 'uris_with_prefix',
+                            prefix=rdflib.Literal(url))
             print '%d %s URI%s' % (len(res), name,
                                    's' if len(res) != 1 else '')
 
@@ -653,9 +780,13 @@ class HarvestRelated(object):
 
                 else:
                     # Use requests with content negotiation to load the data
-                    data = requests.get(u, headers={'accept': 'application/rdf+xml'})
+                    try:
+                        data = http_session().get(u, headers={'accept': 'application/rdf+xml'})
+                    except requests.RequestException as err:
+                        print 'Error loading %s : %s' % (u, err)
+                        data = None
 
-                    if data.status_code == requests.codes.ok:
+                    if data is not None and data.status_code == requests.codes.ok:
                         # also add to master graph so we can download related data
                         # i.e.  dbpedia records for VIAF persons
                         # ONLY download related data for viaf (sameas dbpedia)
@@ -667,7 +798,7 @@ class HarvestRelated(object):
                         # tmp_graph = rdflib.Graph()
                         # tmp_graph.parse(data=data.content)
 
-                    else:
+                    elif data is not None:
                         print 'Error loading %s : %s' % (u, data.status_code)
 
                     # if tmp_graph:
@@ -690,9 +821,13 @@ class HarvestRelated(object):
 class LocalRDF(object):
     '''Harvest RDF from local HTML/RDFa fixtures and add information to the larger
     RDF graph. Uses the webpage identifier as context id, if available.
+
+    If a :class:`~belfast.rdf.changes.ChangeTracker` is specified, fixtures
+    that are unchanged since they were last added are skipped, and
+    changed fixtures replace the previous version.
     '''
 
-    def __init__(self, graph, files):
+    def __init__(self, graph, files, tracker=None):
         triple_count = 0
         for filepath in files:
             tmp_graph = rdflib.ConjunctiveGraph()
@@ -709,6 +844,14 @@ class LocalRDF(object):
                 # if no webpage/url, create a context with no graph id
                 g = rdflib.Graph(graph.store)
 
+            if tracker is not None:
+                content = content_hash(tmp_graph)
+                if not tracker.changed(g.identifier, content) and len(g):
+                    continue
+                # replace any previous version of the data
+                graph.remove_context(g)
+                tracker.record(g.identifier, content)
+
             for triple in tmp_graph:
                 g.add(triple)
 
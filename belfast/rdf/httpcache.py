@@ -0,0 +1,317 @@
+'''Persistent on-disk cache for HTTP responses fetched while harvesting
+and annotating RDF data, so that re-running the data prep (e.g. after
+``prep_dataset --clear``) does not re-download content that has not
+changed.
+
+Responses are stored in a cache directory, configured with
+**HARVEST_CACHE_DIR**:
+
+* ``entries/<key>.json`` - one entry per url and Accept header, with
+  the response status, headers (including ETag and Last-Modified),
+  the time it was fetched, and a checksum of the response body
+* ``objects/<checksum>`` - response bodies, stored by content, so
+  identical content is only stored once
+
+Entries newer than **HARVEST_CACHE_TTL** are returned without any network
+access; stale entries are revalidated with a conditional request.  The
+cache is limited to **HARVEST_CACHE_MAX_SIZE** bytes of content, and the
+least recently used entries are removed when it grows beyond that.  In
+offline mode, only cached responses are returned and nothing is
+requested from the network.
+'''
+
+from email.utils import parsedate_tz, mktime_tz
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+
+logger = logging.getLogger(__name__)
+
+
+class ResponseNotCached(requests.ConnectionError):
+    '''Raised in offline mode when a response is requested that is not
+    in the cache.'''
+    pass
+
+
+class ResponseCache(object):
+    '''Content-addressed, size-bounded HTTP response cache stored on disk.
+
+    :param cache_dir: base directory for cached content
+    :param ttl: number of seconds a cached response is considered fresh;
+        older responses are revalidated with the remote server
+    :param max_size: maximum size in bytes of cached response content
+    :param offline: if True, only return cached responses
+    '''
+
+    #: response status codes that will be cached
+    cacheable_status = [requests.codes.ok, requests.codes.moved,
+                        requests.codes.found, requests.codes.see_other,
+                        requests.codes.temporary_redirect]
+
+    #: headers preserved in the cache
+    cached_headers = ['content-type', 'etag', 'last-modified', 'location']
+
+    def __init__(self, cache_dir, ttl=7 * 24 * 60 * 60,
+                 max_size=500 * 1024 * 1024, offline=False):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.max_size = max_size
+        self.offline = offline
+        self.entry_dir = os.path.join(cache_dir, 'entries')
+        self.object_dir = os.path.join(cache_dir, 'objects')
+        for path in [self.entry_dir, self.object_dir]:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._lock = threading.Lock()
+        self._size = None
+
+    def key(self, url, accept=None):
+        'Cache key for a url and Accept header'
+        return hashlib.sha1('%s\n%s' % (url, accept or '')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.entry_dir, '%s.json' % key)
+
+    def _object_path(self, checksum):
+        return os.path.join(self.object_dir, checksum)
+
+    def _write(self, path, content):
+        # write to a temporary file and rename, so that concurrent
+        # readers never see a partially-written file
+        fd, tmpname = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(content)
+        os.rename(tmpname, path)
+
+    def lookup(self, url, accept=None):
+        '''Find the cache entry for a url and Accept header.
+
+        :returns: entry as a dictionary, or None if not cached
+        '''
+        path = self._entry_path(self.key(url, accept))
+        try:
+            with open(path) as entryfile:
+                entry = json.load(entryfile)
+            with open(self._object_path(entry['checksum']), 'rb') as body:
+                entry['content'] = body.read()
+        except (IOError, OSError, ValueError):
+            return None
+        # update access time on the entry for least-recently-used eviction
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry
+
+    def store(self, url, accept, response):
+        '''Store a response in the cache, if it is cacheable.'''
+        if response.status_code not in self.cacheable_status:
+            return
+        content = response.content or ''
+        checksum = hashlib.sha1(content).hexdigest()
+        obj_path = self._object_path(checksum)
+        if not os.path.exists(obj_path):
+            self._write(obj_path, content)
+        entry = {
+            'url': url,
+            'accept': accept,
+            'status': response.status_code,
+            'headers': dict((k, response.headers[k]) for k in self.cached_headers
+                            if k in response.headers),
+            'checksum': checksum,
+            'size': len(content),
+            'fetched': time.time()
+        }
+        entry_path = self._entry_path(self.key(url, accept))
+        with self._lock:
+            # size of any entry being replaced, so it isn't counted twice
+            try:
+                with open(entry_path) as entryfile:
+                    replaced = json.load(entryfile)['size']
+            except (IOError, OSError, ValueError, KeyError):
+                replaced = 0
+            self._write(entry_path, json.dumps(entry))
+            if self._size is not None:
+                self._size += len(content) - replaced
+        self.evict()
+
+    def refresh(self, url, accept, entry):
+        '''Mark an existing entry as fresh after successful revalidation.'''
+        entry = dict(entry)
+        del entry['content']
+        entry['fetched'] = time.time()
+        self._write(self._entry_path(self.key(url, accept)), json.dumps(entry))
+
+    def is_fresh(self, entry):
+        'Check if a cache entry is still within the configured TTL'
+        return time.time() - entry['fetched'] < self.ttl
+
+    def response(self, url, entry):
+        'Generate a :class:`requests.Response` from a cache entry.'
+        response = requests.Response()
+        response.status_code = entry['status']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.encoding = get_encoding_from_headers(response.headers)
+        response._content = entry['content']
+        response.url = url
+        response.from_cache = True
+        return response
+
+    def not_modified(self, url, entry):
+        'Generate a not-modified :class:`requests.Response` for a cache entry.'
+        response = requests.Response()
+        response.status_code = requests.codes.not_modified
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response._content = ''
+        response.url = url
+        response.from_cache = True
+        return response
+
+    def _matches_conditions(self, headers, entry):
+        # check if conditional request headers match the cached response
+        etag = entry['headers'].get('etag')
+        if etag and headers.get('if-none-match') == etag:
+            return True
+        last_modified = entry['headers'].get('last-modified')
+        since = headers.get('if-modified-since')
+        if last_modified and since:
+            last_modified = parsedate_tz(last_modified)
+            since = parsedate_tz(unicode(since))
+            if last_modified and since:
+                return mktime_tz(last_modified) <= mktime_tz(since)
+        return False
+
+    def get(self, fetch, url, headers=None, **kwargs):
+        '''Get a url, using a cached response where possible.
+
+        :param fetch: method to make the actual request if needed; will be
+            called with url, headers, and any other keyword arguments
+        :param url: url to request
+        :param headers: dictionary of request headers; Accept is used as
+            part of the cache key, and conditional headers (If-Modified-Since,
+            If-None-Match) are honored.  A Cache-Control no-cache header
+            bypasses cached content.
+        :returns: :class:`requests.Response`
+        '''
+        headers = CaseInsensitiveDict(headers or {})
+        # include any query parameters in the url used to key the cache
+        if kwargs.get('params'):
+            url = requests.Request('GET', url, params=kwargs.pop('params')).prepare().url
+        accept = headers.get('accept')
+        conditional = 'if-modified-since' in headers or 'if-none-match' in headers
+        no_cache = 'no-cache' in headers.get('cache-control', '')
+
+        entry = self.lookup(url, accept)
+        if entry is not None and (self.offline or
+                                  (self.is_fresh(entry) and not no_cache)):
+            with self._lock:
+                self.hits += 1
+            if conditional and self._matches_conditions(headers, entry):
+                return self.not_modified(url, entry)
+            return self.response(url, entry)
+
+        if self.offline:
+            raise ResponseNotCached('%s is not cached (offline mode)' % url)
+
+        with self._lock:
+            self.misses += 1
+
+        # revalidate a stale entry, unless the caller has its own conditions
+        if entry is not None and not conditional and not no_cache:
+            if entry['headers'].get('etag'):
+                headers['if-none-match'] = entry['headers']['etag']
+            if entry['headers'].get('last-modified'):
+                headers['if-modified-since'] = entry['headers']['last-modified']
+        else:
+            entry = None
+
+        response = fetch(url, headers=headers, **kwargs)
+        if entry is not None and \
+           response.status_code == requests.codes.not_modified:
+            with self._lock:
+                self.revalidated += 1
+            self.refresh(url, accept, entry)
+            return self.response(url, entry)
+
+        self.store(url, accept, response)
+        return response
+
+    def size(self):
+        'Total size in bytes of cached response content'
+        with self._lock:
+            if self._size is None:
+                self._size = sum(e['size'] for path, e in self._entries())
+            return self._size
+
+    def _entries(self):
+        # generator of entry path and entry info for all cache entries
+        for name in os.listdir(self.entry_dir):
+            path = os.path.join(self.entry_dir, name)
+            try:
+                with open(path) as entryfile:
+                    yield path, json.load(entryfile)
+            except (IOError, OSError, ValueError):
+                pass
+
+    def evict(self):
+        '''Remove least recently used entries until the cache is within the
+        configured maximum size, then remove any content no longer
+        referenced by an entry.'''
+        if self.size() <= self.max_size:
+            return
+        with self._lock:
+            entries = sorted(self._entries(),
+                             key=lambda e: os.path.getmtime(e[0]))
+            size = sum(e['size'] for path, e in entries)
+            while entries and size > self.max_size:
+                path, entry = entries.pop(0)
+                os.remove(path)
+                size -= entry['size']
+            referenced = set(e['checksum'] for path, e in entries)
+            for checksum in os.listdir(self.object_dir):
+                if checksum not in referenced:
+                    os.remove(self._object_path(checksum))
+            self._size = size
+        logger.debug('Evicted cached responses; cache size is now %d bytes', size)
+
+    def stats(self):
+        '''Cache usage statistics as a dictionary with number of **hits**,
+        **misses**, and stale entries **revalidated**.'''
+        return {'hits': self.hits, 'misses': self.misses,
+                'revalidated': self.revalidated}
+
+    def last_run(self):
+        '''Summary of the previous run saved with :meth:`save_run`, as a
+        dictionary; None if no run has been recorded.'''
+        try:
+            with open(os.path.join(self.cache_dir, 'lastrun.json')) as runfile:
+                return json.load(runfile)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def save_run(self, elapsed, **info):
+        '''Record a summary of the current run (elapsed time in seconds,
+        cache statistics, and any other info) to compare with the next one.'''
+        info.update(self.stats())
+        info.update({'elapsed': elapsed, 'date': time.time()})
+        self._write(os.path.join(self.cache_dir, 'lastrun.json'),
+                    json.dumps(info))
+
+    def report(self):
+        'Summary of :meth:`stats` as a string for display'
+        return 'Response cache: %(hits)d hit(s), %(misses)d miss(es), ' \
+            '%(revalidated)d revalidated' % self.stats()
@@ -0,0 +1,179 @@
+'''Shared, pooled HTTP session for harvesting RDF data and annotating it
+with information from other sources (VIAF, GeoNames, DBpedia).
+
+All requests made through :func:`http_session` share a single
+:class:`requests.Session`, so connections to the same host are kept alive
+and reused across the whole data prep run instead of opening a new
+TCP connection for every url.  Pool size, timeout and retry policy
+can be configured with **HARVEST_HTTP** in ``localsettings.py``.
+
+If **HARVEST_CACHE_DIR** is configured, GET requests are served from a
+persistent :class:`~belfast.rdf.httpcache.ResponseCache` where possible.
+'''
+
+import logging
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+try:
+    from requests.packages.urllib3.util.retry import Retry
+except ImportError:
+    # older versions of requests only support a number of retries
+    Retry = None
+
+from django.conf import settings
+
+from belfast.rdf.httpcache import ResponseCache
+
+
+logger = logging.getLogger(__name__)
+
+
+#: default session options; override any of these with **HARVEST_HTTP**
+DEFAULT_OPTIONS = {
+    # number of per-host connection pools to keep
+    'pool_connections': 10,
+    # maximum number of connections to keep open in each host pool;
+    # should be at least the number of concurrent harvest workers
+    'pool_size': 10,
+    # request timeout, in seconds
+    'timeout': 30,
+    # number of times to retry failed connections and server errors
+    'retries': 3,
+    # backoff between retries: factor * (2 ^ (retry - 1)) seconds
+    'backoff_factor': 0.5,
+}
+
+
+class HarvestSession(object):
+    '''Wrapper around a :class:`requests.Session` with pooled, keep-alive
+    connections, a default timeout, and retry with backoff.  Keeps track of
+    how many requests were made and how many connections were opened,
+    so connection reuse can be reported.
+
+    :param pool_connections: number of per-host connection pools
+    :param pool_size: maximum connections kept open per host
+    :param timeout: default request timeout in seconds
+    :param retries: number of retries for connection errors and
+        server errors
+    :param backoff_factor: backoff factor between retries
+    :param cache: optional :class:`~belfast.rdf.httpcache.ResponseCache`
+        for GET requests
+    '''
+
+    #: server errors that should be retried
+    retry_status = [500, 502, 503, 504]
+
+    def __init__(self, pool_connections=10, pool_size=10, timeout=30,
+                 retries=3, backoff_factor=0.5, cache=None):
+        self.timeout = timeout
+        self.cache = cache
+        if Retry is not None:
+            options = {'total': retries, 'backoff_factor': backoff_factor,
+                       'status_forcelist': self.retry_status}
+            try:
+                # when retries run out on a server error, return the
+                # last response (as requests without retries would)
+                # rather than raising RetryError
+                max_retries = Retry(raise_on_status=False, **options)
+            except TypeError:
+                # older versions of urllib3 always raise RetryError;
+                # callers should catch requests.RequestException
+                max_retries = Retry(**options)
+        else:
+            max_retries = retries
+
+        adapter = HTTPAdapter(pool_connections=pool_connections,
+                              pool_maxsize=pool_size,
+                              max_retries=max_retries)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.requests = 0
+        # connection pools used by this session, by scheme/host/port;
+        # references are kept so counts survive pool eviction
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        '''Make a request using the shared session; takes the same
+        parameters as :meth:`requests.Session.request`.  Uses the
+        configured timeout if none is specified.  GET requests are
+        served from the response cache, if there is one.'''
+        kwargs.setdefault('timeout', self.timeout)
+        if self.cache is not None and method == 'GET':
+            return self.cache.get(self._get, url, **kwargs)
+        return self._send(method, url, **kwargs)
+
+    def _get(self, url, **kwargs):
+        # make an uncached GET request; used by the response cache
+        return self._send('GET', url, **kwargs)
+
+    def _send(self, method, url, **kwargs):
+        response = self.session.request(method, url, **kwargs)
+        self._track(response)
+        return response
+
+    def get(self, url, **kwargs):
+        'Make a GET request; see :meth:`request`'
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        'Make a POST request; see :meth:`request`'
+        return self.request('POST', url, **kwargs)
+
+    def _track(self, response):
+        # keep track of the urllib3 connection pool used for a response
+        pool = getattr(response.raw, '_pool', None)
+        with self._lock:
+            self.requests += 1
+            if pool is not None:
+                self._pools[(pool.scheme, pool.host, pool.port)] = pool
+
+    def stats(self):
+        '''Connection statistics for this session, as a dictionary with
+        total number of **requests**, connections **opened**, and
+        requests that **reused** an existing connection.'''
+        with self._lock:
+            pools = self._pools.values()
+            opened = sum(p.num_connections for p in pools)
+            pool_requests = sum(p.num_requests for p in pools)
+            return {
+                'requests': self.requests,
+                'opened': opened,
+                'reused': max(0, pool_requests - opened)
+            }
+
+    def report(self):
+        'Summary of :meth:`stats` as a string for display'
+        return '%(requests)d HTTP request(s); %(opened)d connection(s) ' \
+            'opened, %(reused)d reused' % self.stats()
+
+
+_SESSION = None
+_session_lock = threading.Lock()
+
+
+def http_session():
+    '''Shared :class:`HarvestSession` for the current process, configured
+    with :data:`DEFAULT_OPTIONS` and any overrides in **HARVEST_HTTP**,
+    and a response cache if **HARVEST_CACHE_DIR** is set.'''
+    global _SESSION
+    if _SESSION is None:
+        with _session_lock:
+            if _SESSION is None:
+                opts = DEFAULT_OPTIONS.copy()
+                opts.update(getattr(settings, 'HARVEST_HTTP', {}))
+                cache_dir = getattr(settings, 'HARVEST_CACHE_DIR', None)
+                if cache_dir:
+                    cache_opts = {}
+                    if hasattr(settings, 'HARVEST_CACHE_TTL'):
+                        cache_opts['ttl'] = settings.HARVEST_CACHE_TTL
+                    if hasattr(settings, 'HARVEST_CACHE_MAX_SIZE'):
+                        cache_opts['max_size'] = settings.HARVEST_CACHE_MAX_SIZE
+                    opts['cache'] = ResponseCache(cache_dir, **cache_opts)
+                logger.debug('Initializing harvest HTTP session: %s', opts)
+                _SESSION = HarvestSession(**opts)
+    return _SESSION
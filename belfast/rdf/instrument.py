@@ -0,0 +1,215 @@
+'''Instrumentation for the data prep process.
+
+:class:`RunReport` records resource usage for each stage of
+``prep_dataset`` (harvest, queens, identify, smush, etc.): wall and CPU
+time, peak memory use, HTTP requests and response cache hits, SPARQL
+queries run, and triple and context counts before and after the stage.
+The report also includes parse and evaluation time for each named query
+in :mod:`belfast.rdf.queries`.  Reports can be saved as JSON and
+compared with the report from a previous run with
+:meth:`compare_reports`, to find which stages are responsible when a
+data rebuild is slow.
+'''
+
+from contextlib import contextmanager
+import datetime
+import functools
+import json
+import logging
+import os
+import resource
+import tempfile
+import threading
+import time
+
+import rdflib
+import SPARQLWrapper
+
+from belfast.rdf.httpsession import http_session
+from belfast.rdf.queries import registry as query_registry
+
+
+logger = logging.getLogger(__name__)
+
+
+def cpu_time():
+    'User and system CPU time used by the current process, in seconds'
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def peak_rss():
+    '''Peak resident set size of the current process, in kilobytes
+    (as reported by the operating system; bytes on Mac OS X).'''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class QueryCounter(object):
+    '''Count SPARQL queries run while installed, both against local
+    :mod:`rdflib` graphs and remote endpoints queried with
+    :mod:`SPARQLWrapper`.  Use as a context manager, or call
+    :meth:`install` and :meth:`uninstall`.'''
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+        self._originals = []
+
+    def _counted(self, method):
+        counter = self
+
+        @functools.wraps(method)
+        def counted(*args, **kwargs):
+            with counter._lock:
+                counter.count += 1
+            return method(*args, **kwargs)
+        return counted
+
+    def install(self):
+        'Start counting queries'
+        if self._originals:
+            return
+        for cls in [rdflib.graph.Graph, SPARQLWrapper.SPARQLWrapper]:
+            method = cls.__dict__['query']
+            self._originals.append((cls, method))
+            setattr(cls, 'query', self._counted(method))
+
+    def uninstall(self):
+        'Stop counting queries'
+        for cls, method in self._originals:
+            setattr(cls, 'query', method)
+        self._originals = []
+
+    def __enter__(self):
+        self.install()
+        return self
+
+    def __exit__(self, *args):
+        self.uninstall()
+
+
+class RunReport(object):
+    '''Record resource usage for each stage of a data prep run.
+
+    :param graph: optional :class:`rdflib.ConjunctiveGraph`; if specified,
+        triples and contexts are counted before and after each stage
+        (which requires scanning the store)
+    :param session: :class:`~belfast.rdf.httpsession.HarvestSession` used
+        for HTTP requests; defaults to :meth:`http_session`
+    '''
+
+    def __init__(self, graph=None, session=None):
+        self.graph = graph
+        self.session = session or http_session()
+        self.queries = QueryCounter()
+        #: list of dictionaries of information for each completed stage
+        self.stages = []
+        self.started = time.time()
+
+    def measure(self):
+        '''Current cumulative counts, as a dictionary.'''
+        info = {
+            'time': time.time(),
+            'cpu': cpu_time(),
+            'peak_rss': peak_rss(),
+            'requests': self.session.requests,
+            'cache_hits': self.session.cache.hits
+                if self.session.cache is not None else 0,
+            'queries': self.queries.count,
+        }
+        if self.graph is not None:
+            info['triples'] = len(self.graph)
+            info['contexts'] = len(list(self.graph.contexts()))
+        return info
+
+    @contextmanager
+    def stage(self, name):
+        '''Context manager to record a single stage.  Yields a dictionary
+        for the stage, where any stage-specific information (e.g., number
+        of documents harvested) can be added.'''
+        info = {'name': name}
+        before = self.measure()
+        self.queries.install()
+        try:
+            yield info
+        finally:
+            self.queries.uninstall()
+            after = self.measure()
+            info.update({
+                'elapsed': after['time'] - before['time'],
+                'cpu': after['cpu'] - before['cpu'],
+                'peak_rss': after['peak_rss'],
+                'rss_growth': after['peak_rss'] - before['peak_rss'],
+                'requests': after['requests'] - before['requests'],
+                'cache_hits': after['cache_hits'] - before['cache_hits'],
+                'queries': after['queries'] - before['queries'],
+            })
+            if self.graph is not None:
+                for count in ['triples', 'contexts']:
+                    info['%s_before' % count] = before[count]
+                    info['%s_after' % count] = after[count]
+            self.stages.append(info)
+            logger.debug('Stage %(name)s: %(elapsed).1f sec, %(cpu).1f sec CPU, '
+                         '%(requests)d request(s), %(queries)d queries' % info)
+
+    def as_dict(self):
+        'Report for the run as a dictionary'
+        return {
+            'date': datetime.datetime.fromtimestamp(self.started).isoformat(),
+            'elapsed': time.time() - self.started,
+            'peak_rss': peak_rss(),
+            'stages': self.stages,
+            'named_queries': query_registry.stats(),
+        }
+
+    def save(self, filename):
+        'Save the report as JSON'
+        dirname = os.path.dirname(os.path.abspath(filename))
+        fd, tmpname = tempfile.mkstemp(dir=dirname)
+        with os.fdopen(fd, 'w') as tmp:
+            json.dump(self.as_dict(), tmp, indent=1, sort_keys=True)
+        os.rename(tmpname, filename)
+
+    @staticmethod
+    def load(filename):
+        '''Load a report saved with :meth:`save`, as a dictionary; returns
+        None if the file does not exist or cannot be read.'''
+        try:
+            with open(filename) as reportfile:
+                return json.load(reportfile)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def summary(self, stage):
+        'Summary of a single stage as a string for display'
+        msg = '%(name)s: %(elapsed).1f sec (%(cpu).1f sec CPU), ' \
+              '%(requests)d HTTP request(s), %(queries)d SPARQL queries' % stage
+        if 'triples_after' in stage:
+            msg += ', %+d triples, %+d contexts' % \
+                (stage['triples_after'] - stage['triples_before'],
+                 stage['contexts_after'] - stage['contexts_before'])
+        return msg
+
+
+#: stage values compared by :meth:`compare_reports`
+COMPARE_FIELDS = ['elapsed', 'cpu', 'requests', 'queries']
+
+
+def compare_reports(previous, current):
+    '''Compare stages in two run reports (as returned by
+    :meth:`RunReport.as_dict` or :meth:`RunReport.load`).
+
+    :returns: list of tuples of stage name and dictionary of field and
+        tuple of previous and current values, for stages in the current
+        report that were also run in the previous one
+    '''
+    prev_stages = dict((s['name'], s) for s in previous.get('stages', []))
+    comparison = []
+    for stage in current.get('stages', []):
+        prev = prev_stages.get(stage['name'])
+        if prev is None:
+            continue
+        comparison.append((stage['name'],
+                           dict((field, (prev.get(field), stage.get(field)))
+                                for field in COMPARE_FIELDS)))
+    return comparison
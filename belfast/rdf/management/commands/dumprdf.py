@@ -2,10 +2,13 @@
 
 # script to dump rdf data from rdf database
 
+import hashlib
 from optparse import make_option
+import os
 import sys
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from belfast.rdf.bulk import open_output, write_quads
 from belfast.util import rdf_data
 
 
@@ -16,19 +19,71 @@ class Command(BaseCommand):
     v_normal = 1
 
     # NOTE: currently belfast data can only be exported successfully in XML
-    # and trix serialization formats; leaving here for convenience
+    # and trix serialization formats, or as N-Quads, which are written
+    # one quad at a time and preserve context information
     option_list = BaseCommand.option_list + (
         make_option('-f', '--format',
-            choices=('xml', 'n3', 'turtle', 'nt', 'pretty-xml', 'trix'),
+            choices=('xml', 'n3', 'turtle', 'nt', 'nquads', 'pretty-xml', 'trix'),
             default='xml',
             help='RDF export format (default: xml)'),
+        make_option('-o', '--output', default='-',
+            help='File to write exported data to (default: standard output)'),
+        make_option('-z', '--gzip', action='store_true', default=False,
+            help='Compress N-Quads output with gzip'),
+        make_option('-c', '--context', action='append', dest='contexts',
+            help='Export only the specified context URI (N-Quads only; ' +
+                 'can be repeated)'),
+        make_option('-d', '--output-dir', dest='output_dir',
+            help='Write N-Quads for each context to a separate file in ' +
+                 'the specified directory'),
     )
 
     def handle(self, *args, **options):
         graph = rdf_data()
         verbosity = options.get('verbosity', self.v_normal)
 
-        if verbosity >= self.v_normal:
-            print >> sys.stderr, "Exporting %d triples" % len(graph)
+        if options['format'] != 'nquads':
+            if options['contexts'] or options['output_dir'] or options['gzip']:
+                raise CommandError('Context, output directory, and gzip ' +
+                                   'options are only supported for nquads format')
 
-        print graph.serialize(format=options['format'])
+            if verbosity >= self.v_normal:
+                print >> sys.stderr, "Exporting %d triples" % len(graph)
+
+            out = open_output(options['output'])
+            out.write(graph.serialize(format=options['format']))
+            return
+
+        if options['contexts']:
+            contexts = [graph.get_context(c) for c in options['contexts']]
+        else:
+            contexts = graph.contexts()
+
+        if options['output_dir']:
+            # one file per context, named by checksum of the context uri
+            if not os.path.isdir(options['output_dir']):
+                os.makedirs(options['output_dir'])
+            total = 0
+            files = 0
+            for ctx in contexts:
+                filename = os.path.join(options['output_dir'], '%s.nq%s' % \
+                    (hashlib.sha1(ctx.identifier.encode('utf-8')).hexdigest(),
+                     '.gz' if options['gzip'] else ''))
+                out = open_output(filename, options['gzip'])
+                try:
+                    total += write_quads(graph, out, [ctx])
+                finally:
+                    out.close()
+                files += 1
+            if verbosity >= self.v_normal:
+                print >> sys.stderr, "Exported %d quads to %d files" % (total, files)
+
+        else:
+            out = open_output(options['output'], options['gzip'])
+            try:
+                total = write_quads(graph, out, contexts)
+            finally:
+                if out is not sys.stdout:
+                    out.close()
+            if verbosity >= self.v_normal:
+                print >> sys.stderr, "Exported %d quads" % total
@@ -5,33 +5,68 @@
 from optparse import make_option
 import sys
 
-from rdflib import ConjunctiveGraph
+from rdflib import ConjunctiveGraph, URIRef
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from belfast.rdf.bulk import open_rdf, QuadReader, BulkLoader
 from belfast.util import rdf_data
 
 
 class Command(BaseCommand):
     '''Load serialized RDF data in the configured rdf database'''
     help = __doc__
+    args = '<filename filename ...>'
 
     v_normal = 1
 
+    #: line-based formats that can be loaded incrementally
+    streaming_formats = ('nt', 'nquads')
+
     # NOTE: currently belfast data can only be exported successfully in XML
     # and trix serialization formats; leaving here for convenience
     option_list = BaseCommand.option_list + (
         make_option('-f', '--format',
-            choices=('xml', 'n3', 'turtle', 'nt', 'pretty-xml', 'trix'),
+            choices=('xml', 'n3', 'turtle', 'nt', 'nquads', 'pretty-xml', 'trix'),
             default='xml',
-            help='RDF import format (default: xml)'),
+            help='RDF import format (default: xml). N-Triples and N-Quads ' +
+                 'are loaded incrementally in batches'),
+        make_option('-b', '--batch-size', type='int', default=10000,
+            dest='batch_size',
+            help='Number of triples to add per batch when loading ' +
+                 'N-Triples or N-Quads (default: %default)'),
+        make_option('-c', '--context',
+            help='Context URI for N-Triples data (default: the default graph)'),
     )
 
-    def handle(self, filename, *args, **options):
+    def handle(self, *filenames, **options):
+        if not filenames:
+            raise CommandError('Please specify one or more files to load')
+
         graph = rdf_data()
         size = len(graph)
         verbosity = options.get('verbosity', self.v_normal)
+        rdf_format = options['format']
+
+        if rdf_format in self.streaming_formats:
+            def report(total, elapsed):
+                if verbosity >= self.v_normal:
+                    print >> sys.stderr, "Loaded %d triples (%.1f triples/sec)" \
+                        % (total, total / elapsed if elapsed else 0)
+
+            context = options.get('context')
+            reader = QuadReader(URIRef(context) if context else None)
+            loader = BulkLoader(graph, batch_size=options['batch_size'],
+                                progress=report)
+            for filename in filenames:
+                loader.load(reader.quads(open_rdf(filename)))
+
+            if verbosity >= self.v_normal:
+                print >> sys.stderr, "Loaded %d triples in %.1f seconds (%.1f triples/sec)" \
+                    % (loader.total, loader.elapsed, loader.rate())
 
-        graph.parse(filename, format=options['format'])
+        else:
+            for filename in filenames:
+                graph.parse(source=open_rdf(filename), format=rdf_format)
 
-        if verbosity >= self.v_normal:
-            print >> sys.stderr, "Loaded %d triples" % (len(graph) - size)
+            if verbosity >= self.v_normal:
+                print >> sys.stderr, "Loaded %d triples" % (len(graph) - size)
@@ -2,20 +2,36 @@
 
 # script to harvest and prep entire dataset, start to finish
 
+from contextlib import contextmanager
 from optparse import make_option
 import os
+from networkx.readwrite import gexf
 import rdflib
 import shutil
+import time
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management import call_command
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
 from django.contrib.sites.models import Site
+from django.db import connections
+from django.test.utils import override_settings
 
+from belfast.dataversions import data_versions, validate_version
+from belfast.rdf.changes import ChangeTracker
 from belfast.rdf.harvest import HarvestRdf, Annotate, LocalRDF # HarvestRelated
+from belfast.rdf.httpsession import http_session
+from belfast.rdf.instrument import RunReport, compare_reports
 from belfast.rdf.qub import QUB
+from belfast.rdf.snapshot import SnapshotStore, write_store_snapshot
 from belfast.rdf.clean import SmushGroupSheets, IdentifyGroupSheets, \
     InferConnections, ProfileUris
 from belfast.rdf import nx
+from belfast.network.centrality import precompute_centrality
+from belfast.network.connections import write_connections, connections_path
+from belfast.network.snapshot import write_snapshot, snapshot_path
+from belfast.network.views import network_variants
 from belfast.util import rdf_data, set_site_lastmodified
 
 class Command(BaseCommand):
@@ -29,6 +45,15 @@ class Command(BaseCommand):
         make_option('--no-cache', action='store_true',
                     help='Request no cache when harvesting RDFa data',
                     default=False),
+        make_option('--offline', action='store_true', default=False,
+                    help='Use only cached HTTP responses; make no network ' +
+                    'requests (requires HARVEST_CACHE_DIR)'),
+        make_option('--workers', type='int',
+                    help='Number of urls to harvest concurrently ' +
+                    '(default: HARVEST_WORKERS setting or 1)'),
+        make_option('--per-host', type='int', dest='per_host',
+                    help='Maximum concurrent harvest requests per host ' +
+                    '(default: HARVEST_PER_HOST_LIMIT setting or 4)'),
         make_option('-q', '--queens', action='store_true',
             help='Convert Queens University Belfast collection to RDF'),
         make_option('-i', '--identify', action='store_true',
@@ -41,8 +66,25 @@ class Command(BaseCommand):
             help='Infer and make connections implicit in the data'),
         make_option('-g', '--gexf', action='store_true',
             help='Generate GEXF network graph data'),
+        make_option('-C', '--centrality', action='store_true',
+            help='Precompute centrality measures for the network graphs'),
+        make_option('--betweenness-samples', type='int', dest='betweenness_samples',
+            help='Approximate betweenness centrality for graphs larger than ' +
+                 'this using this many sample nodes (default: ' +
+                 'NETWORK_BETWEENNESS_SAMPLES setting, or exact)'),
+        make_option('-w', '--warm-cache', action='store_true', dest='warm_cache',
+            help='Generate cached network graph JSON for the new data'),
+        make_option('--full', action='store_true', default=False,
+            help='Reprocess all data, rather than only new or changed ' +
+                 'contexts since the last run'),
+        make_option('--report', metavar='FILE',
+            help='Save a JSON report of time, memory, requests, queries, and ' +
+                 'triple counts for each step, and compare with the previous ' +
+                 'report in the same file'),
         make_option('-x', '--clear', action='store_true',
-            help='Clear all current RDF data and start fresh'),
+            help='Clear all current RDF data and start fresh (with ' +
+                 'DATA_VERSIONS_DIR, build the new version from nothing ' +
+                 'instead of a copy of the current version)'),
     )
 
     # eadids for documents with tagged names
@@ -86,6 +128,14 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         self.verbosity = options['verbosity']
+        start = time.time()
+
+        session = http_session()
+        if options['offline']:
+            if session.cache is None:
+                raise CommandError('Offline mode requires a response cache; ' +
+                                   'configure HARVEST_CACHE_DIR')
+            session.cache.offline = True
 
         # harvest from the current configured site
         current_site = Site.objects.get(id=settings.SITE_ID)
@@ -97,17 +147,55 @@ class Command(BaseCommand):
         all_steps = not any([options['harvest'], options['queens'],
                              options['related'], options['smush'],
                              options['gexf'], options['identify'],
-                             options['connect']])
+                             options['connect'], options['centrality']])
 
-        # initialize graph persistence
-        # graph = rdflib.ConjunctiveGraph('Sleepycat')
-        # graph.open(settings.RDF_DATABASE, create=True)
+        with self.prep_graph(options['clear']) as graph:
+            self.prep(graph, session, all_steps, options)
 
-        graph = rdf_data()
+        if options['warm_cache']:
+            # generate network JSON for the updated data
+            self.stdout.write('-- Caching network graph JSON')
+            call_command('warm_network_cache', verbosity=self.verbosity)
+
+        connections['rdf'].close()
+
+        # report on connection reuse for any remote data requested
+        elapsed = time.time() - start
+        if self.verbosity >= self.v_normal:
+            if session.requests:
+                self.stdout.write(session.report())
+            self.stdout.write('Completed in %.1f seconds' % elapsed)
+
+        if session.cache is not None:
+            last_run = session.cache.last_run()
+            if self.verbosity >= self.v_normal:
+                self.stdout.write(session.cache.report())
+                if last_run is not None:
+                    self.stdout.write('Previous run: %.1f seconds, %d cache hit(s), %d miss(es)' % \
+                        (last_run['elapsed'], last_run['hits'], last_run['misses']))
+            session.cache.save_run(elapsed, requests=session.requests)
 
+    @contextmanager
+    def prep_graph(self, clear=False):
+        '''Context manager for the RDF graph to prep the data in.  If
+        **DATA_VERSIONS_DIR** is configured, a new data version is built
+        and activated when it is complete (see
+        :meth:`prep_new_version`); otherwise, data is updated in place.'''
+        versions = data_versions()
+        if versions is not None:
+            with self.prep_new_version(versions, clear) as graph:
+                yield graph
+            return
+
+        graph = rdf_data()
+        if isinstance(graph.store, SnapshotStore):
+            # site is configured to serve a read-only snapshot;
+            # prep the data in the Sleepycat database
+            graph = rdflib.ConjunctiveGraph('Sleepycat')
+            graph.open(settings.RDF_DATABASE, create=True)
 
         # if clear is specified, remove the entire db
-        if options['clear']:
+        if clear:
             if self.verbosity >= self.v_normal:
                 print 'Removing %d contexts and %d triples from the current RDF graph' % \
                       (len(list(graph.contexts())), len(graph))
@@ -117,52 +205,210 @@ class Command(BaseCommand):
             shutil.rmtree(settings.RDF_DATABASE)
             graph.open(settings.RDF_DATABASE, create=True)
 
+        try:
+            yield graph
+        finally:
+            if graph is not rdf_data():
+                graph.close()
+
+    @contextmanager
+    def prep_new_version(self, versions, clear=False):
+        '''Build a new data version as a copy of the current one (or from
+        nothing, if ``clear`` is specified), with the configured data
+        paths and the RDF database connection pointing to the new
+        version while the data is prepped.  The new version is validated
+        and activated if the data prep completes; otherwise it is
+        removed, and the current version is unchanged.'''
+        try:
+            versions.check_settings()
+        except ImproperlyConfigured as err:
+            raise CommandError(err)
+        version = versions.create(clear=clear)
+        paths = versions.version_settings(version)
+        if self.verbosity >= self.v_normal:
+            self.stdout.write('-- Building data version %s (current version: %s)' % \
+                              (version, versions.current_version()))
+
+        try:
+            graph = rdflib.ConjunctiveGraph('Sleepycat')
+            graph.open(paths['RDF_DATABASE'], create=True)
+            # anything that uses rdf_data() should use the new version
+            connection = connections['rdf']
+            original = connection.db_connection
+            connection.db_connection = graph
+            try:
+                with override_settings(**paths):
+                    yield graph
+            finally:
+                connection.db_connection = original
+                graph.close()
+
+            problems = validate_version(paths['RDF_DATABASE'],
+                                        paths['GEXF_DATA'].values(),
+                                        paths.get('RDF_SNAPSHOT'))
+            if problems:
+                raise CommandError('Data version %s is not valid and was not activated:\n%s' % \
+                                   (version, '\n'.join(problems)))
+        except BaseException:
+            # don't leave a copy of the data behind for a failed build
+            versions.remove(version)
+            raise
+        versions.activate(version)
+        removed = versions.prune()
+        if self.verbosity >= self.v_normal:
+            self.stdout.write('-- Activated data version %s' % version)
+            if removed:
+                self.stdout.write('Removed old data version%s %s' % \
+                    ('' if len(removed) == 1 else 's', ', '.join(removed)))
+        # switch this process to the new version
+        connection.reopen_if_replaced()
+
+    def prep(self, graph, session, all_steps, options):
+        'Run the requested data prep steps on a graph'
+        # record time, memory, requests, and queries for each step;
+        # count triples only when a report is requested, since counting
+        # requires scanning the store
+        report = RunReport(graph=graph if options['report'] else None,
+                           session=session)
+
+        # track new and changed contexts so cleanup steps only process
+        # data that has changed since they last ran
+        tracker = ChangeTracker(full=options['full'])
+
         if all_steps or options['harvest']:
-            self.stdout.write('-- Harvesting RDF from EmoryFindingAids related to the Belfast Group')
-            # inaccurate; also harvesting tei from local site
+            with report.stage('harvest') as stage:
+                self.stdout.write('-- Harvesting RDF from EmoryFindingAids related to the Belfast Group')
+                # inaccurate; also harvesting tei from local site
 
-            HarvestRdf(self.harvest_urls,
-                       find_related=True, verbosity=self.verbosity,
-                       graph=graph, no_cache=options['no_cache'])
-            # local info from RDF data - additional bios, Group sheet in private collection
-            self.stdout.write('-- Adding RDF data from local fixtures')
-            LocalRDF(graph, self.local_rdf_fixtures)
+                harvest = HarvestRdf(self.harvest_urls,
+                    find_related=True, verbosity=self.verbosity,
+                    graph=graph, no_cache=options['no_cache'],
+                    workers=options['workers'], per_host=options['per_host'],
+                    tracker=tracker)
+                stage.update({'harvested': harvest.harvested,
+                              'unchanged': harvest.unchanged,
+                              'errors': harvest.errors})
+                # local info from RDF data - additional bios, Group sheet in private collection
+                self.stdout.write('-- Adding RDF data from local fixtures')
+                LocalRDF(graph, self.local_rdf_fixtures, tracker=tracker)
+                tracker.save()
 
         if all_steps or options['queens']:
-            self.stdout.write('-- Converting Queens University Belfast Group collection description to RDF')
-            QUB(self.QUB_input, verbosity=self.verbosity, graph=graph,
-                url=QUB.QUB_BELFAST_COLLECTION)
+            with report.stage('queens'):
+                self.stdout.write('-- Converting Queens University Belfast Group collection description to RDF')
+                QUB(self.QUB_input, verbosity=self.verbosity, graph=graph,
+                    url=QUB.QUB_BELFAST_COLLECTION)
 
         if all_steps or options['identify']:
-            # identify groupsheets in the data and add local groupsheet type if not present
-            self.stdout.write('-- Identifying groupsheets')
-            IdentifyGroupSheets(graph)
+            with report.stage('identify') as stage:
+                # identify groupsheets in the data and add local groupsheet type if not present
+                self.stdout.write('-- Identifying groupsheets')
+                contexts = self.pending_contexts(tracker, graph, 'identify')
+                identify = IdentifyGroupSheets(graph, contexts=contexts)
+                stage['groupsheets'] = identify.total
+                self.mark_processed(tracker, graph, contexts, 'identify')
 
         if all_steps or options['smush']:
-            # smush any groupsheets in the data
-            self.stdout.write('-- Smushing groupsheet URIs and generating local profile URIs')
-            # NOTE: might be nice to smush *after* cleaning up author names, but for some reason
-            # that results in a number of authors/groupsheets getting dropped
-            SmushGroupSheets(graph)
-            ProfileUris(graph)
+            with report.stage('smush'):
+                # smush any groupsheets in the data
+                self.stdout.write('-- Smushing groupsheet URIs and generating local profile URIs')
+                # NOTE: might be nice to smush *after* cleaning up author names, but for some reason
+                # that results in a number of authors/groupsheets getting dropped
+                contexts = self.pending_contexts(tracker, graph, 'smush')
+                SmushGroupSheets(graph, contexts=contexts)
+                ProfileUris(graph, contexts=contexts)
+                self.mark_processed(tracker, graph, contexts, 'smush')
 
         if all_steps or options['related']:
-            self.stdout.write('-- Annotating graph with related information from VIAF, GeoNames, and DBpedia')
-            Annotate(graph)
+            with report.stage('related'):
+                self.stdout.write('-- Annotating graph with related information from VIAF, GeoNames, and DBpedia')
+                Annotate(graph)
 
         if all_steps or options['connect']:
-            # infer connections
-            self.stdout.write('-- Inferring connections: groupsheet time period, owner, authors affiliated with group')
-            InferConnections(graph)
-            # TODO: groupsheet owner based on source collection
+            with report.stage('connect'):
+                # infer connections
+                self.stdout.write('-- Inferring connections: groupsheet time period, owner, authors affiliated with group')
+                contexts = self.pending_contexts(tracker, graph, 'connect')
+                InferConnections(graph, contexts=contexts)
+                self.mark_processed(tracker, graph, contexts, 'connect')
+                # TODO: groupsheet owner based on source collection
 
         if all_steps or options['gexf']:
-            # generate gexf
-            self.stdout.write('-- Generating network graphs and saving as GEXF')
-            nx.Rdf2Gexf(graph, settings.GEXF_DATA['full'])
-            nx.BelfastGroupGexf(graph, settings.GEXF_DATA['bg1'])
+            with report.stage('gexf') as stage:
+                # generate gexf
+                self.stdout.write('-- Generating network graphs and saving as GEXF')
+                nx.Rdf2Gexf(graph, settings.GEXF_DATA['full'])
+                nx.BelfastGroupGexf(graph, settings.GEXF_DATA['bg1'])
+                # binary snapshots of the network data for fast loading
+                # in the web application
+                self.stdout.write('-- Generating network graph snapshots and connection index')
+                for name, gexf_file in settings.GEXF_DATA.iteritems():
+                    network = gexf.read_gexf(gexf_file)
+                    write_snapshot(network, snapshot_path(gexf_file))
+                    stage['%s_nodes' % name] = network.number_of_nodes()
+                    stage['%s_edges' % name] = network.number_of_edges()
+                    # index of direct connections for profile pages
+                    if name == 'full':
+                        write_connections(network, graph, connections_path(gexf_file))
+
+        if all_steps or options['centrality']:
+            with report.stage('centrality') as stage:
+                # precompute centrality so network views don't calculate it
+                # on every request
+                self.stdout.write('-- Calculating network graph centrality')
+                timing = precompute_centrality(network_variants(),
+                    betweenness_samples=options['betweenness_samples'])
+                stage['variants'] = timing
+                if self.verbosity > self.v_normal:
+                    for name in sorted(timing.keys()):
+                        self.stdout.write('%s: %.1f seconds' % (name, timing[name]))
 
         # set last-modification time
         set_site_lastmodified(graph)
-        graph.close()
 
+        snapshot = getattr(settings, 'RDF_SNAPSHOT', None)
+        if snapshot:
+            with report.stage('snapshot') as stage:
+                # read-only copy of the data for serving the site
+                self.stdout.write('-- Writing read-only RDF snapshot')
+                stage['triples'] = write_store_snapshot(graph, snapshot)
+
+        if self.verbosity > self.v_normal or options['report']:
+            for stage in report.stages:
+                self.stdout.write(report.summary(stage))
+        if options['report']:
+            self.save_report(report, options['report'])
+
+    def pending_contexts(self, tracker, graph, stage):
+        '''Contexts to be processed by a cleanup step: new or changed
+        contexts, or None to process all contexts when running a full
+        reprocess.'''
+        if tracker.full:
+            return None
+        contexts = tracker.pending(graph, stage)
+        if self.verbosity >= self.v_normal:
+            self.stdout.write('%d new or changed context%s to process' % \
+                (len(contexts), '' if len(contexts) == 1 else 's'))
+        return contexts
+
+    def mark_processed(self, tracker, graph, contexts, stage):
+        '''Record that a cleanup step has processed the specified contexts
+        (or all contexts, if None).'''
+        if contexts is None:
+            contexts = list(graph.contexts())
+        tracker.mark_processed(contexts, stage)
+        tracker.save()
+
+    def save_report(self, report, filename):
+        '''Save the run report and compare it with the previous report
+        saved in the same file, if any.'''
+        previous = RunReport.load(filename)
+        current = report.as_dict()
+        if previous is not None and self.verbosity >= self.v_normal:
+            self.stdout.write('Compared with previous run (%s):' % previous['date'])
+            for name, fields in compare_reports(previous, current):
+                prev, cur = fields['elapsed']
+                self.stdout.write('%s: %.1f sec (was %.1f); %d request(s) (was %d); %d queries (was %d)' % \
+                    (name, cur, prev, fields['requests'][1], fields['requests'][0],
+                     fields['queries'][1], fields['queries'][0]))
+        report.save(filename)
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+# script to summarize per-request rdf store access recorded by
+# belfast.rdf.storestats.StoreStatsMiddleware
+
+from optparse import make_option
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from belfast.rdf.storestats import view_report, METHODS
+
+
+class Command(BaseCommand):
+    '''Summarize RDF store calls per view from the RDF_STORE_STATS_LOG file'''
+    help = __doc__
+
+    option_list = BaseCommand.option_list + (
+        make_option('-f', '--file',
+            help='Store stats log file (default: RDF_STORE_STATS_LOG setting)'),
+        make_option('-m', '--methods', action='store_true', default=False,
+            help='Include percentiles of calls for each store method'),
+    )
+
+    percentiles = (50, 90, 99)
+
+    def handle(self, *args, **options):
+        log_file = options['file'] or getattr(settings, 'RDF_STORE_STATS_LOG', None)
+        if not log_file:
+            raise CommandError('No store stats log file specified or configured')
+
+        try:
+            with open(log_file) as log:
+                records = [json.loads(line) for line in log if line.strip()]
+        except (IOError, ValueError) as err:
+            raise CommandError('Error reading %s: %s' % (log_file, err))
+
+        report = view_report(records, self.percentiles)
+        pct_labels = '/'.join('p%d' % p for p in self.percentiles)
+        # list views making the most store calls first
+        for view in sorted(report, key=lambda v: -report[v]['calls'][90]):
+            info = report[view]
+            self.stdout.write('%s (%d request%s)' % \
+                (view, info['requests'], '' if info['requests'] == 1 else 's'))
+            self.stdout.write('  calls %s: %s' % \
+                (pct_labels, '/'.join(str(info['calls'][p]) for p in self.percentiles)))
+            self.stdout.write('  time %s: %s' % \
+                (pct_labels, '/'.join('%.4f' % info['time'][p] for p in self.percentiles)))
+            if options['methods']:
+                for method in METHODS:
+                    if info[method][self.percentiles[-1]]:
+                        self.stdout.write('  %s %s: %s' % \
+                            (method, pct_labels,
+                             '/'.join(str(info[method][p]) for p in self.percentiles)))
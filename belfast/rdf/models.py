@@ -1,6 +1,8 @@
 import rdflib
+from rdflib.namespace import SKOS
 
 from belfast import rdfns
+from belfast.util import cached_property
 from belfast.rdf import rdfmap
 
 class RdfResource(rdflib.resource.Resource):
@@ -17,19 +19,30 @@ class RdfResource(rdflib.resource.Resource):
         # custom repr more readable than the default for rdflib resource
         return '<%s %s>' % (self.__class__.__name__, str(self))
 
+    def refresh(self):
+        '''Clear cached property values, so they will be read from the
+        RDF data again; see :meth:`belfast.rdf.rdfmap.refresh`.'''
+        rdfmap.refresh([self])
+
     _name = rdfmap.Value(rdfns.SCHEMA_ORG.name)
 
-    @property
+    @cached_property
     def preferred_label(self):
         '''Preferred label for this resource;
         uses :meth:`~rdflib.graph.Graph.preferredLabel`.  If multiple
         preferred labels are found, the first one is used.'''
+        cached = rdfmap.prefetched(self, rdflib.RDFS.label)
+        if cached is not None:
+            # same label order as preferredLabel
+            labels = rdfmap.prefetched(self, SKOS.prefLabel) or cached
+            return labels[0] if labels else None
+
         labels = self.graph.preferredLabel(self)
         # list of tuples: label type (preflabel or label), value
         if labels:
             return labels[0][1]
 
-    @property
+    @cached_property
     def name(self):
         'alias for :attr:`preferred_label`'
         l = self.preferred_label
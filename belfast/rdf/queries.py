@@ -0,0 +1,220 @@
+'''Registry of named SPARQL queries run against the local RDF data.
+
+Queries are registered once with their text, and prepared (parsed and
+translated to SPARQL algebra) with :meth:`rdflib.plugins.sparql.prepareQuery`
+the first time they are used, rather than every time they are run.
+Values that vary between calls (URIs, site domain) are passed as initial
+variable bindings rather than formatted into the query text.
+
+Parse and evaluation time are recorded for each query; see
+:meth:`QueryRegistry.stats`.
+
+Example use::
+
+    res = run_query(graph, 'group_people', group=BELFAST_GROUP_URIREF,
+                    local_prefix=rdflib.Literal('http://example.com'))
+'''
+
+import logging
+import threading
+import time
+
+import rdflib
+from rdflib.plugins.sparql import prepareQuery
+
+from belfast import rdfns
+
+
+logger = logging.getLogger(__name__)
+
+
+#: namespace prefixes available to all registered queries
+PREFIXES = {
+    'rdf': rdflib.RDF,
+    'owl': rdflib.OWL,
+    'schema': rdfns.SCHEMA_ORG,
+    'dc': rdfns.DC,
+    'bibo': rdfns.BIBO,
+    'bg': rdfns.BG,
+    'foaf': rdfns.FOAF,
+}
+
+
+class QueryRegistry(object):
+    '''Named SPARQL queries, prepared once on first use.'''
+
+    def __init__(self):
+        self.queries = {}
+        self._prepared = {}
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def register(self, name, text):
+        '''Register a query by name.  Query text may use any of the
+        prefixes in :data:`PREFIXES` without declaring them.'''
+        with self._lock:
+            self.queries[name] = text
+            self._prepared.pop(name, None)
+            self._stats[name] = {'parses': 0, 'parse_time': 0.0,
+                                 'calls': 0, 'eval_time': 0.0}
+
+    def prepared(self, name):
+        '''Prepared query for the specified name; raises KeyError if no
+        query is registered with that name.'''
+        query = self._prepared.get(name)
+        if query is None:
+            with self._lock:
+                # check again, in case another thread prepared it
+                query = self._prepared.get(name)
+                if query is None:
+                    start = time.time()
+                    query = prepareQuery(self.queries[name], initNs=PREFIXES)
+                    elapsed = time.time() - start
+                    self._stats[name]['parses'] += 1
+                    self._stats[name]['parse_time'] += elapsed
+                    self._prepared[name] = query
+                    logger.debug('Prepared query %s in %.03f sec', name, elapsed)
+        return query
+
+    def run(self, graph, name, **bindings):
+        '''Run a named query against a graph, with keyword arguments as
+        initial bindings for query variables.  Results are evaluated
+        before returning.
+
+        :returns: :class:`rdflib.query.Result`
+        '''
+        query = self.prepared(name)
+        start = time.time()
+        res = graph.query(query, initBindings=bindings)
+        # evaluate results now, so evaluation time can be recorded
+        len(res)
+        elapsed = time.time() - start
+        with self._lock:
+            self._stats[name]['calls'] += 1
+            self._stats[name]['eval_time'] += elapsed
+        logger.debug('Query %s: %d result(s) in %.03f sec', name, len(res),
+                     elapsed)
+        return res
+
+    def stats(self):
+        '''Number of parses and calls, and total parse and evaluation
+        time in seconds, as a dictionary by query name.'''
+        with self._lock:
+            return dict((name, dict(info))
+                        for name, info in self._stats.iteritems())
+
+
+#: registry of queries used by the site and data prep
+registry = QueryRegistry()
+
+#: convenience access to :meth:`QueryRegistry.run` for :data:`registry`
+run_query = registry.run
+
+
+def local_prefix(domain):
+    '''Literal for the start of local URIs for a site domain, for use
+    as a binding with queries that filter on ``?local_prefix``.'''
+    return rdflib.Literal('http://%s' % domain)
+
+
+# manuscripts with an author that directly reference a group
+registry.register('manuscripts_related_to', '''
+    SELECT ?ms
+    WHERE {
+        ?ms rdf:type bibo:Manuscript .
+        ?ms ?rel ?group .
+        ?ms dc:creator ?auth
+    }''')
+
+# manuscripts mentioned in a collection described by a document
+# that is about a group
+registry.register('collection_manuscripts_about', '''
+    SELECT ?ms
+    WHERE {
+        ?doc schema:about ?group .
+        ?doc schema:about ?coll .
+        ?coll schema:mentions ?ms .
+        ?ms rdf:type bibo:Manuscript
+    }''')
+
+# group sheet authors without local uris
+registry.register('nonlocal_groupsheet_authors', '''
+    SELECT DISTINCT ?author
+    WHERE {
+        ?ms rdf:type bg:GroupSheet .
+        ?ms dc:creator ?author .
+        FILTER (!STRSTARTS(STR(?author), ?local_prefix))
+    }''')
+
+# people without local uris with any relation to a group
+registry.register('nonlocal_people_related_to', '''
+    SELECT DISTINCT ?person
+    WHERE {
+        ?person rdf:type schema:Person .
+        ?person ?rel ?group
+        FILTER (!STRSTARTS(STR(?person), ?local_prefix))
+    }''')
+
+# authors and owners of group sheets
+registry.register('groupsheet_people', '''
+    SELECT DISTINCT ?person
+    WHERE {
+        ?ms rdf:type bg:GroupSheet .
+        {?ms dc:creator ?person }
+          UNION
+        {?person schema:owns ?ms }
+    }''')
+
+# people with local uris, by last name
+registry.register('local_people', '''
+    SELECT DISTINCT ?person
+    WHERE {
+      ?person rdf:type schema:Person .
+      ?person schema:familyName ?name .
+      FILTER STRSTARTS(STR(?person), ?local_prefix)
+    } ORDER BY ?name''')
+
+# all places
+registry.register('places', '''
+    SELECT DISTINCT ?uri
+    WHERE {
+        ?uri rdf:type schema:Place .
+    }''')
+
+# VIAF uris for people with local uris
+registry.register('local_people_viaf', '''
+    SELECT DISTINCT ?viaf
+    WHERE {
+        ?uri rdf:type schema:Person .
+        ?uri owl:sameAs ?viaf
+        FILTER STRSTARTS(STR(?uri), ?local_prefix)
+        FILTER STRSTARTS(STR(?viaf), "http://viaf.org")
+    }''')
+
+# DBpedia uris for people with local uris, via VIAF
+registry.register('local_people_dbpedia', '''
+    SELECT DISTINCT ?dbp
+    WHERE {
+        ?uri rdf:type schema:Person .
+        ?uri owl:sameAs ?viaf .
+        ?viaf owl:sameAs ?dbp
+        FILTER STRSTARTS(STR(?uri), ?local_prefix)
+        FILTER STRSTARTS(STR(?dbp), "http://dbpedia.org")
+    }''')
+
+# foaf names for a resource
+registry.register('foaf_names', '''
+    SELECT ?name
+    WHERE {
+       ?uri foaf:name ?name
+    }''')
+
+# any subject or object uri starting with a prefix
+registry.register('uris_with_prefix', '''
+    SELECT DISTINCT ?uri
+    WHERE {
+        { ?uri ?p ?o }
+      UNION
+        { ?s ?p ?uri }
+    FILTER STRSTARTS(STR(?uri), ?prefix) .
+    }''')
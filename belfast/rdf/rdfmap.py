@@ -3,11 +3,23 @@
 Intended for use with :class:`rdflib.resource.Resource`, for more
 convenient, object-based access to properties in the RDF data associated
 with the specified resource.
+
+Descriptor lookups query the graph for a single resource and property at a
+time.  When a list of resources is going to be displayed, use
+:meth:`prefetch` to fetch the data for all of them in bulk, like Django's
+``prefetch_related``; descriptor access then reads from the prefetched data
+instead of the graph.
+
+Descriptor values are cached on each resource after the first access
+(see :class:`RdfDescriptor`), so reading a property repeatedly while
+handling a request only queries the graph once.
 '''
+from collections import defaultdict
+
 import rdflib
 from rdflib.collection import Collection
 
-from belfast.util import normalize_whitespace
+from belfast.util import normalize_whitespace, cached_property
 
 # rename to rdfmap?
 
@@ -15,23 +27,54 @@ from belfast.util import normalize_whitespace
 
 # refer to
 # http://www.openvest.com/trac/browser/rdfalchemy/trunk/rdfalchemy/descriptors.py
-# TODO: cache results in obj.__dict__ ? or is rdf lookup fast enough that's unnecessary?
 
 
-class Value(object):
+class RdfDescriptor(object):
+    '''Base class for rdfmap descriptors.  Values are read from the graph
+    (or prefetched data) once per resource and cached on the resource;
+    use :meth:`refresh` to clear cached values if the data changes.
+    Subclasses implement :meth:`get_value`.
+
+    :params cache: cache the value on the resource (defaults to True)
+    '''
+
+    def __init__(self, cache=True):
+        self.cache = cache
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        if not self.cache:
+            return self.get_value(obj)
+
+        values = obj.__dict__.setdefault('_rdfmap_values', {})
+        if self not in values:
+            values[self] = self.get_value(obj)
+        val = values[self]
+        # return a copy of lists, so callers can't modify the cached value
+        return list(val) if isinstance(val, list) else val
+
+    def get_value(self, obj):
+        raise NotImplementedError
+
+
+class Value(RdfDescriptor):
     """A data descriptor that gets rdf a single value.
     """
 
-    def __init__(self, predicate, datatype=None, normalize=False):
+    def __init__(self, predicate, datatype=None, normalize=False, cache=True):
+        super(Value, self).__init__(cache=cache)
         self.predicate = predicate
         self.datatype = datatype
         self.normalize = normalize
 
-    def __get__(self, obj, objtype=None):
-        if obj is None:
-            return self
-
-        val = obj.value(self.predicate)
+    def get_value(self, obj):
+        cached = prefetched(obj, self.predicate)
+        if cached is not None:
+            # same as value: first value, with resources cast to object type
+            val = obj._cast(cached[0]) if cached else None
+        else:
+            val = obj.value(self.predicate)
         # if we got a 'none' return as is (don't convert to "None")
         if val is None:
             return val
@@ -45,7 +88,7 @@ class Value(object):
         return val
 
 
-class Resource(object):
+class Resource(RdfDescriptor):
     '''RDF descriptor to access an RDF resoure for a specified predicate.
 
     :params predicate: RDF predicate URI to be used for identifying the resource
@@ -56,25 +99,25 @@ class Resource(object):
         object or subject of the specified predicate (defaults to object)
     '''
 
-    def __init__(self, predicate, resource_type, is_object=True):
+    def __init__(self, predicate, resource_type, is_object=True, cache=True):
+        super(Resource, self).__init__(cache=cache)
         self.predicate = predicate
         self.resource_type = resource_type
         self.is_object = is_object
 
-    def __get__(self, obj, objtype):
-        if obj is None:
-            return self
-
-        # need to use subjects/objects instead of value to get a resource
-        # and for consistency with ResourceList
-        if self.is_object:
-            meth = obj.objects
-        else:
-            meth = obj.subjects
+    def get_value(self, obj):
+        rels = prefetched(obj, self.predicate, self.is_object)
+        if rels is None:
+            # need to use subjects/objects instead of value to get a resource
+            # and for consistency with ResourceList
+            if self.is_object:
+                meth = obj.objects
+            else:
+                meth = obj.subjects
 
-        # these methods return multiple; for now just grab the first one
-        rels = list(meth(self.predicate))
-        # NOTE: could probably use as generator without forcing to list instead?
+            # these methods return multiple; for now just grab the first one
+            rels = list(meth(self.predicate))
+            # NOTE: could probably use as generator without forcing to list instead?
         if rels:
             # in some cases, rel is a literal uri rather than a resource
             if hasattr(rels[0], 'identifier'):
@@ -82,10 +125,10 @@ class Resource(object):
             else:
                 rel_uri = rels[0]
 
-            return self.resource_type(obj.graph, rel_uri)
+            return share_prefetched(obj, self.resource_type(obj.graph, rel_uri))
 
 
-class ResourceList(object):
+class ResourceList(RdfDescriptor):
     '''RDF descriptor to access multiple values for the same predicate as a list.
 
     :params predicate: RDF predicate URI to be used for identifying resources
@@ -100,110 +143,265 @@ class ResourceList(object):
 
     '''
 
-    def __init__(self, predicate, resource_type, is_object=True, sort=None):
+    def __init__(self, predicate, resource_type, is_object=True, sort=None,
+                 cache=True):
+        super(ResourceList, self).__init__(cache=cache)
         self.predicate = predicate
         self.resource_type = resource_type
         self.is_object = is_object
         self.sort = sort
 
-    def __get__(self, obj, objtype):
-        if obj is None:
-            return self
-
-        if self.is_object:
-            meth = obj.objects
+    def get_value(self, obj):
+        cached = prefetched(obj, self.predicate, self.is_object)
+        if cached is not None:
+            results = [share_prefetched(obj, self.resource_type(obj.graph, o))
+                       for o in cached]
         else:
-            meth = obj.subjects
+            if self.is_object:
+                meth = obj.objects
+            else:
+                meth = obj.subjects
 
-        results = [self.resource_type(obj.graph, o.identifier)
-                   for o in meth(self.predicate)]
+            results = [self.resource_type(obj.graph, o.identifier)
+                       for o in meth(self.predicate)]
         if self.sort:
             return sorted(results, key=self.sort)
         else:
             return results
 
 
-class Sequence(object):
+class Sequence(RdfDescriptor):
     '''RDF descriptor for accessing values contained in an rdf sequence
     as a python list.'''
 
-    def __init__(self, predicate):
+    def __init__(self, predicate, cache=True):
+        super(Sequence, self).__init__(cache=cache)
         self.predicate = predicate
 
-    def __get__(self, obj, obtype):
-        if obj is None:
-            return self
-
-        # convert from resource to standard blank node
-        # since collection doesn't seem to handle resource
-        bnode = rdflib.BNode(obj.value(self.predicate))
-        # create a collection to allow treating as a list
-        # return Collection(self.graph, bnode)
-        terms = []
-        # create a collection to allow treating as a list
-        terms.extend(Collection(obj.graph, bnode))
+    def get_value(self, obj):
+        terms = None
+        cached = prefetched(obj, self.predicate)
+        if cached is not None:
+            terms = obj._prefetched.collection(cached[0] if cached else None)
+
+        if terms is None:
+            # convert from resource to standard blank node
+            # since collection doesn't seem to handle resource
+            bnode = rdflib.BNode(obj.value(self.predicate))
+            # create a collection to allow treating as a list
+            # return Collection(self.graph, bnode)
+            terms = []
+            # create a collection to allow treating as a list
+            terms.extend(Collection(obj.graph, bnode))
 
         return [t.toPython() if isinstance(t, rdflib.Literal) else t
                      for t in terms]
 
-class ValueList(object):
 
-    data = []
+class ValueList(RdfDescriptor):
+    '''RDF descriptor to access multiple values for the same predicate
+    as a list; literals are converted to python values.
+
+    :params predicate: RDF predicate URI
+    :params transitive: follow the predicate transitively (e.g., for
+        owl:sameAs); the list includes the resource itself
+    '''
 
-    def __init__(self, predicate, transitive=False):
+    def __init__(self, predicate, transitive=False, cache=True):
+        super(ValueList, self).__init__(cache=cache)
         self.predicate = predicate
         self.transitive = transitive
 
-    def __get__(self, obj, objtype=None):  # objtype is class of object, e.g. RdfPerson
-        if obj is None:
-            return self
-
+    def get_value(self, obj):
         # TODO: share datatype logic, whitespace normalization with value
-        if self.transitive:
-            meth = obj.graph.transitive_objects
+        cached = None
+        if not self.transitive:
+            cached = prefetched(obj, self.predicate)
+        if cached is not None:
+            values = cached
+        elif self.transitive:
+            values = obj.graph.transitive_objects(obj.identifier,
+                                                  rdflib.URIRef(self.predicate))
         else:
-            meth = obj.graph.objects
-
-        self.data = [o.toPython() if isinstance(o, rdflib.Literal) else o
-                     for o in meth(obj.identifier, rdflib.URIRef(self.predicate))]
-        return self.data
-
-    # @property
-    # def data(self):
-    #     # data in list form - basis for several other list-y functions
-    #     return list(obj.objects(self.predicate))
-
-    # NOTE: list methods pretty much copied from xmlmap; probably needs testing/revision
+            values = obj.graph.objects(obj.identifier, rdflib.URIRef(self.predicate))
 
-    def __str__(self):
-        return str(self.data)
+        return [o.toPython() if isinstance(o, rdflib.Literal) else o
+                for o in values]
 
-    def __repr__(self):
-        return str(self.data)
 
-    def __len__(self):
-        return len(self.data)
+def refresh(resources):
+    '''Clear cached descriptor values, :class:`~belfast.util.cached_property`
+    values, and prefetched data for a list of resources, so that
+    properties are read from the graph again.'''
+    for res in resources:
+        res.__dict__.pop('_rdfmap_values', None)
+        res.__dict__.pop('_prefetched', None)
+        for cls in type(res).__mro__:
+            for name, attr in cls.__dict__.iteritems():
+                if isinstance(attr, cached_property):
+                    res.__dict__.pop(name, None)
 
-    def __contains__(self, item):
-        return item in self.data
 
-    def __iter__(self):
-        for d in self.data:
-            yield d
+class PrefetchCache(object):
+    '''Triples fetched in bulk from a graph by :meth:`prefetch`: all
+    outgoing triples for a set of subjects (and any blank nodes they
+    reference, such as rdf lists), and all triples for a set of predicates,
+    indexed by object, for incoming relations.
 
-    def __eq__(self, other):
-        # FIXME: is any other comparison possible ?
-        return self.data == other
-
-    def __ne__(self, other):
-        return self.data != other
-
-    def _check_key_type(self, key):
-        # check argument type for getitem, setitem, delitem
-        if not isinstance(key, (slice, int, long)):
-            raise TypeError
-        assert not isinstance(key, slice), "Slice indexing is not supported"
+    :param graph: :class:`rdflib.Graph` the data is fetched from
+    '''
 
-    def __getitem__(self, key):
-        self._check_key_type(key)
-        return self.data[key]
+    def __init__(self, graph):
+        self.graph = graph
+        #: dictionary of subject and dictionary of predicate and objects
+        self.outgoing = {}
+        #: dictionary of predicate and dictionary of object and subjects
+        self.incoming = {}
+
+    def fetch(self, subjects, predicates=None):
+        '''Fetch outgoing triples for a list of subjects, and incoming
+        triples for a list of predicates; anything already fetched is
+        skipped.'''
+        pending = set(s for s in subjects if s not in self.outgoing)
+        while pending:
+            bnodes = set()
+            for subject in pending:
+                props = self.outgoing[subject] = defaultdict(list)
+                for s, p, o in self.graph.triples((subject, None, None)):
+                    props[p].append(o)
+                    if isinstance(o, rdflib.BNode):
+                        bnodes.add(o)
+            pending = set(b for b in bnodes if b not in self.outgoing)
+
+        for predicate in predicates or []:
+            predicate = rdflib.URIRef(predicate)
+            if predicate in self.incoming:
+                continue
+            index = self.incoming[predicate] = defaultdict(list)
+            for s, p, o in self.graph.triples((None, predicate, None)):
+                index[o].append(s)
+
+    def objects(self, subject, predicate):
+        '''List of objects for a subject and predicate, or None if the
+        subject has not been fetched.'''
+        props = self.outgoing.get(subject)
+        if props is not None:
+            return props.get(rdflib.URIRef(predicate), [])
+
+    def subjects(self, predicate, object):
+        '''List of subjects for a predicate and object, or None if the
+        predicate has not been fetched.'''
+        index = self.incoming.get(rdflib.URIRef(predicate))
+        if index is not None:
+            return index.get(object, [])
+
+    def collection(self, node):
+        '''Contents of an rdf list starting at the specified node, or None
+        if the list nodes have not all been fetched.'''
+        terms = []
+        # anything other than a blank node (including rdf:nil) ends the
+        # list, as when reading the list from the graph
+        while isinstance(node, rdflib.BNode):
+            props = self.outgoing.get(node)
+            if props is None:
+                return None
+            first, rest = props.get(rdflib.RDF.first), props.get(rdflib.RDF.rest)
+            if first:
+                terms.append(first[0])
+            node = rest[0] if rest else None
+        return terms
+
+
+def prefetched(obj, predicate, is_object=True):
+    '''Prefetched values for a property of a resource: objects of the
+    predicate, or subjects if ``is_object`` is False.  Returns None if
+    the data has not been prefetched.'''
+    cache = getattr(obj, '_prefetched', None)
+    if cache is None:
+        return None
+    if is_object:
+        return cache.objects(obj.identifier, predicate)
+    return cache.subjects(predicate, obj.identifier)
+
+
+def share_prefetched(obj, resource):
+    '''Make data prefetched for one resource available to a related
+    resource (e.g., one initialized as a different resource type);
+    returns the related resource.'''
+    cache = getattr(obj, '_prefetched', None)
+    if cache is not None:
+        resource._prefetched = cache
+    return resource
+
+
+def incoming_predicates(resource_type):
+    '''Predicates for :class:`Resource` and :class:`ResourceList`
+    descriptors on a resource class that relate resources as subjects
+    rather than objects.'''
+    predicates = []
+    for name in dir(resource_type):
+        attr = getattr(resource_type, name, None)
+        if isinstance(attr, (Resource, ResourceList)) and not attr.is_object:
+            predicates.append(attr.predicate)
+    return predicates
+
+
+def prefetch(resources, related=None, incoming=None):
+    '''Fetch RDF data in bulk for a list of resources, so that descriptor
+    access on any of them reads from memory instead of querying the graph.
+    All outgoing triples are fetched with a single lookup per resource,
+    and incoming relations with a single lookup per predicate.
+
+    Example use::
+
+        groupsheets = prefetch(groupsheets,
+                               related=['author_list', 'sources__documents'])
+
+    :param resources: list of :class:`rdflib.resource.Resource` (typically
+        :class:`~belfast.rdf.models.RdfResource`) of the same type, in the
+        same graph
+    :param related: optional list of names of :class:`Resource` and
+        :class:`ResourceList` descriptors whose related resources should
+        also be prefetched; use ``__`` to prefetch the relations of related
+        resources
+    :param incoming: list of predicates for incoming relations to fetch;
+        defaults to the predicates used by descriptors on the resource
+        class (see :meth:`incoming_predicates`)
+    :returns: the list of resources
+    '''
+    resources = list(resources)
+    if resources:
+        cache = getattr(resources[0], '_prefetched', None) or \
+            PrefetchCache(resources[0].graph)
+        _prefetch(cache, resources, related or [], incoming)
+    return resources
+
+
+def _prefetch(cache, resources, related, incoming):
+    resource_type = type(resources[0])
+    if incoming is None:
+        incoming = incoming_predicates(resource_type)
+    cache.fetch([r.identifier for r in resources], incoming)
+    for res in resources:
+        res._prefetched = cache
+
+    # group nested relations by the first descriptor name
+    nested = defaultdict(list)
+    for name in related:
+        name, _, rest = name.partition('__')
+        nested[name].extend([rest] if rest else [])
+
+    for name, rest in nested.iteritems():
+        desc = getattr(resource_type, name, None)
+        if not isinstance(desc, (Resource, ResourceList)):
+            raise ValueError('%s is not a related resource on %s' %
+                             (name, resource_type.__name__))
+        if not desc.is_object:
+            cache.fetch([], [desc.predicate])
+        targets = set()
+        for res in resources:
+            targets.update(prefetched(res, desc.predicate, desc.is_object))
+        targets = [desc.resource_type(cache.graph, t) for t in targets
+                   if not isinstance(t, rdflib.Literal)]
+        if targets:
+            _prefetch(cache, targets, rest, None)
@@ -0,0 +1,410 @@
+'''Read-only, memory-mapped snapshots of the RDF data, for serving the
+site without opening the Sleepycat database.
+
+:meth:`write_store_snapshot` (run by ``prep_dataset`` when
+**RDF_SNAPSHOT** is configured) writes the full contents of the RDF
+store to a single array file (see :mod:`belfast.arrayfile`):
+
+* every distinct term (URIs, blank nodes, literals, and context
+  identifiers) is interned in a string table, sorted so that a term can
+  be found by binary search
+* each distinct triple is packed into a single 64-bit integer of term
+  ids, and stored in three sorted indexes (subject-predicate-object,
+  predicate-object-subject, and object-subject-predicate), so that any
+  triple pattern is answered with a range lookup on one index
+* the contexts for each triple, in the same order as the subject index
+
+:class:`SnapshotStore` is an :mod:`rdflib` store for snapshot files.
+The file is memory-mapped read-only, so it needs no locking or
+environment files, and the data is shared by all threads and web server
+processes through the operating system page cache.  See the
+``belfast.rdf.db_backends.snapshot`` database backend.
+'''
+
+import logging
+import os
+import threading
+
+import numpy
+import rdflib
+from rdflib.store import Store, VALID_STORE, NO_STORE
+
+from belfast.arrayfile import write_arrays, ArrayFile, StringTable
+
+
+logger = logging.getLogger(__name__)
+
+
+# bits for each term id in a packed triple key
+_ID_BITS = 21
+_ID_MASK = (1 << _ID_BITS) - 1
+
+#: maximum number of distinct terms in a snapshot
+MAX_TERMS = 1 << _ID_BITS
+
+# triple position order for each index
+_INDEX_ORDER = {
+    'spo': (0, 1, 2),
+    'pos': (1, 2, 0),
+    'osp': (2, 0, 1),
+}
+
+
+class ReadOnlyStoreError(Exception):
+    'Attempted to modify the data in a read-only store'
+    pass
+
+
+def encode_term(term):
+    '''Encode an :mod:`rdflib` term as a utf-8 string, for storage in a
+    snapshot string table.'''
+    if isinstance(term, rdflib.Literal):
+        value = u'L%s\0%s\0%s' % (term.language or u'', term.datatype or u'',
+                                  unicode(term))
+    elif isinstance(term, rdflib.BNode):
+        value = u'B%s' % term
+    else:
+        value = u'U%s' % term
+    return value.encode('utf-8')
+
+
+def decode_term(value):
+    '''Decode a term encoded by :meth:`encode_term`.'''
+    value = value.decode('utf-8')
+    kind, value = value[0], value[1:]
+    if kind == u'L':
+        lang, datatype, value = value.split(u'\0', 2)
+        return rdflib.Literal(value, lang=lang or None,
+                              datatype=rdflib.URIRef(datatype) if datatype else None)
+    elif kind == u'B':
+        return rdflib.BNode(value)
+    return rdflib.URIRef(value)
+
+
+def _pack(first, second, third):
+    # pack three term ids (scalars or arrays) into a 64-bit key
+    return (numpy.asarray(first, dtype=numpy.int64) << (2 * _ID_BITS)) | \
+           (numpy.asarray(second, dtype=numpy.int64) << _ID_BITS) | \
+           numpy.asarray(third, dtype=numpy.int64)
+
+
+def write_store_snapshot(graph, filename):
+    '''Write the contents of a context-aware graph to a snapshot file.
+
+    :param graph: :class:`rdflib.ConjunctiveGraph`
+    :param filename: path for the snapshot file
+    :returns: number of distinct triples written
+    '''
+    terms = set()
+    quads = []
+    for ctx in graph.contexts():
+        cid = encode_term(ctx.identifier)
+        terms.add(cid)
+        for triple in ctx.triples((None, None, None)):
+            encoded = tuple(encode_term(t) for t in triple)
+            terms.update(encoded)
+            quads.append(encoded + (cid,))
+
+    if len(terms) > MAX_TERMS:
+        raise ValueError('Too many distinct terms for a snapshot (%d)' % len(terms))
+
+    # terms are sorted by encoded bytes, for binary search
+    terms = sorted(terms)
+    term_ids = dict((t, i) for i, t in enumerate(terms))
+
+    # contexts for each distinct triple
+    triple_contexts = {}
+    for s, p, o, c in quads:
+        key = int(_pack(term_ids[s], term_ids[p], term_ids[o]))
+        triple_contexts.setdefault(key, set()).add(term_ids[c])
+    del quads
+
+    spo = numpy.array(sorted(triple_contexts.keys()), dtype=numpy.int64)
+    ids = [(spo >> (2 * _ID_BITS)) & _ID_MASK, (spo >> _ID_BITS) & _ID_MASK,
+           spo & _ID_MASK]
+    counts = numpy.array([len(triple_contexts[k]) for k in spo.tolist()],
+                         dtype=numpy.int64)
+    ctx_offsets = numpy.zeros(len(spo) + 1, dtype=numpy.int64)
+    ctx_offsets[1:] = numpy.cumsum(counts)
+    ctx_ids = numpy.array([c for k in spo.tolist()
+                           for c in sorted(triple_contexts[k])], dtype=numpy.int32)
+
+    # triple count by context, for len()
+    context_sizes = numpy.bincount(ctx_ids) if len(ctx_ids) \
+        else numpy.array([], dtype=numpy.int64)
+    contexts = numpy.nonzero(context_sizes)[0]
+
+    # terms are already encoded, so the string table is built directly
+    term_offsets = numpy.zeros(len(terms) + 1, dtype=numpy.int64)
+    if terms:
+        term_offsets[1:] = numpy.cumsum([len(t) for t in terms])
+
+    arrays = {
+        'terms.data': numpy.fromstring(''.join(terms), dtype=numpy.uint8),
+        'terms.offsets': term_offsets,
+        'contexts.offsets': ctx_offsets,
+        'contexts.ids': ctx_ids,
+        'contexts.all': contexts.astype(numpy.int32),
+        'contexts.sizes': context_sizes[contexts].astype(numpy.int64),
+    }
+    for name, order in _INDEX_ORDER.iteritems():
+        if name == 'spo':
+            arrays['index.spo'] = spo
+        else:
+            arrays['index.%s' % name] = numpy.sort(
+                _pack(*[ids[i] for i in order]))
+
+    meta = {
+        'triples': len(spo),
+        'terms': len(terms),
+        'namespaces': dict((prefix, unicode(ns))
+                           for prefix, ns in graph.namespaces()),
+    }
+    write_arrays(filename, arrays, meta)
+    logger.debug('Wrote RDF snapshot with %d triples, %d terms to %s',
+                 len(spo), len(terms), filename)
+    return len(spo)
+
+
+class SnapshotStore(Store):
+    '''Read-only :mod:`rdflib` store for a snapshot file written by
+    :meth:`write_store_snapshot`.  Any attempt to modify the data raises
+    :class:`ReadOnlyStoreError`.  SPARQL queries are evaluated by
+    :mod:`rdflib` using triple pattern lookups.'''
+
+    context_aware = True
+    formula_aware = False
+    transaction_aware = False
+    graph_aware = False
+
+    def __init__(self, configuration=None, identifier=None):
+        self.snapshot = None
+        self._namespaces = {}
+        self._decoded = {}
+        super(SnapshotStore, self).__init__(configuration, identifier)
+
+    def open(self, configuration, create=False):
+        '''Open a snapshot file; returns :data:`~rdflib.store.NO_STORE`
+        if it does not exist.  Snapshots cannot be created by opening
+        them; use :meth:`write_store_snapshot`.'''
+        if not os.path.exists(configuration):
+            return NO_STORE
+        self.snapshot = ArrayFile(configuration)
+        self.terms = StringTable(self.snapshot['terms.data'],
+                                 self.snapshot['terms.offsets'])
+        self.indexes = dict((name, self.snapshot['index.%s' % name])
+                            for name in _INDEX_ORDER)
+        self.ctx_offsets = self.snapshot['contexts.offsets']
+        self.ctx_ids = self.snapshot['contexts.ids']
+        self._namespaces = dict(self.snapshot.meta.get('namespaces', {}))
+        self._decoded = {}
+        return VALID_STORE
+
+    def close(self, commit_pending_transaction=False):
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+
+    def is_open(self):
+        return self.snapshot is not None
+
+    # term lookup
+
+    def _term_bytes(self, i):
+        return self.terms.data[self.terms.offsets[i]:self.terms.offsets[i + 1]].tostring()
+
+    def term_id(self, term):
+        '''Id for a term in the snapshot, or None if not present.'''
+        if term is not None and not isinstance(term, rdflib.term.Node) \
+           and hasattr(term, 'identifier'):
+            # resource or graph
+            term = term.identifier
+        value = encode_term(term)
+        lo, hi = 0, len(self.terms)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term_bytes(mid) < value:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < len(self.terms) and self._term_bytes(lo) == value:
+            return lo
+
+    def term(self, i):
+        'Term for an id in the snapshot'
+        term = self._decoded.get(i)
+        if term is None:
+            term = self._decoded[i] = decode_term(self._term_bytes(i))
+        return term
+
+    # triple lookup
+
+    def _matches(self, ids):
+        # generate spo id tuples matching a pattern of term ids (or None)
+        s, p, o = ids
+        if s is not None:
+            name = 'osp' if p is None and o is not None else 'spo'
+        elif p is not None:
+            name = 'pos'
+        else:
+            name = 'osp' if o is not None else 'spo'
+        order = _INDEX_ORDER[name]
+        prefix = []
+        for i in order:
+            if ids[i] is None:
+                break
+            prefix.append(ids[i])
+
+        index = self.indexes[name]
+        if prefix:
+            shift = _ID_BITS * (3 - len(prefix))
+            lo = _pack(*(prefix + [0] * (3 - len(prefix))))
+            start = numpy.searchsorted(index, lo, 'left')
+            end = numpy.searchsorted(index, lo + (numpy.int64(1) << shift), 'left')
+            keys = index[start:end]
+        else:
+            keys = index
+
+        for key in keys.tolist():
+            parts = ((key >> (2 * _ID_BITS)) & _ID_MASK,
+                     (key >> _ID_BITS) & _ID_MASK, key & _ID_MASK)
+            triple = [None, None, None]
+            for pos, i in enumerate(order):
+                triple[i] = parts[pos]
+            yield tuple(triple)
+
+    def _triple_contexts(self, ids):
+        # context ids for a triple of term ids
+        spo = self.indexes['spo']
+        pos = numpy.searchsorted(spo, _pack(*ids), 'left')
+        return self.ctx_ids[self.ctx_offsets[pos]:self.ctx_offsets[pos + 1]]
+
+    def _pattern_ids(self, triple_pattern):
+        # term ids for a triple pattern; returns None if any bound term
+        # is not in the snapshot
+        ids = []
+        for term in triple_pattern:
+            if term is None or isinstance(term, rdflib.Variable):
+                ids.append(None)
+            else:
+                tid = self.term_id(term)
+                if tid is None:
+                    return None
+                ids.append(tid)
+        return ids
+
+    def triples(self, triple_pattern, context=None):
+        ids = self._pattern_ids(triple_pattern)
+        if ids is None:
+            return
+        ctx_id = None
+        if context is not None:
+            ctx_id = self.term_id(context)
+            if ctx_id is None:
+                return
+        for triple_ids in self._matches(ids):
+            if ctx_id is not None and \
+               ctx_id not in self._triple_contexts(triple_ids):
+                continue
+            yield (tuple(self.term(i) for i in triple_ids),
+                   self._contexts_for(triple_ids))
+
+    def _contexts_for(self, triple_ids):
+        # contexts are generated lazily, since they are rarely used
+        for cid in self._triple_contexts(triple_ids).tolist():
+            yield self.term(cid)
+
+    def __len__(self, context=None):
+        if context is None:
+            return len(self.indexes['spo'])
+        ctx_id = self.term_id(context)
+        contexts = self.snapshot['contexts.all']
+        pos = numpy.searchsorted(contexts, ctx_id) if ctx_id is not None else 0
+        if ctx_id is None or pos >= len(contexts) or contexts[pos] != ctx_id:
+            return 0
+        return int(self.snapshot['contexts.sizes'][pos])
+
+    def contexts(self, triple=None):
+        if triple is None:
+            for cid in self.snapshot['contexts.all'].tolist():
+                yield self.term(cid)
+            return
+        ids = self._pattern_ids(triple)
+        if ids is None or None in ids:
+            return
+        for cid in self._triple_contexts(ids).tolist():
+            yield self.term(cid)
+
+    # namespaces: bindings made after opening are kept in memory only
+
+    def bind(self, prefix, namespace):
+        self._namespaces[prefix] = unicode(namespace)
+
+    def namespace(self, prefix):
+        ns = self._namespaces.get(prefix)
+        return rdflib.URIRef(ns) if ns is not None else None
+
+    def prefix(self, namespace):
+        for prefix, ns in self._namespaces.iteritems():
+            if ns == unicode(namespace):
+                return prefix
+
+    def namespaces(self):
+        for prefix, ns in self._namespaces.iteritems():
+            yield prefix, rdflib.URIRef(ns)
+
+    # read-only
+
+    def add(self, triple, context, quoted=False):
+        raise ReadOnlyStoreError('RDF snapshot is read-only')
+
+    def addN(self, quads):
+        raise ReadOnlyStoreError('RDF snapshot is read-only')
+
+    def remove(self, triple, context=None):
+        raise ReadOnlyStoreError('RDF snapshot is read-only')
+
+    def add_graph(self, graph):
+        raise ReadOnlyStoreError('RDF snapshot is read-only')
+
+    def remove_graph(self, graph):
+        raise ReadOnlyStoreError('RDF snapshot is read-only')
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+# open snapshot stores, shared by all threads in a process, by path
+_STORES = {}
+_store_lock = threading.Lock()
+
+
+def open_snapshot(filename):
+    '''Open a snapshot file as a :class:`SnapshotStore`.  Stores are
+    shared by every thread in the process, and reopened if the file has
+    been replaced since it was opened.
+
+    :returns: :class:`SnapshotStore`, or None if the file does not exist
+    '''
+    try:
+        mtime = os.stat(filename).st_mtime
+    except OSError:
+        return None
+    store = _STORES.get(filename)
+    if store is None or store.snapshot.mtime != mtime:
+        with _store_lock:
+            # check again, in case another thread opened it
+            store = _STORES.get(filename)
+            if store is None or store.snapshot.mtime != mtime:
+                store = SnapshotStore()
+                if store.open(filename) != VALID_STORE:
+                    return None
+                # previously opened store is left for any connections
+                # still using it, and closed when garbage collected
+                _STORES[filename] = store
+                logger.debug('Opened RDF snapshot %s (%d triples)', filename,
+                             len(store))
+    return store
@@ -0,0 +1,230 @@
+'''Request-level instrumentation for RDF store access.
+
+When **RDF_STORE_STATS** is enabled, the RDF database connection returned
+by :meth:`belfast.util.rdf_data` is an :class:`InstrumentedGraph`, which
+counts and times ``triples``, ``value``, ``objects``, ``subjects``, and
+``query`` calls.  :class:`StoreStatsMiddleware` records the calls made
+while handling each request, adds a summary to the response headers and
+a debug log line, and optionally appends a JSON record for each request
+to **RDF_STORE_STATS_LOG**; the ``store_stats`` manage command summarizes
+that log as percentiles per view, so that views (or templates) making
+large numbers of store lookups can be identified.
+
+Only top-level calls are recorded; lookups made internally by another
+instrumented call (e.g., the ``triples`` lookup behind ``value``) are
+included in the time of the outer call.  Query results are evaluated
+lazily, so lookups made while iterating over query results are recorded
+as separate ``triples`` calls.
+'''
+
+from collections import defaultdict
+import json
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+import rdflib
+
+
+logger = logging.getLogger(__name__)
+
+
+#: graph methods counted and timed by :class:`InstrumentedGraph`
+METHODS = ['triples', 'value', 'objects', 'subjects', 'query']
+
+
+def enabled():
+    'Check if store instrumentation is configured'
+    return getattr(settings, 'RDF_STORE_STATS', False)
+
+
+class StoreStats(object):
+    'Number of calls and total time in seconds, by graph method'
+
+    def __init__(self):
+        self.calls = defaultdict(int)
+        self.time = defaultdict(float)
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.itervalues())
+
+    @property
+    def total_time(self):
+        return sum(self.time.itervalues())
+
+    def as_dict(self):
+        return {'calls': dict(self.calls), 'time': dict(self.time)}
+
+
+_local = threading.local()
+
+
+def start_recording():
+    '''Start recording store access for the current thread.
+
+    :returns: :class:`StoreStats` that calls will be recorded on
+    '''
+    _local.stats = StoreStats()
+    _local.active = False
+    return _local.stats
+
+
+def stop_recording():
+    '''Stop recording store access for the current thread.
+
+    :returns: the :class:`StoreStats` recorded, or None if not recording
+    '''
+    stats = getattr(_local, 'stats', None)
+    _local.stats = None
+    return stats
+
+
+class _Timed(object):
+    # time a section of code for a method call, if recording and not
+    # already inside another recorded call
+    def __init__(self, method):
+        self.method = method
+        self.stats = getattr(_local, 'stats', None)
+        self.outer = self.stats is not None and not _local.active
+
+    def __enter__(self):
+        if self.outer:
+            _local.active = True
+            self.start = time.time()
+
+    def __exit__(self, *args):
+        if self.outer:
+            self.stats.time[self.method] += time.time() - self.start
+            _local.active = False
+
+
+def _record_call(method):
+    # count a call, unless inside another recorded call
+    stats = getattr(_local, 'stats', None)
+    if stats is not None and not _local.active:
+        stats.calls[method] += 1
+
+
+def _timed_iter(method, iterator):
+    # generator methods: time spent consuming results counts towards the call
+    while True:
+        with _Timed(method):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+class InstrumentedGraph(rdflib.ConjunctiveGraph):
+    ''':class:`rdflib.ConjunctiveGraph` that records calls to the methods
+    in :data:`METHODS` while recording is active for the current thread
+    (see :meth:`start_recording`).'''
+
+    def triples(self, triple_or_quad, context=None):
+        _record_call('triples')
+        return _timed_iter('triples',
+            super(InstrumentedGraph, self).triples(triple_or_quad, context=context))
+
+    def objects(self, subject=None, predicate=None):
+        _record_call('objects')
+        return _timed_iter('objects',
+            super(InstrumentedGraph, self).objects(subject, predicate))
+
+    def subjects(self, predicate=None, object=None):
+        _record_call('subjects')
+        return _timed_iter('subjects',
+            super(InstrumentedGraph, self).subjects(predicate, object))
+
+    def value(self, *args, **kwargs):
+        _record_call('value')
+        with _Timed('value'):
+            return super(InstrumentedGraph, self).value(*args, **kwargs)
+
+    def query(self, *args, **kwargs):
+        _record_call('query')
+        with _Timed('query'):
+            return super(InstrumentedGraph, self).query(*args, **kwargs)
+
+
+class StoreStatsMiddleware(object):
+    '''Record RDF store access for each request (requires
+    **RDF_STORE_STATS**).  Adds ``X-RDF-Store-Calls`` and
+    ``X-RDF-Store-Time`` headers to the response, logs a summary at debug
+    level, and appends a JSON record to **RDF_STORE_STATS_LOG**, if set.'''
+
+    def process_request(self, request):
+        if enabled():
+            start_recording()
+            request.rdf_store_view = None
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if enabled():
+            request.rdf_store_view = '%s.%s' % (view_func.__module__,
+                                                view_func.__name__)
+
+    def process_response(self, request, response):
+        stats = stop_recording()
+        if stats is None:
+            return response
+
+        view = getattr(request, 'rdf_store_view', None) or request.path
+        response['X-RDF-Store-Calls'] = str(stats.total_calls)
+        response['X-RDF-Store-Time'] = '%.4f' % stats.total_time
+        logger.debug('%s: %d RDF store call(s) in %.4f sec (%s)', view,
+                     stats.total_calls, stats.total_time,
+                     ', '.join('%s=%d' % (m, stats.calls[m]) for m in METHODS
+                               if stats.calls[m]))
+
+        log_file = getattr(settings, 'RDF_STORE_STATS_LOG', None)
+        if log_file:
+            record = stats.as_dict()
+            record.update({'view': view, 'path': request.path,
+                           'date': time.time()})
+            try:
+                with open(log_file, 'a') as log:
+                    log.write(json.dumps(record) + '\n')
+            except IOError as err:
+                logger.warn('Error writing RDF store stats to %s: %s',
+                            log_file, err)
+        return response
+
+
+def percentile(values, pct):
+    '''Nearest-rank percentile of a list of numbers.'''
+    values = sorted(values)
+    if not values:
+        return None
+    rank = int(math.ceil(pct / 100.0 * len(values))) - 1
+    return values[max(0, min(rank, len(values) - 1))]
+
+
+def view_report(records, percentiles=(50, 90, 99)):
+    '''Summarize request records from **RDF_STORE_STATS_LOG** by view.
+
+    :param records: iterable of request records, as dictionaries
+    :param percentiles: percentiles to calculate
+    :returns: dictionary of view name and dictionary with the number of
+        **requests**, and percentiles of total **calls**, total **time**,
+        and calls for each method in :data:`METHODS`
+    '''
+    by_view = defaultdict(list)
+    for record in records:
+        by_view[record['view']].append(record)
+
+    report = {}
+    for view, view_records in by_view.iteritems():
+        series = {
+            'calls': [sum(r['calls'].values()) for r in view_records],
+            'time': [sum(r['time'].values()) for r in view_records],
+        }
+        for method in METHODS:
+            series[method] = [r['calls'].get(method, 0) for r in view_records]
+        info = {'requests': len(view_records)}
+        for name, values in series.iteritems():
+            info[name] = dict((pct, percentile(values, pct)) for pct in percentiles)
+        report[view] = info
+    return report
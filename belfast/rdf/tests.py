@@ -1,19 +1,42 @@
+import BaseHTTPServer
+import gzip
 import os
+import shutil
+from StringIO import StringIO
+import tempfile
+import threading
+import time
 from django.conf import settings
 from django.contrib.sites.models import Site
 from django.test import TestCase
 from django.test.utils import override_settings
+from mock import patch, Mock
 import rdflib
+import requests
 
 from belfast import rdfns
 from belfast.util import local_uri
+from belfast.rdf.bulk import open_rdf, QuadReader, BulkLoader, write_quads
+from belfast.rdf.changes import ChangeTracker, content_hash
 from belfast.rdf.clean import IdentifyGroupSheets, SmushGroupSheets, \
-    Person, person_names, ProfileUris
+    Person, person_names, ProfileUris, UriRewrites
+from belfast.rdf.harvest import HarvestRdf, Annotate
+from belfast.rdf.httpcache import ResponseCache, ResponseNotCached
+from belfast.rdf.httpsession import HarvestSession
+from belfast.rdf.instrument import RunReport, compare_reports
 from belfast.rdf.qub import QUB
+from belfast.rdf.queries import QueryRegistry
+from belfast.rdf.rdfmap import prefetch, refresh
+from belfast.rdf.snapshot import write_store_snapshot, SnapshotStore, \
+    ReadOnlyStoreError
+from belfast.rdf.storestats import InstrumentedGraph, StoreStatsMiddleware, \
+    start_recording, stop_recording, percentile, view_report
+from belfast.rdf.testutil import LocalSparqlEndpoint
 
 
 qub_test_input = os.path.join(settings.BASE_DIR, 'rdf', 'fixtures', 'QUB_ms1204_test.html')
 rdf_groupsheet_input = os.path.join(settings.BASE_DIR, 'rdf', 'fixtures', 'groupsheet.xml')
+dbpedia_fixture = os.path.join(settings.BASE_DIR, 'rdf', 'fixtures', 'dbpedia_people.rdf')
 # rdf_groupsheet_input = os.path.join(settings.BASE_DIR, 'rdf', 'fixtures', 'groupsheet.xml')
 
 
@@ -169,6 +192,206 @@ class SmushGroupSheetsTest(TestCase):
         # add test qub groupsheets to test graph
         # QUB(qub_test_input, verbosity=0, graph=graph, url=QUB.QUB_BELFAST_COLLECTION)
 
+class UriRewritesTest(TestCase):
+
+    viaf = rdflib.URIRef('http://viaf.org/viaf/12345')
+    local = rdflib.URIRef('http://example.com/people/heaney-seamus/')
+    sheet = rdflib.URIRef('http://example.com/groupsheets/1/')
+
+    def setUp(self):
+        self.graph = rdflib.ConjunctiveGraph()
+        self.ctx1 = self.graph.get_context(rdflib.URIRef('http://example.com/doc/1'))
+        self.ctx2 = self.graph.get_context(rdflib.URIRef('http://example.com/doc/2'))
+        self.ctx1.add((self.sheet, rdfns.DC.creator, self.viaf))
+        self.ctx1.add((self.local, rdflib.OWL.sameAs, self.viaf))
+        self.ctx2.add((self.viaf, rdfns.SCHEMA_ORG.name, rdflib.Literal('Heaney')))
+        self.ctx2.add((self.sheet, rdfns.SCHEMA_ORG.URL, self.viaf))
+
+    def test_apply(self):
+        rewrites = UriRewrites(self.graph)
+        rewrites.add(self.viaf, self.local)
+        self.assertEqual(2, rewrites.apply())
+        self.assertEqual(0, len(rewrites))
+
+        # updated triples stay in their original contexts
+        self.assert_((self.sheet, rdfns.DC.creator, self.local) in self.ctx1)
+        self.assert_((self.local, rdfns.SCHEMA_ORG.name, rdflib.Literal('Heaney'))
+                     in self.ctx2)
+        self.assertFalse((self.viaf, rdfns.SCHEMA_ORG.name, rdflib.Literal('Heaney'))
+                         in self.graph)
+        # objects of sameAs and url are not converted
+        self.assert_((self.local, rdflib.OWL.sameAs, self.viaf) in self.ctx1)
+        self.assert_((self.sheet, rdfns.SCHEMA_ORG.URL, self.viaf) in self.ctx2)
+        self.assertEqual(4, len(self.graph))
+
+    def test_chained(self):
+        bnode = rdflib.BNode()
+        self.ctx2.add((self.sheet, rdfns.SCHEMA_ORG.author, bnode))
+        rewrites = UriRewrites(self.graph, {bnode: self.viaf})
+        rewrites.add(self.viaf, self.local)
+        rewrites.apply()
+        self.assert_((self.sheet, rdfns.SCHEMA_ORG.author, self.local) in self.ctx2)
+        self.assertEqual([], list(self.graph.triples((bnode, None, None))))
+
+    def test_context_graph(self):
+        # applied to a single context, other contexts are not changed
+        UriRewrites(self.ctx1, {self.viaf: self.local}).apply()
+        self.assert_((self.sheet, rdfns.DC.creator, self.local) in self.ctx1)
+        self.assert_((self.viaf, rdfns.SCHEMA_ORG.name, rdflib.Literal('Heaney'))
+                     in self.ctx2)
+
+
+class PrefetchTest(TestCase):
+
+    sheet = rdflib.URIRef('http://example.com/groupsheets/1/')
+    author = rdflib.URIRef('http://example.com/people/heaney-seamus/')
+    coll = rdflib.URIRef('http://example.com/findingaids/heaney/#collection')
+    doc = rdflib.URIRef('http://example.com/findingaids/heaney/series1/')
+    findingaid = rdflib.URIRef('http://example.com/findingaids/heaney/')
+
+    def setUp(self):
+        self.graph = rdflib.ConjunctiveGraph()
+        g = self.graph.get_context(rdflib.URIRef('http://example.com/doc/1'))
+        g.add((self.sheet, rdflib.RDF.type, rdfns.BG.GroupSheet))
+        g.add((self.sheet, rdfns.DC.creator, self.author))
+        g.add((self.sheet, rdfns.BIBO.numPages, rdflib.Literal(3)))
+        titles = rdflib.BNode()
+        rdflib.collection.Collection(g, titles,
+            [rdflib.Literal('Digging'), rdflib.Literal('Follower')])
+        g.add((self.sheet, rdfns.DC.title, titles))
+        g.add((self.author, rdfns.SCHEMA_ORG.familyName, rdflib.Literal('Heaney')))
+        g.add((self.author, rdfns.SCHEMA_ORG.givenName, rdflib.Literal('Seamus')))
+        g.add((self.coll, rdfns.SCHEMA_ORG.mentions, self.sheet))
+        g.add((self.coll, rdflib.RDFS.label, rdflib.Literal('Heaney papers')))
+        g.add((self.doc, rdfns.SCHEMA_ORG.about, self.coll))
+        g.add((self.doc, rdfns.DC.isPartOf, self.findingaid))
+
+    def sheet_info(self, sheet):
+        return (sheet.num_pages, sheet.title_list, sheet.date,
+                [(a.lastname, a.firstname) for a in sheet.author_list],
+                [(s.name, s.access_url) for s in sheet.sources])
+
+    def test_prefetch(self):
+        # import here to avoid a circular import
+        from belfast.groupsheets.rdfmodels import RdfGroupSheet
+        expected = (3, ['Digging', 'Follower'], None, [('Heaney', 'Seamus')],
+                    [('Heaney papers', unicode(self.findingaid))])
+        self.assertEqual(expected,
+                         self.sheet_info(RdfGroupSheet(self.graph, self.sheet)))
+
+        sheets = prefetch([RdfGroupSheet(self.graph, self.sheet)],
+                          related=['author_list', 'sources__documents__part_of'])
+        # prefetched properties are read without querying the graph
+        with patch.object(self.graph, 'triples') as mocktriples:
+            self.assertEqual(expected, self.sheet_info(sheets[0]))
+            self.assertEqual(0, mocktriples.call_count)
+
+        self.assertRaises(ValueError, prefetch,
+                          [RdfGroupSheet(self.graph, self.sheet)], related=['date'])
+
+
+class QueryRegistryTest(TestCase):
+
+    def test_run(self):
+        graph = rdflib.Graph()
+        heaney = rdflib.URIRef('http://example.com/people/heaney-seamus/')
+        graph.add((heaney, rdfns.SCHEMA_ORG.name, rdflib.Literal('Seamus Heaney')))
+        graph.add((heaney, rdfns.SCHEMA_ORG.familyName, rdflib.Literal('Heaney')))
+
+        registry = QueryRegistry()
+        registry.register('names', '''
+            SELECT ?name WHERE { ?uri schema:name ?name }''')
+        res = registry.run(graph, 'names', uri=heaney)
+        self.assertEqual([rdflib.Literal('Seamus Heaney')], [r['name'] for r in res])
+        # values are bound as terms, not inserted into the query text
+        res = registry.run(graph, 'names', uri=rdflib.URIRef('> } #'))
+        self.assertEqual(0, len(res))
+
+        stats = registry.stats()['names']
+        self.assertEqual(1, stats['parses'])
+        self.assertEqual(2, stats['calls'])
+        self.assertRaises(KeyError, registry.run, graph, 'unknown')
+
+
+class SnapshotStoreTest(TestCase):
+
+    heaney = rdflib.URIRef('http://example.com/people/heaney-seamus/')
+    sheet = rdflib.URIRef('http://example.com/groupsheets/1/')
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='belfast-snapshot-')
+        self.path = os.path.join(self.tmpdir, 'rdf.snapshot')
+
+        self.graph = rdflib.ConjunctiveGraph()
+        self.ctx1 = self.graph.get_context(rdflib.URIRef('http://example.com/doc/1'))
+        self.ctx2 = self.graph.get_context(rdflib.URIRef('http://example.com/doc/2'))
+        titles = rdflib.BNode()
+        self.ctx1.add((self.sheet, rdfns.DC.creator, self.heaney))
+        self.ctx1.add((self.sheet, rdfns.DC.title, titles))
+        self.ctx1.add((titles, rdflib.RDF.first, rdflib.Literal(u'Docker\u2019s')))
+        self.ctx1.add((self.sheet, rdfns.BIBO.numPages, rdflib.Literal(3)))
+        self.ctx2.add((self.heaney, rdfns.SCHEMA_ORG.name,
+                       rdflib.Literal('Seamus Heaney', lang='en')))
+        self.ctx2.add((self.sheet, rdfns.DC.creator, self.heaney))
+        self.graph.bind('schema', rdfns.SCHEMA_ORG)
+
+        self.assertEqual(5, write_store_snapshot(self.graph, self.path))
+        self.snapshot = rdflib.ConjunctiveGraph(SnapshotStore(self.path))
+
+    def tearDown(self):
+        self.snapshot.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_triples(self):
+        patterns = [
+            (None, None, None),
+            (self.sheet, None, None),
+            (self.sheet, rdfns.DC.creator, None),
+            (self.sheet, None, self.heaney),
+            (None, rdfns.DC.creator, None),
+            (None, rdfns.DC.creator, self.heaney),
+            (None, None, self.heaney),
+            (None, None, rdflib.Literal(3)),
+            (None, None, rdflib.Literal('Seamus Heaney', lang='en')),
+            (None, None, rdflib.Literal('Seamus Heaney')),
+            (self.sheet, rdfns.DC.creator, self.heaney),
+            (rdflib.URIRef('http://example.com/unknown'), None, None),
+        ]
+        for pattern in patterns:
+            self.assertEqual(set(self.graph.triples(pattern)),
+                             set(self.snapshot.triples(pattern)),
+                             'snapshot should match original for %s' % (pattern,))
+
+        self.assertEqual(5, len(self.snapshot))
+        self.assertEqual(3, self.snapshot.value(self.sheet, rdfns.BIBO.numPages).toPython())
+
+    def test_contexts(self):
+        self.assertEqual(set([self.ctx1.identifier, self.ctx2.identifier]),
+                         set(c.identifier for c in self.snapshot.contexts()))
+        self.assertEqual(2, len(list(self.snapshot.contexts(
+            (self.sheet, rdfns.DC.creator, self.heaney)))))
+        ctx2 = self.snapshot.get_context(self.ctx2.identifier)
+        self.assertEqual(2, len(ctx2))
+        self.assertEqual([self.heaney], list(ctx2.subjects(rdfns.SCHEMA_ORG.name)))
+        self.assertEqual([], list(ctx2.triples((None, rdfns.BIBO.numPages, None))))
+        self.assertEqual(rdfns.SCHEMA_ORG,
+                         self.snapshot.store.namespace('schema'))
+
+    def test_query(self):
+        res = self.snapshot.query('''
+            SELECT ?name WHERE { ?sheet dc:creator ?author .
+                                 ?author schema:name ?name }''',
+            initNs={'dc': rdfns.DC, 'schema': rdfns.SCHEMA_ORG})
+        self.assertEqual([rdflib.Literal('Seamus Heaney', lang='en')],
+                         [r['name'] for r in res])
+
+    def test_read_only(self):
+        self.assertRaises(ReadOnlyStoreError, self.snapshot.add,
+                          (self.sheet, rdfns.DC.title, rdflib.Literal('Digging')))
+        self.assertRaises(ReadOnlyStoreError, self.snapshot.remove,
+                          (self.sheet, None, None))
+
+
 class PersonTest(TestCase):
 
     def test_properties(self):
@@ -195,6 +418,29 @@ class PersonTest(TestCase):
         self.assert_(lastname_first in p.f_names)
         self.assert_(full_initial in p.f_names)
 
+    def test_cached_values(self):
+        g = rdflib.Graph()
+        joe = rdflib.URIRef('http://example.net/people/joe-schmoe')
+        jane = rdflib.URIRef('http://example.net/people/jane-doe')
+        g.add((joe, rdfns.SCHEMA_ORG.name, rdflib.Literal('Joe Schmoe')))
+        g.add((jane, rdfns.SCHEMA_ORG.name, rdflib.Literal('Jane Doe')))
+
+        p1, p2 = Person(g, joe), Person(g, jane)
+        # list values are specific to each instance
+        self.assertEqual(['Joe Schmoe'], p1.s_names)
+        self.assertEqual(['Jane Doe'], p2.s_names)
+        self.assertEqual(['Joe Schmoe'], p1.s_names)
+
+        # values are cached until refreshed
+        g.add((joe, rdfns.SCHEMA_ORG.familyName, rdflib.Literal('Schmoe')))
+        g.add((joe, rdfns.SCHEMA_ORG.name, rdflib.Literal('Schmoe, Joe')))
+        self.assertEqual(None, p1.s_last_name)
+        p1.s_names.append('modified')
+        self.assertEqual(['Joe Schmoe'], p1.s_names)
+        refresh([p1])
+        self.assertEqual('Schmoe', p1.s_last_name)
+        self.assertEqual(2, len(p1.s_names))
+
 
     def test_person_names(self):
         g = rdflib.Graph()
@@ -295,3 +541,559 @@ class LocalUriTest(TestCase):
                              luri)
 
 
+class HarvestRdfTest(TestCase):
+
+    # minimal html+rdfa page with optional dcterms:hasPart links
+    page = '''<html xmlns="http://www.w3.org/1999/xhtml"><head><title>test</title></head>
+<body vocab="http://schema.org/" prefix="dc: http://purl.org/dc/terms/"
+  about="%(url)s" typeof="WebPage">
+  <h1 property="name">%(url)s</h1>
+  %(links)s
+</body></html>'''
+
+    base_url = 'http://example.com/findingaid/'
+    parts = ['http://example.com/findingaid/series1/',
+             'http://example.com/findingaid/series2/']
+    redirect_url = 'http://example.com/old-findingaid/'
+
+    def setUp(self):
+        # urls queued and processed are tracked on the class
+        HarvestRdf.URL_QUEUE = set()
+        HarvestRdf.PROCESSED_URLS = set()
+
+    def mock_get(self, url, **kwargs):
+        if url == self.redirect_url:
+            return Mock(status_code=302, headers={'location': self.base_url})
+        links = ''
+        if url == self.base_url:
+            links = ''.join('<a rel="dc:hasPart" href="%s">part</a>' % p
+                            for p in self.parts)
+        return Mock(status_code=200, headers={},
+                    content=self.page % {'url': url, 'links': links})
+
+    @patch('belfast.rdf.harvest.http_session')
+    def test_harvest_related(self, mocksession):
+        mockget = mocksession.return_value.get
+        mockget.side_effect = self.mock_get
+        for workers in [1, 3]:
+            self.setUp()
+            mockget.reset_mock()
+            graph = rdflib.ConjunctiveGraph()
+            HarvestRdf([self.redirect_url], find_related=True, verbosity=0,
+                       graph=graph, workers=workers)
+
+            # redirect, main page, and two parts
+            self.assertEqual(4, mockget.call_count)
+            contexts = set(str(ctx.identifier) for ctx in graph.contexts())
+            self.assertEqual(set([self.base_url] + self.parts), contexts,
+                'harvested urls should be added as graph contexts (%d workers)' \
+                % workers)
+            self.assert_(self.redirect_url not in contexts,
+                'redirected url should not be added as a graph context')
+
+    @patch('belfast.rdf.harvest.http_session')
+    def test_not_modified(self, mocksession):
+        mockget = mocksession.return_value.get
+        mockget.side_effect = self.mock_get
+        graph = rdflib.ConjunctiveGraph()
+        HarvestRdf([self.parts[0]], verbosity=0, graph=graph)
+        ctx = graph.get_context(self.parts[0])
+        triple_count = len(ctx)
+
+        # re-harvest with a not-modified response; data should be untouched
+        self.setUp()
+        mockget.side_effect = None
+        mockget.return_value = Mock(status_code=304, headers={})
+        HarvestRdf([self.parts[0]], verbosity=0, graph=graph, workers=2)
+        self.assertEqual(triple_count, len(graph.get_context(self.parts[0])))
+
+    @patch('belfast.rdf.harvest.http_session')
+    def test_unchanged(self, mocksession):
+        mockget = mocksession.return_value.get
+        mockget.side_effect = self.mock_get
+        tmpdir = tempfile.mkdtemp(prefix='belfast-changes-')
+        try:
+            tracker = ChangeTracker(os.path.join(tmpdir, 'state.json'))
+            graph = rdflib.ConjunctiveGraph()
+            HarvestRdf([self.parts[0]], verbosity=0, graph=graph, tracker=tracker)
+            ctx = graph.get_context(self.parts[0])
+            self.assertEqual([ctx.identifier],
+                             [c.identifier for c in tracker.pending(graph, 'identify')])
+            # simulate processing by a cleanup step
+            ctx.add((ctx.identifier, rdflib.RDF.type, rdfns.BG.GroupSheet))
+            tracker.mark_processed([ctx], 'identify')
+
+            # re-harvest with the same content; processed data should be kept
+            self.setUp()
+            HarvestRdf([self.parts[0]], verbosity=0, graph=graph, tracker=tracker)
+            self.assert_((ctx.identifier, rdflib.RDF.type, rdfns.BG.GroupSheet)
+                         in graph.get_context(self.parts[0]))
+            self.assertEqual([], tracker.pending(graph, 'identify'))
+
+            # changed content replaces the processed data
+            self.setUp()
+            mockget.side_effect = None
+            mockget.return_value = Mock(status_code=200, headers={},
+                content=self.page % {'url': self.parts[0],
+                                     'links': '<p property="description">new</p>'})
+            HarvestRdf([self.parts[0]], verbosity=0, graph=graph, tracker=tracker)
+            self.assertFalse((ctx.identifier, rdflib.RDF.type, rdfns.BG.GroupSheet)
+                             in graph.get_context(self.parts[0]))
+            self.assertEqual(1, len(tracker.pending(graph, 'identify')))
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class ChangeTrackerTest(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix='belfast-changes-')
+        self.state_file = os.path.join(self.tmpdir, 'state.json')
+        self.graph = rdflib.ConjunctiveGraph()
+        self.ctx = self.graph.get_context(rdflib.URIRef('http://example.com/doc/'))
+        person = rdflib.BNode()
+        self.ctx.add((person, rdfns.SCHEMA_ORG.name, rdflib.Literal('Heaney')))
+        self.ctx.add((self.ctx.identifier, rdfns.SCHEMA_ORG.about, person))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_content_hash(self):
+        # independent of triple order and blank node identifiers
+        other = rdflib.Graph()
+        person = rdflib.BNode()
+        other.add((self.ctx.identifier, rdfns.SCHEMA_ORG.about, person))
+        other.add((person, rdfns.SCHEMA_ORG.name, rdflib.Literal('Heaney')))
+        self.assertEqual(content_hash(self.ctx), content_hash(other))
+        other.add((person, rdfns.SCHEMA_ORG.familyName, rdflib.Literal('Heaney')))
+        self.assertNotEqual(content_hash(self.ctx), content_hash(other))
+
+    def test_tracking(self):
+        tracker = ChangeTracker(self.state_file)
+        source = content_hash(self.ctx)
+        self.assert_(tracker.changed(self.ctx.identifier, source))
+        tracker.record(self.ctx.identifier, source)
+        self.assertFalse(tracker.changed(self.ctx.identifier, source))
+        self.assertEqual(1, len(tracker.pending(self.graph, 'identify')))
+        tracker.mark_processed([self.ctx], 'identify')
+        tracker.save()
+
+        tracker = ChangeTracker(self.state_file)
+        self.assertEqual([], tracker.pending(self.graph, 'identify'))
+        self.assertEqual(1, len(tracker.pending(self.graph, 'smush')))
+        # full reprocessing ignores tracked state
+        self.assertEqual(1, len(ChangeTracker(self.state_file, full=True) \
+                                .pending(self.graph, 'identify')))
+
+        # modified contexts need to be processed by all stages again
+        self.ctx.add((self.ctx.identifier, rdfns.SCHEMA_ORG.name,
+                      rdflib.Literal('doc')))
+        self.assertEqual(1, len(tracker.pending(self.graph, 'identify')))
+
+
+class HarvestSessionTest(TestCase):
+
+    def test_stats(self):
+        session = HarvestSession(retries=0)
+        pool = Mock(scheme='http', host='example.com', port=80,
+                    num_connections=1, num_requests=3)
+        with patch.object(session.session, 'request') as mockrequest:
+            mockrequest.return_value = Mock(raw=Mock(_pool=pool))
+            for i in range(3):
+                session.get('http://example.com/%d' % i)
+            # default timeout should be passed to requests
+            args, kwargs = mockrequest.call_args
+            self.assertEqual(('GET', 'http://example.com/2'), args)
+            self.assertEqual(session.timeout, kwargs['timeout'])
+
+        stats = session.stats()
+        self.assertEqual(3, stats['requests'])
+        self.assertEqual(1, stats['opened'])
+        self.assertEqual(2, stats['reused'])
+        self.assert_('1 connection(s) opened, 2 reused' in session.report())
+
+    def test_server_error(self):
+        # local server that always responds with a server error
+        requests_received = []
+
+        class ErrorHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_GET(self):
+                requests_received.append(self.path)
+                self.send_response(503)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), ErrorHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            session = HarvestSession(retries=2, backoff_factor=0)
+            # once retries run out, the error response should be returned
+            # rather than raising an exception
+            response = session.get('http://127.0.0.1:%d/viaf/1/' % server.server_port)
+            self.assertEqual(503, response.status_code)
+            self.assertEqual(3, len(requests_received))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class ResponseCacheTest(TestCase):
+
+    url = 'http://example.com/viaf/1234/'
+    accept = {'accept': 'application/rdf+xml'}
+    last_modified = 'Mon, 06 Jan 2014 12:00:00 GMT'
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp(prefix='belfast-httpcache-')
+        self.cache = ResponseCache(self.cache_dir)
+        self.fetch = Mock()
+        self.fetch.return_value = Mock(status_code=200, content='<rdf/>',
+            headers={'last-modified': self.last_modified, 'etag': '"abc"'})
+
+    def tearDown(self):
+        shutil.rmtree(self.cache_dir)
+
+    def test_get(self):
+        # first request is fetched and stored
+        response = self.cache.get(self.fetch, self.url, headers=self.accept)
+        self.assertEqual(1, self.fetch.call_count)
+        self.assertEqual('<rdf/>', response.content)
+        # second request is served from the cache
+        response = self.cache.get(self.fetch, self.url, headers=self.accept)
+        self.assertEqual(1, self.fetch.call_count)
+        self.assertEqual('<rdf/>', response.content)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(self.last_modified, response.headers['Last-Modified'])
+        self.assertEqual({'hits': 1, 'misses': 1, 'revalidated': 0},
+                         self.cache.stats())
+
+        # different accept header is cached separately
+        self.cache.get(self.fetch, self.url, headers={'accept': 'text/html'})
+        self.assertEqual(2, self.fetch.call_count)
+
+        # conditional request matching cached validators
+        headers = {'if-modified-since': self.last_modified}
+        headers.update(self.accept)
+        response = self.cache.get(self.fetch, self.url, headers=headers)
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(2, self.fetch.call_count)
+
+        # no-cache bypasses cached content
+        headers = {'cache-control': 'no-cache'}
+        headers.update(self.accept)
+        self.cache.get(self.fetch, self.url, headers=headers)
+        self.assertEqual(3, self.fetch.call_count)
+
+    def test_revalidate(self):
+        self.cache.get(self.fetch, self.url, headers=self.accept)
+        self.cache.ttl = 0
+        self.fetch.return_value = Mock(status_code=304, headers={})
+        response = self.cache.get(self.fetch, self.url, headers=self.accept)
+        # stale entry should be revalidated with a conditional request
+        args, kwargs = self.fetch.call_args
+        self.assertEqual('"abc"', kwargs['headers']['if-none-match'])
+        self.assertEqual(self.last_modified, kwargs['headers']['if-modified-since'])
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('<rdf/>', response.content)
+        self.assertEqual(1, self.cache.stats()['revalidated'])
+
+    def test_offline(self):
+        self.cache.get(self.fetch, self.url, headers=self.accept)
+        self.cache.offline = True
+        self.cache.ttl = 0
+        # cached content is returned regardless of age
+        response = self.cache.get(self.fetch, self.url, headers=self.accept)
+        self.assertEqual('<rdf/>', response.content)
+        self.assertEqual(1, self.fetch.call_count)
+        self.assertRaises(ResponseNotCached, self.cache.get, self.fetch,
+                          'http://example.com/other/')
+
+    def test_evict(self):
+        self.cache.max_size = 10
+        self.cache.get(self.fetch, self.url)
+        # make the first entry older than the next one
+        entry_path = self.cache._entry_path(self.cache.key(self.url))
+        os.utime(entry_path, (time.time() - 60, time.time() - 60))
+        self.fetch.return_value = Mock(status_code=200, content='<other/>',
+                                       headers={})
+        self.cache.get(self.fetch, 'http://example.com/other/')
+        # least recently used entry is removed along with its content
+        self.assertEqual(None, self.cache.lookup(self.url))
+        self.assertNotEqual(None, self.cache.lookup('http://example.com/other/'))
+        self.assertEqual(1, len(os.listdir(self.cache.object_dir)))
+
+    def test_store_replace_size(self):
+        self.assertEqual(0, self.cache.size())
+        self.cache.store(self.url, None, self.fetch.return_value)
+        self.assertEqual(len('<rdf/>'), self.cache.size())
+        # replacing an entry should not count the old content
+        self.cache.store(self.url, None, Mock(status_code=200, content='<rdf></rdf>',
+                                              headers={}))
+        self.assertEqual(len('<rdf></rdf>'), self.cache.size())
+        self.cache._size = None
+        self.assertEqual(len('<rdf></rdf>'), self.cache.size())
+
+
+class AnnotateTest(TestCase):
+    fixtures = ['sites.json']
+
+    dbpedia = rdflib.Namespace('http://dbpedia.org/resource/')
+    people = ['Seamus_Heaney', 'Michael_Longley', 'Derek_Mahon', 'Unknown_Poet']
+
+    @override_settings(SITE_ID=2, DBPEDIA_BATCH_SIZE=2, DBPEDIA_WORKERS=2)
+    @patch.object(Annotate, 'viaf_people')
+    @patch.object(Annotate, 'places')
+    def test_dbpedia_people(self, mockplaces, mockviaf):
+        graph = rdflib.ConjunctiveGraph()
+        for i, name in enumerate(self.people):
+            person = rdflib.URIRef('http://example.com/people/%s/' % name)
+            viaf = rdflib.URIRef('http://viaf.org/viaf/%d' % i)
+            graph.add((person, rdflib.RDF.type, rdfns.SCHEMA_ORG.Person))
+            graph.add((person, rdflib.OWL.sameAs, viaf))
+            graph.add((viaf, rdflib.OWL.sameAs, self.dbpedia[name]))
+
+        endpoint = LocalSparqlEndpoint(dbpedia_fixture)
+        with patch('belfast.rdf.harvest.http_session', new=endpoint):
+            Annotate(graph)
+
+        # four uris in batches of two
+        self.assertEqual(2, len(endpoint.queries))
+        heaney = self.dbpedia.Seamus_Heaney
+        self.assertEqual(rdflib.URIRef('http://en.wikipedia.org/wiki/Seamus_Heaney'),
+                         graph.value(heaney, rdfns.FOAF.isPrimaryTopicOf))
+        # only english abstract should be added
+        abstracts = list(graph.objects(heaney, rdfns.DBPEDIA_OWL.abstract))
+        self.assertEqual(1, len(abstracts))
+        self.assertEqual('en', abstracts[0].language)
+        # other properties should not be added
+        self.assertEqual(None, graph.value(heaney, rdflib.RDFS.label))
+        mahon = self.dbpedia.Derek_Mahon
+        self.assertEqual(None, graph.value(mahon, rdfns.DBPEDIA_OWL.abstract))
+        self.assertNotEqual(None, graph.value(mahon, rdfns.FOAF.isPrimaryTopicOf))
+        # all added to the dbpedia context
+        self.assertEqual(5, len(graph.get_context('http://dbpedia.org/')))
+
+        # people with wikipedia urls already should not be queried again
+        endpoint.queries = []
+        with patch('belfast.rdf.harvest.http_session', new=endpoint):
+            Annotate(graph)
+        self.assertEqual(1, len(endpoint.queries))
+        self.assert_('Unknown_Poet' in endpoint.queries[0])
+        self.assert_('Seamus_Heaney' not in endpoint.queries[0])
+
+    @override_settings(SITE_ID=2)
+    @patch.object(Annotate, 'dbpedia_people')
+    @patch.object(Annotate, 'places')
+    def test_viaf_server_error(self, mockplaces, mockdbpedia):
+        graph = rdflib.ConjunctiveGraph()
+        for i, name in enumerate(self.people[:2]):
+            person = rdflib.URIRef('http://example.com/people/%s/' % name)
+            graph.add((person, rdflib.RDF.type, rdfns.SCHEMA_ORG.Person))
+            graph.add((person, rdflib.OWL.sameAs,
+                       rdflib.URIRef('http://viaf.org/viaf/%d' % i)))
+
+        # one request fails after retries, the other returns a server error;
+        # neither should stop the annotation
+        session = Mock()
+        session.get.side_effect = [requests.exceptions.RetryError('too many 503s'),
+                                   Mock(status_code=503)]
+        with patch('belfast.rdf.harvest.http_session', new=Mock(return_value=session)):
+            Annotate(graph)
+        self.assertEqual(2, session.get.call_count)
+        self.assertEqual(0, len(list(graph.triples((None, rdfns.FOAF.name, None)))))
+
+
+class BulkLoadTest(TestCase):
+
+    nquads = '''<http://example.com/a> <http://schema.org/name> "A" <http://example.com/ctx1> .
+# comment lines and blank lines are ignored
+
+<http://example.com/a> <http://schema.org/knows> _:b1 <http://example.com/ctx1> .
+_:b1 <http://schema.org/name> "B\u00E9"@en <http://example.com/ctx2> .
+<http://example.com/c> <http://schema.org/name> "C" .
+'''
+
+    def test_quad_reader(self):
+        quads = list(QuadReader().quads(StringIO(self.nquads)))
+        self.assertEqual(4, len(quads))
+        s, p, o, ctx = quads[0]
+        self.assertEqual(rdflib.URIRef('http://example.com/a'), s)
+        self.assertEqual(rdflib.Literal('A'), o)
+        self.assertEqual(rdflib.URIRef('http://example.com/ctx1'), ctx)
+        # blank node labels should be consistent within a file
+        self.assertEqual(quads[1][2], quads[2][0])
+        self.assertEqual(rdflib.Literal(u'B\xe9', lang='en'), quads[2][2])
+        # no context specified
+        self.assertEqual(None, quads[3][3])
+
+        default = rdflib.URIRef('http://example.com/default')
+        quads = list(QuadReader(default).quads(StringIO(self.nquads)))
+        self.assertEqual(default, quads[3][3])
+
+    def test_bulk_load(self):
+        graph = rdflib.ConjunctiveGraph()
+        progress = Mock()
+        loader = BulkLoader(graph, batch_size=3, progress=progress)
+        self.assertEqual(4, loader.load(QuadReader().quads(StringIO(self.nquads))))
+        self.assertEqual(4, len(graph))
+        # two batches
+        self.assertEqual(2, progress.call_count)
+        self.assertEqual(2, len(graph.get_context('http://example.com/ctx1')))
+        self.assertEqual(1, len(graph.get_context('http://example.com/ctx2')))
+        self.assertEqual(1, len(graph.default_context))
+
+    def test_write_quads(self):
+        graph = rdflib.ConjunctiveGraph()
+        BulkLoader(graph).load(QuadReader().quads(StringIO(self.nquads)))
+        out = StringIO()
+        self.assertEqual(4, write_quads(graph, out))
+
+        # round trip should preserve contexts and blank node references
+        copy = rdflib.ConjunctiveGraph()
+        BulkLoader(copy).load(QuadReader().quads(StringIO(out.getvalue())))
+        self.assertEqual(4, len(copy))
+        for ctx in graph.contexts():
+            self.assertEqual(len(ctx), len(copy.get_context(ctx.identifier)))
+        bnode = copy.value(rdflib.URIRef('http://example.com/a'),
+                           rdflib.URIRef('http://schema.org/knows'))
+        self.assertEqual(rdflib.Literal(u'B\xe9', lang='en'),
+                         copy.value(bnode, rdflib.URIRef('http://schema.org/name')))
+
+        # export selected contexts only
+        out = StringIO()
+        ctx = graph.get_context(rdflib.URIRef('http://example.com/ctx1'))
+        self.assertEqual(2, write_quads(graph, out, [ctx]))
+        self.assertEqual(2, len(out.getvalue().splitlines()))
+
+    def test_open_rdf(self):
+        tmpdir = tempfile.mkdtemp(prefix='belfast-bulk-')
+        try:
+            plain = os.path.join(tmpdir, 'data.nq')
+            with open(plain, 'w') as out:
+                out.write(self.nquads)
+            compressed = os.path.join(tmpdir, 'data.nq.gz')
+            out = gzip.open(compressed, 'wb')
+            out.write(self.nquads)
+            out.close()
+            self.assertEqual(self.nquads, open_rdf(plain).read())
+            self.assertEqual(self.nquads, open_rdf(compressed).read())
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class RunReportTest(TestCase):
+
+    def test_stage(self):
+        graph = rdflib.ConjunctiveGraph()
+        session = Mock(requests=0, cache=None)
+        report = RunReport(graph=graph, session=session)
+        with report.stage('harvest') as stage:
+            ctx = graph.get_context(rdflib.URIRef('http://example.com/doc/'))
+            ctx.add((ctx.identifier, rdfns.SCHEMA_ORG.name, rdflib.Literal('doc')))
+            list(graph.query('SELECT ?s WHERE { ?s ?p ?o }'))
+            session.requests = 2
+            stage['harvested'] = 1
+
+        info = report.stages[0]
+        self.assertEqual('harvest', info['name'])
+        self.assertEqual(1, info['harvested'])
+        self.assertEqual(2, info['requests'])
+        self.assertEqual(1, info['queries'])
+        self.assertEqual(0, info['triples_before'])
+        self.assertEqual(1, info['triples_after'])
+        self.assertEqual(1, info['contexts_after'])
+        self.assert_(info['elapsed'] >= 0)
+        self.assert_(info['peak_rss'] > 0)
+
+        # queries are only counted during a stage
+        list(graph.query('SELECT ?s WHERE { ?s ?p ?o }'))
+        self.assertEqual(1, report.queries.count)
+
+        # save, reload, and compare with another run
+        tmpdir = tempfile.mkdtemp(prefix='belfast-report-')
+        try:
+            filename = os.path.join(tmpdir, 'report.json')
+            report.save(filename)
+            previous = RunReport.load(filename)
+            self.assertEqual(1, len(previous['stages']))
+            current = RunReport(session=session)
+            with current.stage('harvest'):
+                pass
+            with current.stage('gexf'):
+                pass
+            comparison = compare_reports(previous, current.as_dict())
+            self.assertEqual(['harvest'], [name for name, fields in comparison])
+            self.assertEqual((2, 0), comparison[0][1]['requests'])
+        finally:
+            shutil.rmtree(tmpdir)
+        self.assertEqual(None, RunReport.load(filename))
+
+
+class StoreStatsTest(TestCase):
+
+    def setUp(self):
+        self.graph = InstrumentedGraph()
+        self.uri = rdflib.URIRef('http://example.com/people/heaney-seamus/')
+        self.graph.add((self.uri, rdfns.SCHEMA_ORG.name, rdflib.Literal('Heaney')))
+        self.graph.add((self.uri, rdflib.RDF.type, rdfns.SCHEMA_ORG.Person))
+
+    def tearDown(self):
+        stop_recording()
+
+    def test_recording(self):
+        # not recording: nothing to record calls on
+        self.graph.value(self.uri, rdfns.SCHEMA_ORG.name)
+
+        stats = start_recording()
+        self.assertEqual(rdflib.Literal('Heaney'),
+                         self.graph.value(self.uri, rdfns.SCHEMA_ORG.name))
+        self.assertEqual([rdfns.SCHEMA_ORG.Person],
+                         list(self.graph.objects(self.uri, rdflib.RDF.type)))
+        list(self.graph.subjects(rdflib.RDF.type, rdfns.SCHEMA_ORG.Person))
+        list(self.graph.triples((self.uri, None, None)))
+        # nested triples lookups are not counted separately
+        self.assertEqual({'value': 1, 'objects': 1, 'subjects': 1, 'triples': 1},
+                         dict(stats.calls))
+        self.graph.query('SELECT ?s WHERE { ?s ?p ?o }')
+        self.assertEqual(1, stats.calls['query'])
+        self.assertEqual(5, stats.total_calls)
+        self.assert_(stats.total_time >= 0)
+        self.assertEqual(stats, stop_recording())
+        self.assertEqual(None, stop_recording())
+
+    @override_settings(RDF_STORE_STATS=True, RDF_STORE_STATS_LOG=None)
+    def test_middleware(self):
+        from django.http import HttpResponse
+        from django.test.client import RequestFactory
+        request = RequestFactory().get('/people/heaney-seamus/')
+        middleware = StoreStatsMiddleware()
+        middleware.process_request(request)
+        middleware.process_view(request, percentile, [], {})
+        self.graph.value(self.uri, rdfns.SCHEMA_ORG.name)
+        self.graph.value(self.uri, rdflib.RDF.type)
+        response = middleware.process_response(request, HttpResponse('ok'))
+        self.assertEqual('2', response['X-RDF-Store-Calls'])
+        self.assert_(float(response['X-RDF-Store-Time']) >= 0)
+        self.assertEqual('belfast.rdf.storestats.percentile', request.rdf_store_view)
+
+    def test_view_report(self):
+        self.assertEqual(None, percentile([], 50))
+        self.assertEqual(2, percentile([4, 1, 3, 2], 50))
+        self.assertEqual(4, percentile([4, 1, 3, 2], 99))
+
+        records = [
+            {'view': 'profile', 'calls': {'value': n, 'triples': 1},
+             'time': {'value': 0.1}}
+            for n in range(1, 11)
+        ] + [{'view': 'list', 'calls': {'query': 1}, 'time': {'query': 0.5}}]
+        report = view_report(records)
+        self.assertEqual(10, report['profile']['requests'])
+        self.assertEqual(6, report['profile']['calls'][50])
+        self.assertEqual(9, report['profile']['value'][90])
+        self.assertEqual(0, report['profile']['query'][50])
+        self.assertEqual(1, report['list']['calls'][99])
@@ -1,9 +1,46 @@
 import os
 from django.conf import settings
 import rdflib
+import requests
 import shutil
 import sys
 
+
+class LocalSparqlEndpoint(object):
+    '''Stand-in for a remote SPARQL endpoint (e.g. DBpedia) for testing
+    code that queries one over HTTP.  Can be used in place of
+    :func:`belfast.rdf.httpsession.http_session`; GET requests are answered
+    by running the ``query`` parameter against a local RDF fixture and
+    returning SPARQL JSON results.
+
+    :param filename: RDF fixture file to load
+    :param format: format of the fixture file
+    '''
+
+    def __init__(self, filename, format='xml'):
+        self.graph = rdflib.Graph()
+        self.graph.parse(filename, format=format)
+        #: list of queries received, for inspection by tests
+        self.queries = []
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        query = params['query']
+        self.queries.append(query)
+        response = requests.Response()
+        response.url = url
+        try:
+            result = self.graph.query(query)
+            response.status_code = requests.codes.ok
+            response._content = result.serialize(format='json')
+        except Exception as err:
+            response.status_code = requests.codes.bad_request
+            response._content = str(err)
+        return response
+
+    def __call__(self):
+        # allow patching the session function directly with an endpoint
+        return self
+
 # when nose is available, define a plugin
 try:
 
@@ -178,6 +178,8 @@ if django_nose is not None:
     NOSE_ARGS = ['--with-existdbsetup', '--with-rdftestdatabase']
 
 
-# optional profiling middleware
-# if DEBUG:
-#     MIDDLEWARE_CLASSES.append('belfast.profiling.ProfileMiddleware')
+# optional profiling middleware (see belfast.profiling for configuration)
+# MIDDLEWARE_CLASSES.append('belfast.profiling.ProfileMiddleware')
+
+# optional RDF store access instrumentation (requires RDF_STORE_STATS)
+# MIDDLEWARE_CLASSES.append('belfast.rdf.storestats.StoreStatsMiddleware')
@@ -3,6 +3,8 @@ import rdflib
 import logging
 import os
 import re
+import threading
+import time
 from urlparse import urlparse
 
 from networkx.readwrite import gexf
@@ -97,13 +99,60 @@ def network_data_lastmodified():
     return datetime.fromtimestamp(newest)
 
 
-_NX_GRAPH = None
-
-def network_data():
-    global _NX_GRAPH
-    if _NX_GRAPH is None:
-        _NX_GRAPH = gexf.read_gexf(settings.GEXF_DATA['full'])
-    return _NX_GRAPH
+# loaded network data, by name: source file and modification time,
+# and networkx graph
+_NX_GRAPH = {}
+_nx_lock = threading.Lock()
+
+def _load_network(name):
+    # load or reload network data if the source file has changed
+    # import here to avoid a circular import
+    from belfast.network.snapshot import snapshot_path, NetworkSnapshot
+
+    gexf_file = settings.GEXF_DATA[name]
+    snapshot_file = snapshot_path(gexf_file)
+    path = gexf_file
+    if os.path.exists(snapshot_file):
+        # use the snapshot unless the gexf file has been updated since
+        # it was generated
+        snapshot_mtime = os.path.getmtime(snapshot_file)
+        if not os.path.exists(gexf_file) or \
+           snapshot_mtime >= os.path.getmtime(gexf_file):
+            path = snapshot_file
+    source = (path, os.path.getmtime(path))
+
+    loaded = _NX_GRAPH.get(name)
+    if loaded is None or loaded['source'] != source:
+        with _nx_lock:
+            loaded = _NX_GRAPH.get(name)
+            if loaded is None or loaded['source'] != source:
+                start = time.time()
+                if path == snapshot_file:
+                    snapshot = NetworkSnapshot(snapshot_file)
+                    try:
+                        graph = snapshot.to_networkx()
+                    finally:
+                        snapshot.close()
+                else:
+                    graph = gexf.read_gexf(gexf_file)
+                logger.debug('Loaded %s network from %s in %.02f sec',
+                             name, path, time.time() - start)
+                loaded = _NX_GRAPH[name] = {'source': source, 'graph': graph}
+    return loaded
+
+def network_data(name='full'):
+    '''Network graph data generated by the data prep process, as a
+    :mod:`networkx` graph.  Loaded from the binary network snapshot if
+    available and at least as new as the GEXF file configured in
+    **GEXF_DATA** (see :mod:`belfast.network.snapshot`), or else from
+    the GEXF file.  The graph is shared by threads, and reloaded
+    automatically when the file changes; make a copy before modifying
+    it.  Note that the snapshot only saves the time to parse the GEXF
+    file: each process still builds its own copy of the graph in memory.
+
+    :param name: name of the network in **GEXF_DATA** (default: full)
+    '''
+    return _load_network(name)['graph']
 
 
 class cached_property(object):